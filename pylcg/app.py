@@ -1,5 +1,6 @@
 import os
 from collections import OrderedDict
+from math import isnan
 
 import matplotlib
 # next line (.use()) *must* come before other matplotlib/tkinter imports, even if IDE complains.
@@ -10,8 +11,9 @@ from matplotlib import style
 from matplotlib import pyplot as plt
 
 import sys
+import queue
 from datetime import datetime, timezone
-from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 import tkinter as tk
 from tkinter import ttk
 import tkinter.messagebox as tkm
@@ -20,9 +22,11 @@ from tkinter import filedialog
 import pylcg.preferences as prefs
 import pylcg.plot as plotter
 import pylcg.web as web
-from pylcg.util import jd_now, MiniDataFrame, TargetList, get_star_ids_from_upload_file, \
+from pylcg.cache import make_star_key
+from pylcg.util import jd_now, MiniDataFrame, ArrayDataFrame, TargetList, get_star_ids_from_upload_file, \
     jd_from_any_date_string, jd_from_datetime_utc, datetime_utc_from_jd
 from pylcg.table_window import TableWindow
+from pylcg.obs_window import ObsWindow
 
 __author__ = "Eric Dose :: New Mexico Mira Project, Albuquerque"
 
@@ -34,7 +38,7 @@ __author__ = "Eric Dose :: New Mexico Mira Project, Albuquerque"
      Software built in python 3.6, executable includes the same.
          GUI built with python's built-in package tkinter.
          Web access built with python's built-in packages urllib and webbrowser.
-         Data cacheing built with python's built-in package functools.     
+         Data cacheing built with python's built-in package sqlite3 (on disk, for repeat targets).
          Plotting built with package matplotlib v 2.0.2.
          [pandas dependence removed Sept 7 2018 in favor of local 'MiniDataFrame' class.]
      This pylcg version: 0.3 BETA, November 13, 2018.
@@ -80,6 +84,7 @@ PYLCG_DEFAULT_PREFSET = prefs.Prefset(ordered_dict=OrderedDict([
     ('show errorbars', 'Yes'),
     ('plot in jd', 'Yes'),
     ('plot less-thans', 'No'),
+    ('plot level of detail', 'No'),
     ('time span days', '500'),
     ('bands', 'B,V,R,I,Vis'),
     ('last observer code', ''),
@@ -92,6 +97,13 @@ PLOT_SIZES = {'smaller': (9.60, 6.80),
               None: (9.60, 6.80)  # the default should preference retrieval fail.
               }
 
+PREFETCH_NEXT_TARGETS = 3  # number of targets after the current one to download in the background.
+PREFETCH_PREV_TARGETS = 1  # number of targets before the current one to download in the background.
+DOWNLOAD_WORKERS = 2  # so that a new star's download needn't wait for an abandoned one to finish.
+DOWNLOAD_POLL_MSEC = 50  # how often the GUI checks for finished background downloads.
+DOWNLOAD_STATUS_COLOR = '#c60'  # dark orange
+MAX_OBS_PER_PLOT = 200000  # most recent observations plotted; older pages of a long JD range not downloaded.
+
 MIN_JD_ALLOWABLE = jd_from_any_date_string('1/1/1800')  # earliest imaginable plot-start date.
 MAX_JD_ALLOWABLE = jd_now() + 1 * 365.25  # latest plot-start date: one year from now.
 
@@ -123,6 +135,14 @@ class ApplicationPylcg(tk.Tk):
         self.display_frame = self.subdivide_main_frame()
 
         self.target_list = TargetList()
+        self.prefetcher = web.Prefetcher()  # downloads upcoming targets while user views current plot.
+
+        # Plot downloads run on worker threads; results come back through this queue (see _poll_downloads).
+        self.download_executor = ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS)
+        self.download_results = queue.Queue()
+        self.download_request_id = 0  # identifies the one download whose result is still wanted.
+        self.download_future = None
+        self.download_polling = False
 
         # Assign plot's figure to plot_frame:
         self.build_entire_display_frame()
@@ -133,7 +153,7 @@ class ApplicationPylcg(tk.Tk):
         menubar = tk.Menu(self.main_frame)
 
         file_menu = tk.Menu(menubar, tearoff=0)
-        file_menu.add_command(label='Clear cache of downloaded data', command=web.get_vsx_obs.cache_clear)
+        file_menu.add_command(label='Clear cache of downloaded data', command=self._clear_obs_cache)
         file_menu.add_command(label='Exit', command=self._quit_window)
         menubar.add_cascade(label='File', menu=file_menu)
 
@@ -190,6 +210,7 @@ class ApplicationPylcg(tk.Tk):
         plot_frame, toolbar_frame = self.subdivide_display_frame(self.display_frame)
         self.canvas = FigureCanvasTkAgg(fig, plot_frame)  # will become FigureCanvasTk() in mpl 3.0?
         self.canvas.draw()  # for mpl 3.0
+        self.light_curve_plot = plotter.LightCurvePlot(self.canvas)  # redraws incrementally.
         # To change size, alternatively:
         #    fig.set_size_inches(new_width, new_height, forward=True); fig.set_dpi(100)
 
@@ -250,12 +271,17 @@ class ApplicationPylcg(tk.Tk):
         self.button_next.grid(row=3, column=1, sticky='w')
         self.button_prev.config(state='disabled')  # For now
         self.button_next.config(state='disabled')  # For now
+        self.download_status = tk.StringVar()  # non-empty only while downloading, or if data were limited.
+        download_status_label = tk.Label(star_labelframe, textvariable=self.download_status,
+                                         fg=DOWNLOAD_STATUS_COLOR)
+        download_status_label.grid(row=4, column=0, columnspan=2, sticky='ew')
 
         # Declare these variables early to avoid early errors when calling self._set_time_flags().
         self.grid_flag = tk.BooleanVar()
         self.errorbar_flag = tk.BooleanVar()
         self.plotjd_flag = tk.BooleanVar()
         self.lessthan_flag = tk.BooleanVar()
+        self.level_of_detail_flag = tk.BooleanVar()  # draw only each band's envelope per pixel column.
         self.observer_selected = tk.StringVar()
         self.highlight_flag = tk.BooleanVar()
         self.plot_only_flag = tk.BooleanVar()
@@ -395,6 +421,8 @@ class ApplicationPylcg(tk.Tk):
         self.errorbar_flag.set(self.current_preferences.get('show errorbars').lower() == 'yes')
         self.plotjd_flag.set(self.current_preferences.get('plot in jd').lower() == 'yes')
         self.lessthan_flag.set(self.current_preferences.get('plot less-thans').lower() == 'yes')
+        self.level_of_detail_flag.set((self.current_preferences.get('plot level of detail') or 'No').lower()
+                                      == 'yes')  # (absent from ini files written before this option)
         self.grid_flag.trace("w", lambda name, index,
                                          mode: self._entered_star(self.target_list.current()))
         self.errorbar_flag.trace("w", lambda name, index,
@@ -403,6 +431,8 @@ class ApplicationPylcg(tk.Tk):
                                              mode: self._entered_star(self.target_list.current()))
         self.lessthan_flag.trace("w", lambda name, index,
                                              mode: self._entered_star(self.target_list.current()))
+        self.level_of_detail_flag.trace("w", lambda name, index,
+                                                    mode: self._entered_star(self.target_list.current()))
         grid_checkbutton = ttk.Checkbutton(checkbutton_frame, text='grid    ', variable=self.grid_flag)
         errorbars_checkbutton = ttk.Checkbutton(checkbutton_frame, text='error bars    ',
                                                 variable=self.errorbar_flag)
@@ -410,15 +440,19 @@ class ApplicationPylcg(tk.Tk):
                                              variable=self.plotjd_flag)
         lessthan_checkbutton = ttk.Checkbutton(checkbutton_frame, text='less-thans',
                                                variable=self.lessthan_flag)
+        level_of_detail_checkbutton = ttk.Checkbutton(checkbutton_frame, text='level of detail (fast)',
+                                                      variable=self.level_of_detail_flag)
 
         grid_checkbutton.grid(row=0, column=0, sticky='w')
         plotjd_checkbutton.grid(row=0, column=1, sticky='w')
         errorbars_checkbutton.grid(row=1, column=0, sticky='w')
         lessthan_checkbutton.grid(row=1, column=1, sticky='w')
+        level_of_detail_checkbutton.grid(row=2, column=0, columnspan=2, sticky='w')
 
         self._set_time_flags(to_gray=True)  # ensure flags are set before leaving setup.
 
         self.mdf_obs_data = MiniDataFrame()  # declare here, as will be depended upon later.
+        self.obs_data_key = None  # (star key, jd_start, jd_end) of complete data in mdf_obs_data, else None.
 
         # ----- Button frame:
         button_frame = tk.Frame(control_subframe1, pady=8)  # pady was 12
@@ -433,14 +467,18 @@ class ApplicationPylcg(tk.Tk):
                                 command=lambda: web.webbrowse_vsx(self.star_entered.get()))
         button_webobs = ttk.Button(button_frame, text='Observations',
                                    command=lambda: web.webbrowse_webobs(self.star_entered.get()))
+        button_browseobs = ttk.Button(button_frame, text='Browse Downloaded Obs',
+                                      command=self._browseobs_window)
         button_preferences.grid(row=0, column=0, sticky='ew')
         button_listobservers.grid(row=1, column=0, sticky='ew')
         button_vsx.grid(row=0, column=1, sticky='ew')
         button_webobs.grid(row=1, column=1, sticky='ew')
+        button_browseobs.grid(row=2, column=0, columnspan=2, sticky='ew')
         button_preferences.state(['disabled'])
         button_listobservers.state(['!disabled'])  # enabled
         button_vsx.state(['!disabled'])  # enabled
         button_webobs.state(['!disabled'])  # enabled
+        button_browseobs.state(['!disabled'])  # enabled
 
         # Subframe quit_frame:
         quit_frame = tk.Frame(self.control_frame, height=60)
@@ -502,35 +540,45 @@ class ApplicationPylcg(tk.Tk):
         column_names = ['Obs code', 'Observations', 'Name', 'Affiliation', 'Country',
                         'By Band', 'Days since latest obs']
 
-        # Make summary dictionary by observer:
-        # key_iterator is a list of tuples, used only to identify each observation by observer:
-        key_iterator = zip(self.mdf_obs_data.dict['by'], self.mdf_obs_data.dict['obsName'],
-                           self.mdf_obs_data.dict['obsAffil'], self.mdf_obs_data.dict['obsCountry'])
-        counter_dict = Counter()
-        for key in key_iterator:
-            counter_dict[key] += 1
-        sorted_raw_data_list = counter_dict.most_common()
-        data_list = []  # data_list will be a list of strings to form List Observers table.
+        # All observers' counts, band counts and latest JDs come from one grouping of the rows in view
+        # (all rows, unless zoomed or panned), kept with the data so that reopening this window is free:
+        adf = ArrayDataFrame.from_minidataframe(self.mdf_obs_data)
+        jd_low, jd_high = self.light_curve_plot.zoomed_jd_limits()  # (None, None) if not zoomed or panned.
+        summary = adf.observer_summary(jd_low, jd_high)
+        jd_now_ = jd_now()
+        data_list = []  # rows of List Observers table; counts stay ints, so table sorts them as numbers.
 
         # Make table to display:
-        for row in sorted_raw_data_list:
-            obscode, name, affiliation, country = row[0]
-            count = row[1]
-            by_band_string = self._count_by_band(obscode)
-            days_since_latest_obs = self._days_since_latest_obs(obscode)
+        for i_observer in range(len(summary)):
+            by_band_string = self._format_counts_by_band(summary.counts_by_band(i_observer))
+            latest_jd = float(summary.latest_jds[i_observer])
+            days_since_latest_obs = None if isnan(latest_jd) else int(round(jd_now_ - latest_jd))  # (blank)
             # Make one line of table:
-            data_list.append((obscode, '{:9d}'.format(count), name, affiliation,
-                              country, by_band_string, '{:9d}'.format(days_since_latest_obs)))
+            data_list.append((summary.obscodes[i_observer], int(summary.counts[i_observer]),
+                              summary.names[i_observer], summary.affiliations[i_observer],
+                              summary.countries[i_observer], by_band_string, days_since_latest_obs))
 
         # Make window header & draw window:
         target_name = self.target_list.current()
-        total_obs_count = sum(counter_dict.values())
-        total_observer_count = len(counter_dict)
-        header_text = '\n'.join(['OBSERVATION COUNT by OBSERVER', '  Target: ' + target_name,
-                                 '  ' + str(total_obs_count) + ' obs from ' + str(total_observer_count) +
-                                 ' observers', '', '(click column header to sort)'])
+        total_obs_count = summary.n_obs()
+        total_observer_count = len(summary)
+        header_lines = ['OBSERVATION COUNT by OBSERVER', '  Target: ' + target_name,
+                        '  ' + str(total_obs_count) + ' obs from ' + str(total_observer_count) + ' observers']
+        if jd_low is not None:
+            header_lines.append('  in view: JD {:.3f} to {:.3f}'.format(jd_low, jd_high))
+        header_text = '\n'.join(header_lines + ['', '(click column header to sort, again to reverse)'])
         _ = TableWindow(self, window_label, header_text, column_names, data_list)  # (no ref needed)
 
+    def _browseobs_window(self):
+        """  Open a window browsing the current star's observations, one per row, as already downloaded
+             (no new download, unlike the 'Observations' button); JD filter starts at the range in view.
+        """
+        adf = ArrayDataFrame.from_minidataframe(self.mdf_obs_data)
+        if adf.dict is None:
+            return  # nothing downloaded yet.
+        jd_low, jd_high = self.light_curve_plot.jd_limits()
+        _ = ObsWindow(self, self.target_list.current(), adf, jd_low, jd_high)  # (no ref needed)
+
     def _quit_window(self):
         """  Popup window to ensure user really wants to quit. Stops entire program if user confirms.
         :return [None]
@@ -538,6 +586,9 @@ class ApplicationPylcg(tk.Tk):
         if tkm.askokcancel('Quit?', 'You really want to quit pylcg?'):
             self._get_current_preferences_from_control_frame()
             self.current_preferences.write_to_ini_file(PREFERENCES_INI_FULLPATH)
+            self.prefetcher.shutdown()
+            self._supersede_downloads()
+            self.download_executor.shutdown(wait=False)
             self.quit()     # stop mainloop
             self.destroy()  # prevent Fatal Python Error: PyEval_RestoreThread: NULL tstate
 
@@ -547,6 +598,8 @@ class ApplicationPylcg(tk.Tk):
         self.current_preferences.set('show errorbars', 'Yes' if self.errorbar_flag.get() else 'No')
         self.current_preferences.set('plot in jd', 'Yes' if self.plotjd_flag.get() else 'No')
         self.current_preferences.set('plot less-thans', 'Yes' if self.lessthan_flag.get() else 'No')
+        self.current_preferences.set('plot level of detail',
+                                     'Yes' if self.level_of_detail_flag.get() else 'No')
         self.current_preferences.set('time span days', str(self.days_to_plot.get()))
         self.current_preferences.set('bands', self._make_band_prefs_from_flags())
         self.current_preferences.set('last observer code', self.observer_selected.get().strip())
@@ -567,13 +620,9 @@ class ApplicationPylcg(tk.Tk):
         default_prefset = PYLCG_DEFAULT_PREFSET.copy()
         default_prefset.write_to_ini_file(PREFERENCES_INI_FULLPATH)
 
-    def _count_by_band(self, target_obscode):
-        obscodes_and_bands = zip(self.mdf_obs_data.column('by'), self.mdf_obs_data.column('band'))
-        bands_target_obscode = [band for (obscode, band) in obscodes_and_bands if obscode == target_obscode]
-        counter_dict = Counter()
-        for band in bands_target_obscode:
-            counter_dict[band] += 1
-        sorted_bands = counter_dict.most_common()
+    @staticmethod
+    def _format_counts_by_band(sorted_bands):
+        """  Return one observer's counts by band as table text, from ObserverSummary.counts_by_band(). """
         if len(sorted_bands) <= 0:
             by_band_string = '(no obs)'
         else:
@@ -581,13 +630,6 @@ class ApplicationPylcg(tk.Tk):
             by_band_string = ',    '.join(band_strings)
         return by_band_string
 
-    def _days_since_latest_obs(self, target_obscode):
-        obscodes_and_jds = zip(self.mdf_obs_data.column('by'), self.mdf_obs_data.column('JD'))
-        jds_target_obscode = [jd for (obscode, jd) in obscodes_and_jds if obscode == target_obscode]
-        jd_latest_obs = max(jds_target_obscode)
-        days_since_latest_obs = int(round(jd_now() - jd_latest_obs))
-        return days_since_latest_obs
-
     def _add_upload_star_ids(self):
         # tk.Tk.withdraw()
         self.update()
@@ -758,31 +800,146 @@ class ApplicationPylcg(tk.Tk):
 
     def _plot_star(self, star_id, must_get_obs_data=True):
         """  Assembles required data, and passes it to module plot.py, which does makes the plot.
+             Data not already cached are downloaded on a background thread, and the plot is drawn
+             when they arrive (see _poll_downloads()), so that the GUI never freezes during a download.
         :param star_id: ID of star to plot, read from GUI entry box.
-        :param must_get_obs_data: True iff new data needs to be downloaded from AAVSO.
+        :param must_get_obs_data: True iff new data may be needed (from cache or AAVSO); ignored if
+            this star's data for this JD range are already held.
         :return [None]
         """
         if star_id.strip() == '':
             return
-        bands_to_plot = self._get_bands_to_plot()  # ensure sync w/ checkbuttons; will be list of strings.
         jd_start, jd_end = self._get_plot_start_end()
         if (jd_start is None) or (jd_end is None):
             return
+        if must_get_obs_data and self.obs_data_key == (make_star_key(star_id), jd_start, jd_end):
+            must_get_obs_data = False  # e.g., only a plot option changed: re-plot the data already held.
         if must_get_obs_data:
-            self.mdf_obs_data = web.get_vsx_obs(star_id=star_id,
-                                                jd_start=jd_start, jd_end=jd_end,
-                                                num_days=jd_end - jd_start)
+            mdf_cached = web.get_cached_vsx_obs(star_id, jd_start, jd_end)
+            if mdf_cached is None:
+                self._start_download(star_id, jd_start, jd_end)
+                return  # plot will be drawn when data arrive (first part of a long JD range sooner).
+            self._supersede_downloads()  # any download still in flight is now unwanted.
+            self._accept_obs_data(web.newest_rows(mdf_cached, MAX_OBS_PER_PLOT), star_id, jd_start, jd_end)
+        self._draw_plot(star_id, jd_start, jd_end)
+
+    def _draw_plot(self, star_id, jd_start, jd_end):
+        """  Draw plot of star from already available data (self.mdf_obs_data) and current GUI settings. """
+        bands_to_plot = self._get_bands_to_plot()  # ensure sync w/ checkbuttons; will be list of strings.
         # TODO: connect obscode_to_highlight to a tk control variable.
-        plotter.redraw_plot(self.canvas, self.mdf_obs_data, star_id, bands_to_plot=bands_to_plot,
-                            show_errorbars=self.errorbar_flag.get(), show_grid=self.grid_flag.get(),
-                            show_lessthans=self.lessthan_flag.get(),
-                            observer_selected=self.observer_selected.get(),
-                            highlight_observer=self.highlight_flag.get(),
-                            plot_observer_only=self.plot_only_flag.get(),
-                            plot_in_jd=self.plotjd_flag.get(),
-                            jd_start=jd_start, jd_end=jd_end, num_days=jd_end - jd_start)
+        self.light_curve_plot.redraw(self.mdf_obs_data, star_id, bands_to_plot=bands_to_plot,
+                                     show_errorbars=self.errorbar_flag.get(), show_grid=self.grid_flag.get(),
+                                     show_lessthans=self.lessthan_flag.get(),
+                                     observer_selected=self.observer_selected.get(),
+                                     highlight_observer=self.highlight_flag.get(),
+                                     plot_observer_only=self.plot_only_flag.get(),
+                                     plot_in_jd=self.plotjd_flag.get(),
+                                     jd_start=jd_start, jd_end=jd_end, num_days=jd_end - jd_start,
+                                     level_of_detail=self.level_of_detail_flag.get())
         self.toolbar.update_with_app(self)
 
+    def _accept_obs_data(self, mdf, star_id, jd_start, jd_end):
+        """  Make mdf the current star's data, then start downloading targets Prev/Next will likely want. """
+        self.mdf_obs_data = ArrayDataFrame.from_minidataframe(mdf)  # indices built on it are kept with it.
+        self.obs_data_key = (make_star_key(star_id), jd_start, jd_end)
+        self.prefetcher.prefetch(self.target_list.neighbors(PREFETCH_NEXT_TARGETS, PREFETCH_PREV_TARGETS),
+                                 jd_start, jd_end)
+
+    def _clear_obs_cache(self):
+        """  Clear cache of downloaded data, and forget that data now plotted are current, so that the
+             next plot (even of this star and JD range) downloads afresh.
+        """
+        web.clear_obs_cache()
+        self.obs_data_key = None
+
+    def _supersede_downloads(self):
+        """  Make any download in flight unwanted: cancel it if not yet started, else ignore its result. """
+        self.download_request_id += 1
+        if self.download_future is not None:
+            self.download_future.cancel()  # no effect if already running; its result is then ignored.
+            self.download_future = None
+        self.download_status.set('')
+
+    def _start_download(self, star_id, jd_start, jd_end):
+        """  Start downloading a star's data on a worker thread; supersedes any earlier download. """
+        self._supersede_downloads()
+        self.download_status.set('downloading ' + star_id.strip() + ' ...')
+        self.download_future = self.download_executor.submit(self._download_in_background,
+                                                             self.download_request_id,
+                                                             star_id, jd_start, jd_end)
+        if not self.download_polling:
+            self.download_polling = True
+            self.after(DOWNLOAD_POLL_MSEC, self._poll_downloads)
+
+    def _download_in_background(self, request_id, star_id, jd_start, jd_end):
+        """  Runs on a worker thread, so must never touch tkinter; just queue the result for the GUI.
+             A long JD range arrives in pages, newest first, each queued (as partial data) to be plotted
+             at once; pages stop once the user moves on. A failed download, or cached data standing in
+             for one, is queued too, to be shown to the user by _poll_downloads().
+        """
+        fallback_errors = []  # error of download for which cached data stand in, if any.
+
+        def on_page(mdf_so_far):
+            self.download_results.put((request_id, star_id, jd_start, jd_end, mdf_so_far, None, None, False))
+            return request_id == self.download_request_id
+        try:
+            mdf = web.get_vsx_obs(star_id=star_id, max_num_obs=MAX_OBS_PER_PLOT, jd_start=jd_start,
+                                  jd_end=jd_end, num_days=jd_end - jd_start, on_page=on_page,
+                                  on_fallback=fallback_errors.append)
+            error = None
+        except Exception as e:  # surfaced to user on the GUI thread, by _poll_downloads().
+            mdf, error = None, e
+        fallback_error = fallback_errors[-1] if len(fallback_errors) >= 1 else None
+        self.download_results.put((request_id, star_id, jd_start, jd_end, mdf, error, fallback_error, True))
+
+    def _poll_downloads(self):
+        """  Runs on GUI thread via after(): draws plot when wanted download arrives (or part of it, if
+             more is to come), and tells user of any download failure; drops stale results.
+        """
+        latest_page = None  # newest partial data of wanted download, if its whole data not yet arrived.
+        while True:
+            try:
+                request_id, star_id, jd_start, jd_end, mdf, error, fallback_error, is_complete = \
+                    self.download_results.get_nowait()
+            except queue.Empty:
+                break
+            if request_id != self.download_request_id:
+                continue  # user has since moved on to another star or setting.
+            if not is_complete:
+                if mdf.dict is not None and mdf.len() >= 1:  # ("no obs found" is for complete data only)
+                    latest_page = (star_id, jd_start, jd_end, mdf)  # only the latest need be drawn.
+                continue
+            latest_page = None
+            self.download_future = None
+            if error is not None:
+                self.download_status.set('download of ' + star_id.strip() + ' failed')
+                tkm.showerror('Download failed', 'Could not download observations of ' + star_id.strip() +
+                              ' from AAVSO:\n\n' + str(error), parent=self)
+                continue
+            if fallback_error is not None:
+                self.download_status.set('AAVSO unavailable: plotting cached obs')
+            elif mdf.dict is not None and mdf.len() >= MAX_OBS_PER_PLOT:
+                self.download_status.set('plotting latest ' + str(MAX_OBS_PER_PLOT) + ' obs only')
+            else:
+                self.download_status.set('')
+            self._accept_obs_data(mdf, star_id, jd_start, jd_end)
+            self._draw_plot(star_id, jd_start, jd_end)
+            if fallback_error is not None:
+                tkm.showwarning('AAVSO unavailable', 'Could not reach AAVSO (' + str(fallback_error) +
+                                '), so cached observations of ' + star_id.strip() + ' are plotted;' +
+                                ' they may be out of date or incomplete.', parent=self)
+        if latest_page is not None:
+            star_id, jd_start, jd_end, mdf = latest_page
+            self.download_status.set('downloading ' + star_id.strip() + ' ... ' +
+                                     str(mdf.len()) + ' obs so far')
+            self.mdf_obs_data = ArrayDataFrame.from_minidataframe(mdf)  # (no prefetch until complete)
+            self.obs_data_key = None  # (incomplete, so never to be re-plotted in place of a download)
+            self._draw_plot(star_id, jd_start, jd_end)
+        if self.download_future is not None:
+            self.after(DOWNLOAD_POLL_MSEC, self._poll_downloads)
+        else:
+            self.download_polling = False
+
 
 class PylcgNavigationToolbar(NavigationToolbar2Tk):
     """
@@ -807,7 +964,8 @@ class PylcgNavigationToolbar(NavigationToolbar2Tk):
         self.update()
 
     def mouse_move(self, event):
-        """Overrides NavigationToolbar2 method, to nicely format cursor's x,y (next to toolbar)."""
+        """Overrides NavigationToolbar2 method, to nicely format cursor's x,y (next to toolbar),
+           and to identify the observation drawn under the cursor (its observer, band, mag and comment)."""
         import matplotlib.dates
         self._set_cursor(event)
 
@@ -835,15 +993,13 @@ class PylcgNavigationToolbar(NavigationToolbar2Tk):
             except (ValueError, OverflowError):
                 pass
             else:
-                artists = [a for a in event.inaxes.mouseover_set
-                           if a.contains(event) and a.get_visible()]
-
-                if artists:
-                    a = max(artists, key=lambda x: x.zorder)
-                    if a is not event.inaxes.patch:
-                        data = a.get_cursor_data(event)
-                        if data is not None:
-                            s += ' [%s]' % a.format_cursor_data(data)
+                # Identify observation under cursor from the plot's grid index of its points (rather than
+                #    hit-testing every artist), in constant time however many points are plotted:
+                if self.app_object is not None:
+                    light_curve_plot = self.app_object.light_curve_plot
+                    row = light_curve_plot.nearest_row(event.x, event.y)
+                    if row is not None:
+                        s += '      [ ' + plotter.describe_observation(light_curve_plot.adf, row) + ' ]'
 
                 if len(self.mode):
                     self.set_message('%s, %s' % (self.mode, s))
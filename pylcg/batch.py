@@ -0,0 +1,150 @@
+import os
+import re
+import sys
+import argparse
+
+import pylcg.util as util
+import pylcg.web as web
+from pylcg.render import RenderEngine, RENDER_IMAGE_FORMATS, RENDER_DEFAULT_BANDS
+
+__author__ = "Eric Dose :: New Mexico Mira Project, Albuquerque"
+
+"""  pylcg batch mode: renders the light curve of every target in an AAVSO upload file to image files,
+     without the GUI (matplotlib's Agg backend, so no display needed).
+     Downloads run concurrently (web.get_vsx_obs_many(), filling pylcg's observation cache), and plots
+     are rendered concurrently by render.RenderEngine's worker processes, each as soon as its data arrive.
+     USAGE (from command line):
+         python -m pylcg.batch my_upload_file.txt --output-dir plots --format pdf --days 1000
+     or from python:
+         results = pylcg.batch.render_upload_file('my_upload_file.txt', 'plots')
+"""
+
+BATCH_DEFAULT_NUM_DAYS = 500
+BATCH_DOWNLOAD_WORKERS = None  # concurrent downloads; None for as many as the connection pool allows.
+
+
+def render_upload_file(upload_fullpath, output_directory, image_format='png', plot_options=None,
+                       num_days=BATCH_DEFAULT_NUM_DAYS, render_workers=None,
+                       download_workers=BATCH_DOWNLOAD_WORKERS, progress=None):
+    """  Render light curves of all targets in an AAVSO upload file, one image file per target.
+    :param upload_fullpath: AAVSO upload file (Extended or Visual format) [string].
+    :param output_directory: directory to receive image files, made if absent [string].
+    :param image_format: 'png' or 'pdf' [string].
+    :param plot_options: keyword arguments for plot.redraw_plot() [dict]. If jd_end absent, uses now;
+        if jd_start absent, uses jd_end - num_days.
+    :param num_days: number of days to plot, if plot_options do not give jd_start [float].
+    :param render_workers: number of worker processes rendering plots, None for one per CPU core,
+        or 0 to render in this process [int].
+    :param download_workers: concurrent downloads, None for as many as connection pool allows [int].
+    :param progress: called with each result as it completes, e.g., print [callable, or None].
+    :return: one (star_id, image fullpath or None, message) per target, in upload file's order
+        [list of 3-tuples].
+    """
+    if image_format not in RENDER_IMAGE_FORMATS:
+        raise ValueError('image_format must be one of ' + ', '.join(RENDER_IMAGE_FORMATS))
+    star_ids = util.get_star_ids_from_upload_file(upload_fullpath)
+    os.makedirs(output_directory, exist_ok=True)
+    plot_options = dict() if plot_options is None else dict(plot_options)
+    if plot_options.get('jd_end') is None:
+        plot_options['jd_end'] = util.jd_now()
+    if plot_options.get('jd_start') is None:
+        plot_options['jd_start'] = plot_options['jd_end'] - num_days
+    jd_start, jd_end = plot_options['jd_start'], plot_options['jd_end']
+    fullpaths = make_image_fullpaths(star_ids, output_directory, image_format)
+
+    results = dict()  # star_id -> (star_id, fullpath or None, message).
+
+    def record(result):
+        results[result[0]] = result
+        if progress is not None:
+            progress(result)
+
+    with RenderEngine(render_workers) as engine:
+        for star_id, mdf, error in web.get_vsx_obs_many(star_ids, jd_start, jd_end,
+                                                        max_workers=download_workers):
+            if error is not None:
+                record((star_id, None, 'download failed: ' + str(error)))
+                continue
+            if not (web.minidataframe_has_data(mdf) and web.minidataframe_columns_appear_valid(mdf)):
+                record((star_id, None, 'no observations'))
+                continue
+            engine.submit(star_id, mdf, plot_options, fullpaths[star_id], image_format)
+            for star_id_rendered, fullpath, error in engine.results(block=False):
+                record((star_id_rendered, fullpath, 'ok' if error is None else error))
+        for star_id_rendered, fullpath, error in engine.results():
+            record((star_id_rendered, fullpath, 'ok' if error is None else error))
+    return [results[star_id] for star_id in star_ids]
+
+
+def make_image_fullpaths(star_ids, output_directory, image_format):
+    """  Return an image file fullpath for each star id, safe for any file system and unique among them.
+    :param star_ids: star IDs [list of strings].
+    :param output_directory: directory to hold image files [string].
+    :param image_format: file extension, e.g., 'png' [string].
+    :return: fullpath for each star id [dict of star_id:string].
+    """
+    fullpaths, used_names = dict(), set()
+    for star_id in star_ids:
+        name = re.sub(r'[^A-Za-z0-9+\-.]+', '_', star_id.strip()).strip('_.') or 'star'
+        unique_name, i = name, 1
+        while unique_name.lower() in used_names:  # (file systems may ignore case)
+            i += 1
+            unique_name = name + '_' + str(i)
+        used_names.add(unique_name.lower())
+        fullpaths[star_id] = os.path.join(output_directory, unique_name + '.' + image_format)
+    return fullpaths
+
+
+def main(argv=None):
+    """  Command-line entry: parse arguments, render all targets in upload file, print a line per target.
+    :param argv: command-line arguments, or None to use sys.argv [list of strings].
+    :return: process exit status: 0 if every target rendered, else 1 [int].
+    """
+    parser = argparse.ArgumentParser(prog='python -m pylcg.batch',
+                                     description='Render light curves of targets in an AAVSO upload file.')
+    parser.add_argument('upload_file', help='AAVSO upload file (Extended or Visual format)')
+    parser.add_argument('--output-dir', default='pylcg_plots', help='directory for image files')
+    parser.add_argument('--format', default='png', choices=RENDER_IMAGE_FORMATS, help='image file format')
+    parser.add_argument('--days', type=float, default=BATCH_DEFAULT_NUM_DAYS, help='number of days to plot')
+    parser.add_argument('--start', default=None, help='plot start, as JD or calendar date')
+    parser.add_argument('--end', default=None, help='plot end, as JD or calendar date (default: now)')
+    parser.add_argument('--bands', default=','.join(RENDER_DEFAULT_BANDS), help='comma-separated bands')
+    parser.add_argument('--calendar', action='store_true', help='plot calendar dates rather than JD')
+    parser.add_argument('--no-errorbars', action='store_true', help='omit errorbars')
+    parser.add_argument('--no-grid', action='store_true', help='omit grid')
+    parser.add_argument('--lessthans', action='store_true', help='include less-than observations')
+    parser.add_argument('--observer', default='', help='observer code to highlight')
+    parser.add_argument('--observer-only', action='store_true', help="plot only the observer's points")
+    parser.add_argument('--workers', type=int, default=None,
+                        help='render processes (default: one per CPU core; 0: no worker processes)')
+    parser.add_argument('--download-workers', type=int, default=BATCH_DOWNLOAD_WORKERS,
+                        help='concurrent downloads (default: as many as the connection pool allows)')
+    args = parser.parse_args(argv)
+
+    plot_options = {'bands_to_plot': [band.strip() for band in args.bands.split(',') if band.strip() != ''],
+                    'show_errorbars': not args.no_errorbars, 'show_grid': not args.no_grid,
+                    'show_lessthans': args.lessthans, 'observer_selected': args.observer,
+                    'highlight_observer': args.observer.strip() != '',
+                    'plot_observer_only': args.observer_only, 'plot_in_jd': not args.calendar}
+    for key, date_string in [('jd_start', args.start), ('jd_end', args.end)]:
+        if date_string is not None:
+            plot_options[key] = util.jd_from_any_date_string(date_string)
+            if plot_options[key] is None:
+                parser.error('cannot read date: ' + date_string)
+
+    star_ids = util.get_star_ids_from_upload_file(args.upload_file)
+    if len(star_ids) == 0:
+        print('No targets found in ' + args.upload_file)
+        return 1
+    results = render_upload_file(args.upload_file, args.output_dir, args.format, plot_options,
+                                 num_days=args.days, render_workers=args.workers,
+                                 download_workers=args.download_workers,
+                                 progress=lambda result: print('{:<20s} {}'.format(result[0], result[2])))
+    n_ok = sum(1 for (_, fullpath, _) in results if fullpath is not None)
+    print(str(n_ok) + ' of ' + str(len(results)) + ' light curves written to ' + args.output_dir)
+    return 0 if n_ok == len(results) else 1
+
+
+# Python module entry here:
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,387 @@
+import os
+import sys
+import json
+import sqlite3
+import threading
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+
+import pylcg.util as util
+
+__author__ = "Eric Dose :: New Mexico Mira Project, Albuquerque"
+
+"""  cache.py
+     Persistent on-disk store of downloaded AAVSO observations, so that a restart of pylcg can serve
+     repeat targets from local disk rather than downloading them again.
+     One SQLite file holds one entry per star: the star's observations (compressed), plus the list of
+     JD intervals those observations cover and when each interval was downloaded. So a later request
+     for the same star needs to download only the JD ranges not yet covered (usually the last few hours).
+     Each download's validators (ETag, Last-Modified, content hash) are kept too, so that a stale JD range
+     can be re-validated with a conditional request, costing a tiny round trip if the data are unchanged.
+     Built on python's built-in packages sqlite3, json and zlib.
+"""
+
+OBS_CACHE_FILENAME = 'obs_cache.sqlite'
+OBS_CACHE_SCHEMA_VERSION = 5  # on mismatch, the cache file's tables are simply dropped and rebuilt.
+OBS_CACHE_MAX_BYTES = 256 * 1024 * 1024  # total size of compressed payloads before eviction begins.
+OBS_CACHE_TTL_DAYS = 7.0  # age (in days) beyond which a downloaded JD interval is downloaded again.
+OBS_CACHE_REVALIDATE_DAYS = 30.0  # days beyond TTL that stale rows are kept, for cheap re-validation.
+OBS_CACHE_MEMORY_STARS = 16  # number of most recently used stars also held in memory.
+MIN_GAP_DAYS = 1.0 / (24 * 60)  # uncovered JD ranges shorter than one minute are not worth a download.
+SQLITE_TIMEOUT_SECONDS = 10
+OBS_CACHE_APP_NAME = 'pylcg'  # subdirectory of the user's cache directory, see default_cache_directory().
+
+
+class ObsCache:
+    """  Persistent store of observation data, one entry per star, held in one SQLite file.
+         Each entry holds the star's observations and the JD intervals they cover. An interval older
+         than ttl_days no longer counts as covered, to be downloaded again (or re-validated, see refresh()).
+         Once the total payload size exceeds max_bytes, least-recently used entries are evicted first.
+    """
+    def __init__(self, directory, max_bytes=OBS_CACHE_MAX_BYTES, ttl_days=OBS_CACHE_TTL_DAYS):
+        """  Constructor. Creates directory and SQLite file if they don't already exist.
+        :param directory: directory to hold the cache's SQLite file [string].
+        :param max_bytes: total payload size above which entries are evicted [int].
+        :param ttl_days: age in days beyond which a downloaded JD interval is no longer served [float].
+        """
+        self.directory = directory
+        self.fullpath = os.path.join(directory, OBS_CACHE_FILENAME)
+        self.max_bytes = max_bytes
+        self.ttl_days = ttl_days
+        self._lock = threading.RLock()  # one reader/writer at a time, across this process's threads.
+        self._memory = OrderedDict()  # star_key -> (intervals, mdf), most recently used last.
+        self._last_used = dict()  # star_key -> JD last read, not yet written to disk (see close()).
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as connection:
+            if connection.execute('PRAGMA user_version').fetchone()[0] != OBS_CACHE_SCHEMA_VERSION:
+                connection.execute('DROP TABLE IF EXISTS observations')
+                connection.execute('DROP TABLE IF EXISTS validators')
+                connection.execute('PRAGMA user_version = ' + str(OBS_CACHE_SCHEMA_VERSION))
+            connection.execute('CREATE TABLE IF NOT EXISTS observations ('
+                               'star_key TEXT PRIMARY KEY, '
+                               'intervals TEXT, newest_fetched_jd REAL, last_used_jd REAL, '
+                               'nbytes INTEGER, payload BLOB)')
+            connection.execute('CREATE TABLE IF NOT EXISTS validators ('
+                               'star_key TEXT, jd_start REAL, jd_end REAL, '
+                               'etag TEXT, last_modified TEXT, content_hash TEXT, '
+                               'PRIMARY KEY (star_key, jd_start, jd_end))')
+
+    @contextmanager
+    def _connect(self):
+        # A new connection per operation keeps this object safe to share between threads.
+        connection = sqlite3.connect(self.fullpath, timeout=SQLITE_TIMEOUT_SECONDS)
+        try:
+            with connection:  # commits on success, rolls back on exception.
+                yield connection
+        finally:
+            connection.close()
+
+    def get(self, star_id, jd_start, jd_end, partial=False):
+        """  Return cached observations for this star and JD range, or None if range not fully covered.
+        :param star_id: the STAR id [string].
+        :param jd_start: earliest JD wanted [float].
+        :param jd_end: latest JD wanted [float].
+        :param partial: True to return whatever rows are held in range, even if stale or incomplete
+            (e.g., when the server cannot be reached) [boolean].
+        :return: observations within jd_start to jd_end, or None on cache miss [ArrayDataFrame object].
+        """
+        with self._lock:
+            entry = self._load(make_star_key(star_id))
+        if entry is None:
+            return None
+        intervals, mdf = entry
+        if not partial and len(uncovered_ranges(intervals, jd_start, jd_end)) >= 1:
+            return None
+        jds = mdf.array('JD')
+        return mdf.row_subset((jds >= jd_start) & (jds <= jd_end))
+
+    def missing_ranges(self, star_id, jd_start, jd_end):
+        """  Return the JD ranges within jd_start to jd_end that this cache cannot (freshly) serve.
+        :param star_id: the STAR id [string].
+        :param jd_start: earliest JD wanted [float].
+        :param jd_end: latest JD wanted [float].
+        :return: JD ranges to download, in increasing JD order [list of 2-tuples of floats].
+        """
+        with self._lock:
+            entry = self._load(make_star_key(star_id))
+        if entry is None:
+            return [(jd_start, jd_end)]
+        return uncovered_ranges(entry[0], jd_start, jd_end)
+
+    def add(self, star_id, jd_start, jd_end, mdf, validators=None):
+        """  Merge newly downloaded observations for one JD range into this star's entry.
+             Cached rows within jd_start to jd_end are replaced by mdf's rows, so overlaps never duplicate.
+        :param star_id: the STAR id [string].
+        :param jd_start: earliest JD requested in the download that produced mdf [float].
+        :param jd_end: latest JD requested in the download that produced mdf [float].
+        :param mdf: observations with JD already converted to floats, may have no rows [MiniDataFrame].
+        :param validators: the download's 'etag', 'last_modified' and/or 'content_hash', to allow later
+            re-validation of exactly this JD range [dict of str:str, or None].
+        :return: [None]
+        """
+        star_key = make_star_key(star_id)
+        jd_now = util.jd_now()
+        with self._lock:
+            entry = self._load(star_key)
+            if entry is None:
+                intervals, merged_mdf = [], mdf
+            else:
+                intervals, cached_mdf = entry
+                merged_mdf = merge_minidataframes(cached_mdf, mdf, jd_start, jd_end)
+            intervals = add_interval(intervals, jd_start, jd_end, jd_now)
+            self._store(star_key, intervals, merged_mdf, jd_now)
+            with self._connect() as connection:
+                # Validators of overlapping ranges no longer describe the rows cached for them:
+                connection.execute('DELETE FROM validators '
+                                   'WHERE star_key = ? AND jd_start < ? AND jd_end > ?',
+                                   (star_key, jd_end, jd_start))
+                if validators:
+                    connection.execute('INSERT OR REPLACE INTO validators VALUES (?, ?, ?, ?, ?, ?)',
+                                       (star_key, jd_start, jd_end, validators.get('etag'),
+                                        validators.get('last_modified'), validators.get('content_hash')))
+
+    def validators(self, star_id, jd_start, jd_end):
+        """  Return validators stored with the download of exactly this JD range, if its rows are still
+             cached.
+        :param star_id: the STAR id [string].
+        :param jd_start: earliest JD of range [float].
+        :param jd_end: latest JD of range [float].
+        :return: any of 'etag', 'last_modified', 'content_hash'; empty if none [dict of str:str].
+        """
+        with self._lock, self._connect() as connection:
+            row = connection.execute('SELECT etag, last_modified, content_hash FROM validators '
+                                     'WHERE star_key = ? AND jd_start = ? AND jd_end = ?',
+                                     (make_star_key(star_id), jd_start, jd_end)).fetchone()
+        if row is None:
+            return dict()
+        return dict((name, value) for (name, value) in zip(['etag', 'last_modified', 'content_hash'], row)
+                    if value is not None)
+
+    def validated_ranges(self, star_id, jd_start, jd_end):
+        """  Return the JD ranges, overlapping jd_start to jd_end, of downloads whose validators are stored
+             (so that each can be re-validated exactly, see refresh()), whatever JD range is now wanted.
+        :param star_id: the STAR id [string].
+        :param jd_start: earliest JD wanted [float].
+        :param jd_end: latest JD wanted [float].
+        :return: JD ranges of stored validators, disjoint, in increasing JD order
+            [list of 2-tuples of floats].
+        """
+        with self._lock, self._connect() as connection:
+            rows = connection.execute('SELECT jd_start, jd_end FROM validators '
+                                      'WHERE star_key = ? AND jd_start < ? AND jd_end > ? ORDER BY jd_start',
+                                      (make_star_key(star_id), jd_end, jd_start)).fetchall()
+        return [(range_start, range_end) for (range_start, range_end) in rows]
+
+    def refresh(self, star_id, jd_start, jd_end):
+        """  Mark this JD range freshly downloaded, its cached rows unchanged, as when the server confirms
+             (e.g., by HTTP 304 Not Modified) that data are unchanged since the download whose
+             validators were stored for exactly this range.
+        :param star_id: the STAR id [string].
+        :param jd_start: earliest JD of range [float].
+        :param jd_end: latest JD of range [float].
+        :return: True iff done; False if no such range's rows are cached, so must be downloaded [boolean].
+        """
+        star_key = make_star_key(star_id)
+        jd_now = util.jd_now()
+        with self._lock:
+            if len(self.validators(star_id, jd_start, jd_end)) == 0:
+                return False
+            entry = self._load(star_key)
+            if entry is None:
+                return False
+            intervals, mdf = entry
+            intervals = add_interval(intervals, jd_start, jd_end, jd_now)
+            with self._connect() as connection:  # payload unchanged, so not rewritten.
+                connection.execute('UPDATE observations SET intervals = ?, newest_fetched_jd = ?, '
+                                   'last_used_jd = ? WHERE star_key = ?',
+                                   (json.dumps(intervals), jd_now, jd_now, star_key))
+            self._remember(star_key, intervals, mdf)
+        return True
+
+    def _load(self, star_key):
+        """  Return (intervals, mdf) for star_key from memory or disk, with stale intervals already dropped,
+             or None if nothing is cached. Rows of stale intervals are kept (served only as a
+             fallback, by get(partial=True)), so that they can be re-validated by refresh().
+             Caller must hold self._lock.
+        """
+        if star_key in self._memory:
+            self._memory.move_to_end(star_key)
+            intervals, mdf = self._memory[star_key]
+        else:
+            with self._connect() as connection:
+                row = connection.execute('SELECT intervals, payload FROM observations '
+                                         'WHERE star_key = ?', (star_key,)).fetchone()
+            if row is None:
+                return None
+            mdf = util.ArrayDataFrame.from_buffer(zlib.decompress(row[1]))
+            self._remember(star_key, json.loads(row[0]), mdf)
+            intervals, mdf = self._memory[star_key]
+        jd_now = util.jd_now()
+        fresh_intervals = [i for i in intervals if jd_now - i[2] <= self.ttl_days]
+        if len(fresh_intervals) < len(intervals):
+            self._remember(star_key, fresh_intervals, mdf)
+            intervals = fresh_intervals
+        self._last_used[star_key] = jd_now  # written before eviction or by close(), so reads never write.
+        return intervals, mdf
+
+    def _store(self, star_key, intervals, mdf, jd_now):
+        """  Write one star's entry to disk and memory, then evict. Caller must hold self._lock. """
+        payload = zlib.compress(util.ArrayDataFrame.from_minidataframe(mdf).to_buffer())
+        newest_fetched_jd = max(fetched_jd for (_, _, fetched_jd) in intervals)
+        with self._connect() as connection:
+            connection.execute('INSERT OR REPLACE INTO observations VALUES (?, ?, ?, ?, ?, ?)',
+                               (star_key, json.dumps(intervals), newest_fetched_jd, jd_now,
+                                len(payload), payload))
+            self._remember(star_key, intervals, mdf)
+            self._evict(connection, jd_now)
+
+    def _remember(self, star_key, intervals, mdf):
+        """  Hold one star's entry in memory (as an ArrayDataFrame, for fast subsetting),
+             dropping least-recently used stars beyond the limit. """
+        self._memory[star_key] = (intervals, util.ArrayDataFrame.from_minidataframe(mdf))
+        self._memory.move_to_end(star_key)
+        while len(self._memory) > OBS_CACHE_MEMORY_STARS:
+            self._memory.popitem(last=False)
+
+    def _evict(self, connection, jd_now):
+        """  Delete entries stale too long to re-validate, then least-recently used entries until
+             total size <= max_bytes. """
+        self._write_last_used(connection)  # so that recency of reads counts.
+        jd_stale = jd_now - self.ttl_days - OBS_CACHE_REVALIDATE_DAYS
+        evicted_keys = [row[0] for row in connection.execute('SELECT star_key FROM observations '
+                                                             'WHERE newest_fetched_jd < ?', (jd_stale,))]
+        connection.execute('DELETE FROM observations WHERE newest_fetched_jd < ?', (jd_stale,))
+        total_bytes = connection.execute('SELECT COALESCE(SUM(nbytes), 0) FROM observations').fetchone()[0]
+        if total_bytes > self.max_bytes:
+            rows = connection.execute('SELECT star_key, nbytes FROM observations '
+                                      'ORDER BY last_used_jd ASC').fetchall()
+            for star_key, nbytes in rows:
+                if total_bytes <= self.max_bytes:
+                    break
+                connection.execute('DELETE FROM observations WHERE star_key = ?', (star_key,))
+                evicted_keys.append(star_key)
+                total_bytes -= nbytes
+        for star_key in evicted_keys:
+            self._memory.pop(star_key, None)
+            connection.execute('DELETE FROM validators WHERE star_key = ?', (star_key,))
+
+    def _write_last_used(self, connection):
+        """  Write to disk when each star was last read, as held in memory. Caller must hold self._lock. """
+        connection.executemany('UPDATE observations SET last_used_jd = ? WHERE star_key = ?',
+                               [(jd_used, star_key) for (star_key, jd_used) in self._last_used.items()])
+        self._last_used.clear()
+
+    def close(self):
+        """  Write to disk when each star was last read, so that later sessions evict by true recency
+             even if this session only read. Call at exit; the cache remains usable afterward. """
+        with self._lock:
+            if len(self._last_used) >= 1:
+                with self._connect() as connection:
+                    self._write_last_used(connection)
+
+    def total_bytes(self):
+        """  Return total size of all cached (compressed) payloads [int]. """
+        with self._connect() as connection:
+            return connection.execute('SELECT COALESCE(SUM(nbytes), 0) FROM observations').fetchone()[0]
+
+    def clear(self):
+        """  Remove all entries from the cache. """
+        with self._lock, self._connect() as connection:
+            connection.execute('DELETE FROM observations')
+            connection.execute('DELETE FROM validators')
+            self._memory.clear()
+            self._last_used.clear()
+
+
+def default_cache_directory():
+    """  Return this user's directory for pylcg's cache, in the platform's usual place for per-user caches
+         (rather than within the installed package, which may be shared or read-only).
+    :return: directory fullpath, not necessarily yet existing [string].
+    """
+    if sys.platform.startswith('win'):
+        base_directory = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~\\AppData\\Local')
+    elif sys.platform == 'darwin':
+        base_directory = os.path.expanduser('~/Library/Caches')
+    else:
+        base_directory = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base_directory, OBS_CACHE_APP_NAME)
+
+
+def make_star_key(star_id):
+    """  Make the cache key for a star id (AAVSO star ids are not case-sensitive).
+    :param star_id: the STAR id [string].
+    :return: normalized key [string].
+    """
+    return ' '.join(star_id.split()).upper()
+
+
+def uncovered_ranges(intervals, jd_start, jd_end):
+    """  Return parts of JD range jd_start to jd_end not covered by any interval.
+    :param intervals: covered JD intervals, disjoint [list of [jd_start, jd_end, fetched_jd] lists].
+    :param jd_start: earliest JD wanted [float].
+    :param jd_end: latest JD wanted [float].
+    :return: uncovered JD ranges at least MIN_GAP_DAYS long, in increasing JD order [list of 2-tuples].
+    """
+    gaps = []
+    jd_covered_through = jd_start
+    for (start, end, _) in sorted(intervals):
+        if end < jd_covered_through:
+            continue
+        if start > jd_end:
+            break
+        if start - jd_covered_through >= MIN_GAP_DAYS:
+            gaps.append((jd_covered_through, start))
+        jd_covered_through = max(jd_covered_through, end)
+    if jd_end - jd_covered_through >= MIN_GAP_DAYS:
+        gaps.append((jd_covered_through, jd_end))
+    return gaps
+
+
+def add_interval(intervals, jd_start, jd_end, fetched_jd):
+    """  Return intervals with a newly downloaded interval added (existing intervals trimmed to make room),
+         and with touching intervals coalesced (keeping the older fetched_jd, to be conservative).
+    :param intervals: covered JD intervals, disjoint [list of [jd_start, jd_end, fetched_jd] lists].
+    :param jd_start: earliest JD of new interval [float].
+    :param jd_end: latest JD of new interval [float].
+    :param fetched_jd: JD at which new interval was downloaded [float].
+    :return: new list of disjoint intervals, in increasing JD order [list of 3-element lists].
+    """
+    trimmed = []
+    for (start, end, fetched) in intervals:
+        if start < jd_start:
+            trimmed.append([start, min(end, jd_start), fetched])
+        if end > jd_end:
+            trimmed.append([max(start, jd_end), end, fetched])
+    trimmed.append([jd_start, jd_end, fetched_jd])
+    coalesced = []
+    for (start, end, fetched) in sorted(trimmed):
+        if len(coalesced) >= 1 and start - coalesced[-1][1] < MIN_GAP_DAYS:
+            coalesced[-1][1] = max(coalesced[-1][1], end)
+            coalesced[-1][2] = min(coalesced[-1][2], fetched)
+        else:
+            coalesced.append([start, end, fetched])
+    return coalesced
+
+
+def merge_minidataframes(cached_mdf, new_mdf, jd_start, jd_end):
+    """  Return cached rows outside jd_start to jd_end plus all of new_mdf's rows, sorted by JD.
+    :param cached_mdf: observations already cached [MiniDataFrame object].
+    :param new_mdf: observations newly downloaded for jd_start to jd_end [MiniDataFrame object].
+    :param jd_start: earliest JD of new download [float].
+    :param jd_end: latest JD of new download [float].
+    :return: merged observations [ArrayDataFrame object].
+    """
+    cached_adf = util.ArrayDataFrame.from_minidataframe(cached_mdf)
+    new_adf = util.ArrayDataFrame.from_minidataframe(new_mdf)
+    cached_jds = cached_adf.array('JD')
+    kept_adf = cached_adf.row_subset(~((cached_jds >= jd_start) & (cached_jds <= jd_end)))
+    if new_adf.dict is None or new_adf.len() == 0:
+        return kept_adf
+    if kept_adf.len() == 0:
+        return new_adf
+    merged_adf = util.ArrayDataFrame.concatenate(kept_adf, new_adf)
+    return merged_adf.take(np.argsort(merged_adf.array('JD'), kind='stable'))
+
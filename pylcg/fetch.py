@@ -0,0 +1,649 @@
+import ssl
+import zlib
+import time
+import random
+import hashlib
+import asyncio
+import threading
+import http.client
+from collections import Counter, deque
+from contextlib import contextmanager, asynccontextmanager
+from urllib.parse import urlsplit
+
+__author__ = "Eric Dose :: New Mexico Mira Project, Albuquerque"
+
+"""  HTTP plumbing for downloads: a bounded pool of persistent (keep-alive) connections, shared by all
+     threads, and a per-host rate limiter so that many concurrent downloads stay polite to the server.
+     Also a minimal asyncio HTTP/1.1 client (arequest()), so that an event loop can overlap many
+     downloads without a thread per request.
+     Both ask for gzip-compressed bodies; LineDecoder decompresses them as they stream in.
+     Both accept 304 Not Modified, for conditional requests (see conditional_headers()).
+     For unreliable networks: separate connect and read timeouts; call_with_retries() (and its coroutine
+     counterpart) retrying transient failures with exponential backoff; CircuitBreaker, to stop calling
+     a failing service for a while; FetchMetrics, recording each request's latency and any failure.
+"""
+
+MAX_CONNECTIONS_PER_HOST = 4  # also bounds concurrent requests to any one host.
+CONNECT_TIMEOUT_SECONDS = 10  # allowed to establish a connection.
+READ_TIMEOUT_SECONDS = 30  # allowed for each socket read, once connected (VSX can be slow to begin).
+MIN_REQUEST_INTERVAL_SECONDS = 0.25  # per host, i.e., at most 4 requests begun per second.
+READ_BYTES = 65536  # bytes read from a response at a time.
+MAX_DRAIN_BYTES = 65536  # unread response beyond this closes its connection rather than being read.
+USER_AGENT = 'pylcg (https://www.github.com/edose/pylcg)'
+ACCEPT_ENCODING = 'gzip'  # VSX text compresses ~10x; LineDecoder decompresses as it streams in.
+OK_STATUSES = [200, 304]  # 304 Not Modified answers a conditional request; any other status raises.
+RETRY_STATUSES = [429, 500, 502, 503, 504]  # HTTP errors worth retrying; other failing statuses are final.
+PERMANENT_ERRORS = (ssl.SSLCertVerificationError,)  # OSErrors that repeating the call will not cure.
+RETRY_MAX_ATTEMPTS = 3  # attempts in all, including the first.
+RETRY_BASE_DELAY_SECONDS = 1.0  # backoff before first retry; doubles for each later retry.
+RETRY_MAX_DELAY_SECONDS = 8.0
+CIRCUIT_FAILURE_THRESHOLD = 5  # consecutive transient failures that open a circuit.
+CIRCUIT_RESET_SECONDS = 60.0  # an open circuit rejects calls this long, then allows a trial call.
+METRICS_LATENCIES_KEPT = 1000  # most recent latencies kept per host, for median and 95th percentile.
+
+
+class FetchError(Exception):
+    """  Raised when a server answers with other than HTTP 200 OK (or 304 Not Modified). """
+    def __init__(self, url, status, reason):
+        super().__init__('HTTP ' + str(status) + ' ' + str(reason) + ' for ' + url)
+        self.url = url
+        self.status = status
+
+
+class CircuitOpenError(Exception):
+    """  Raised instead of calling a service whose circuit breaker is open (service recently failing). """
+    pass
+
+
+class RateLimiter:
+    """  Spaces out requests to each host by at least min_interval seconds, across all threads.
+         Each caller reserves the next free time slot for its host, then sleeps until it arrives.
+    """
+    def __init__(self, min_interval=MIN_REQUEST_INTERVAL_SECONDS):
+        self.min_interval = min_interval
+        self._next_times = dict()  # host -> earliest time (time.monotonic()) next request may begin.
+        self._lock = threading.Lock()
+
+    def reserve(self, host):
+        """  Reserve the next time slot for a request to host.
+        :param host: host name [string].
+        :return: seconds to wait before the request may begin [float].
+        """
+        with self._lock:
+            now = time.monotonic()
+            start_time = max(now, self._next_times.get(host, now))
+            self._next_times[host] = start_time + self.min_interval
+        return start_time - now
+
+    def wait(self, host):
+        """  Block until a request to host may begin [None]. """
+        delay = self.reserve(host)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def await_slot(self, host):
+        """  As wait(), but yielding to the event loop rather than blocking [None]. """
+        delay = self.reserve(host)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class ConnectionPool:
+    """  Persistent HTTP/HTTPS connections, kept open between requests and reused, at most
+         max_per_host open to any one host. A thread wanting a connection when all are busy waits
+         for one to be returned, so the pool also bounds concurrent requests.
+         Usage: with pool.request(url) as response: for line in response: ...
+    """
+    def __init__(self, max_per_host=MAX_CONNECTIONS_PER_HOST, connect_timeout=CONNECT_TIMEOUT_SECONDS,
+                 read_timeout=READ_TIMEOUT_SECONDS, rate_limiter=None, metrics=None):
+        """  Constructor.
+        :param max_per_host: maximum connections open to any one host [int].
+        :param connect_timeout: seconds allowed to connect [float].
+        :param read_timeout: seconds allowed for each socket read [float].
+        :param rate_limiter: spaces out requests per host, or None for no rate limiting [RateLimiter].
+        :param metrics: records each request's latency and outcome, or None [FetchMetrics].
+        """
+        self.max_per_host = max_per_host
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.rate_limiter = rate_limiter
+        self.metrics = metrics
+        self._idle = dict()  # (scheme, host, port) -> idle connections [list of HTTPConnection].
+        self._slots = dict()  # (scheme, host, port) -> semaphore counting connections in use.
+        self._lock = threading.Lock()
+        self.n_connections_made = 0  # (for monitoring connection reuse)
+
+    @contextmanager
+    def request(self, url, headers=None):
+        """  Send a GET request on a pooled connection, yielding the response for streaming reads.
+             The connection returns to the pool when the block exits, if response was (nearly) all read
+             and server keeps the connection alive; otherwise it is closed.
+             Body may be gzip-compressed: read it through LineDecoder, e.g., with response_line_batches().
+        :param url: URL to get [string].
+        :param headers: extra request headers [dict of str:str, or None].
+        :return: response, status 200 or 304 [http.client.HTTPResponse object]; else raises FetchError.
+        """
+        parts = urlsplit(url)
+        key = (parts.scheme.lower(), parts.hostname, parts.port)
+        path = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+        all_headers = {'User-Agent': USER_AGENT, 'Accept-Encoding': ACCEPT_ENCODING}
+        all_headers.update(headers or dict())
+        slot = self._get_slot(key)
+        slot.acquire()
+        try:
+            if self.rate_limiter is not None:
+                self.rate_limiter.wait(parts.hostname)
+            start_time, latency = time.monotonic(), None
+            try:
+                connection, response = self._send(key, path, all_headers)
+                latency = time.monotonic() - start_time
+                try:
+                    if response.status not in OK_STATUSES:
+                        raise FetchError(url, response.status, response.reason)
+                    yield response
+                except BaseException:
+                    connection.close()
+                    raise
+            except Exception as e:
+                if self.metrics is not None:
+                    if latency is None:
+                        latency = time.monotonic() - start_time
+                    self.metrics.record(parts.hostname, latency, e)
+                raise
+            if self.metrics is not None:
+                self.metrics.record(parts.hostname, latency)
+            if not response.isclosed():
+                response.read(MAX_DRAIN_BYTES)  # reads end of body (readline() does not), unless too long.
+            if response.isclosed() and not response.will_close:
+                with self._lock:
+                    self._idle[key].append(connection)
+            else:
+                connection.close()
+        finally:
+            slot.release()
+
+    def close(self):
+        """  Close all idle connections (connections in use close when returned) [None]. """
+        with self._lock:
+            for connections in self._idle.values():
+                for connection in connections:
+                    connection.close()
+                connections.clear()
+
+    def _get_slot(self, key):
+        with self._lock:
+            if key not in self._slots:
+                self._slots[key] = threading.BoundedSemaphore(self.max_per_host)
+                self._idle[key] = []
+            return self._slots[key]
+
+    def _send(self, key, path, headers):
+        """  Send request on an idle connection if any, else on a new one. A reused connection the server
+             has since closed fails at once, so it is replaced by a new connection and the request resent.
+        :return: (connection, response) [2-tuple].
+        """
+        with self._lock:
+            connection = self._idle[key].pop() if len(self._idle[key]) >= 1 else None
+        if connection is not None:
+            try:
+                connection.request('GET', path, headers=headers)
+                return connection, connection.getresponse()
+            except (http.client.HTTPException, ConnectionError):
+                connection.close()
+        connection = self._new_connection(key)
+        try:
+            connection.request('GET', path, headers=headers)
+            return connection, connection.getresponse()
+        except BaseException:
+            connection.close()
+            raise
+
+    def _new_connection(self, key):
+        """  Return a newly opened connection, its socket's timeout then set for reads [HTTPConnection]. """
+        scheme, host, port = key
+        with self._lock:
+            self.n_connections_made += 1
+        if scheme == 'https':
+            connection = http.client.HTTPSConnection(host, port, timeout=self.connect_timeout)
+        else:
+            connection = http.client.HTTPConnection(host, port, timeout=self.connect_timeout)
+        try:
+            connection.connect()
+            connection.sock.settimeout(self.read_timeout)
+        except BaseException:
+            connection.close()
+            raise
+        return connection
+
+
+class LineDecoder:
+    """  Turns a response body, fed block by block as it arrives, into complete lines: undoes any gzip
+         content-encoding as it goes (so the whole compressed body is never held), and hashes the
+         decoded body (for re-validation by content, when a server offers no ETag or Last-Modified).
+    """
+    def __init__(self, content_encoding=None):
+        """  Constructor.
+        :param content_encoding: response's Content-Encoding header, e.g., 'gzip' [string, or None].
+        """
+        encoding = (content_encoding or '').strip().lower()
+        if encoding in ['gzip', 'x-gzip']:
+            self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding in ['', 'identity']:
+            self._decompressor = None
+        else:
+            raise ValueError('unsupported Content-Encoding: ' + encoding)
+        self._hash = hashlib.sha256()
+        self._partial_line = b''
+
+    def feed(self, block):
+        """  Decode one block of body as received; return the lines it completes [list of bytes]. """
+        data = block if self._decompressor is None else self._decompressor.decompress(block)
+        return self._split(data)
+
+    def finish(self):
+        """  Return the last lines of body, after all blocks fed [list of bytes]. """
+        lines = [] if self._decompressor is None else self._split(self._decompressor.flush())
+        if self._partial_line != b'':
+            lines.append(self._partial_line)
+            self._partial_line = b''
+        return lines
+
+    def line_batches(self, blocks):
+        """  Decode all blocks, yielding the lines completed by each [generator of lists of bytes]. """
+        for block in blocks:
+            lines = self.feed(block)
+            if len(lines) >= 1:
+                yield lines
+        lines = self.finish()
+        if len(lines) >= 1:
+            yield lines
+
+    @property
+    def content_hash(self):
+        """  Hash of decoded body fed so far [string]. """
+        return self._hash.hexdigest()
+
+    def _split(self, data):
+        self._hash.update(data)
+        lines = (self._partial_line + data).split(b'\n')
+        self._partial_line = lines.pop()
+        return [line + b'\n' for line in lines]
+
+
+def response_line_batches(response):
+    """  Read a ConnectionPool.request() response's body, decoding it into lines.
+    :param response: [http.client.HTTPResponse object].
+    :return: (decoder, line batches): decoder gives content_hash once all batches are read
+        [2-tuple of (LineDecoder, generator of lists of bytes)].
+    """
+    decoder = LineDecoder(response.getheader('Content-Encoding'))
+    return decoder, decoder.line_batches(iter(lambda: response.read(READ_BYTES), b''))
+
+
+def conditional_headers(validators):
+    """  Return request headers asking server to send body only if changed since these validators' download.
+    :param validators: 'etag' and/or 'last_modified' of earlier download [dict of str:str, or None].
+    :return: [dict of str:str], empty if validators offer no basis for a conditional request.
+    """
+    headers = dict()
+    if validators:
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+    return headers
+
+
+def validators_from_headers(headers):
+    """  Return a response's validators, for storing with its data.
+    :param headers: response headers [http.client.HTTPMessage, or dict with lower-case keys].
+    :return: 'etag' and/or 'last_modified', as present [dict of str:str].
+    """
+    validators = dict()
+    for name, header_name in [('etag', 'etag'), ('last_modified', 'last-modified')]:
+        value = headers.get(header_name)
+        if value:
+            validators[name] = value
+    return validators
+
+
+class AsyncResponse:
+    """  Response to arequest(): status line and headers already read, body streamed on request. """
+    def __init__(self, reader, status, reason, headers, timeout):
+        self.reader = reader
+        self.status = status
+        self.reason = reason
+        self.headers = headers  # header name (lower case) -> value [dict of str:str].
+        self.timeout = timeout
+        self.content_hash = None  # set once line_batches() has read whole body.
+
+    async def blocks(self):
+        """  Yield body as it arrives, undoing any chunked transfer-encoding (but not content-encoding)
+             [async generator of bytes]. """
+        if self.status == 304:
+            return  # never has a body.
+        if self.headers.get('transfer-encoding', '').lower() == 'chunked':
+            while True:
+                size_line = await self._read(self.reader.readline())
+                if size_line == b'':
+                    raise ConnectionError('connection closed before end of chunked response body')
+                size = int(size_line.split(b';')[0].strip() or b'0', 16)
+                if size == 0:
+                    while True:  # skip any trailer headers, up to the blank line ending the body.
+                        trailer_line = await self._read(self.reader.readline())
+                        if trailer_line == b'':
+                            raise ConnectionError('connection closed before end of chunked response body')
+                        if trailer_line.strip() == b'':
+                            return
+                yield await self._read(self.reader.readexactly(size))
+                await self._read(self.reader.readexactly(2))  # CRLF ending each chunk.
+        elif 'content-length' in self.headers:
+            n_left = int(self.headers['content-length'])
+            while n_left > 0:
+                block = await self._read(self.reader.read(min(n_left, READ_BYTES)))
+                if block == b'':
+                    raise ConnectionError('connection closed before end of response body')
+                n_left -= len(block)
+                yield block
+        else:
+            while True:
+                block = await self._read(self.reader.read(READ_BYTES))
+                if block == b'':
+                    return
+                yield block
+
+    async def line_batches(self):
+        """  Yield body as complete lines, decompressed, in batches as they arrive; afterward,
+             self.content_hash holds the decoded body's hash [async generator of lists of bytes].
+        """
+        decoder = LineDecoder(self.headers.get('content-encoding'))
+        async for block in self.blocks():
+            lines = decoder.feed(block)
+            if len(lines) >= 1:
+                yield lines
+        lines = decoder.finish()
+        self.content_hash = decoder.content_hash
+        if len(lines) >= 1:
+            yield lines
+
+    async def _read(self, awaitable):
+        return await asyncio.wait_for(awaitable, self.timeout)
+
+
+@asynccontextmanager
+async def arequest(url, headers=None, connect_timeout=CONNECT_TIMEOUT_SECONDS,
+                   read_timeout=READ_TIMEOUT_SECONDS, rate_limiter=None, metrics=None):
+    """  Send a GET request without blocking the event loop, yielding the response for streaming reads.
+         Uses a new connection per request (closed on exit); cancelling the calling task closes it at once.
+         Usage: async with arequest(url) as response: async for lines in response.line_batches(): ...
+    :param url: URL to get [string].
+    :param headers: extra request headers [dict of str:str, or None].
+    :param connect_timeout: seconds allowed to connect [float].
+    :param read_timeout: seconds allowed for each read [float].
+    :param rate_limiter: spaces out requests per host, or None for no rate limiting [RateLimiter].
+    :param metrics: records this request's latency and outcome, or None [FetchMetrics].
+    :return: response, status 200 or 304 [AsyncResponse object]; else raises FetchError.
+    """
+    parts = urlsplit(url)
+    is_https = parts.scheme.lower() == 'https'
+    port = parts.port or (443 if is_https else 80)
+    path = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+    if rate_limiter is not None:
+        await rate_limiter.await_slot(parts.hostname)
+    start_time, latency = time.monotonic(), None
+    writer = None
+    try:
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(parts.hostname, port,
+                                    ssl=ssl.create_default_context() if is_https else None),
+            connect_timeout)
+        all_headers = {'Host': parts.netloc, 'User-Agent': USER_AGENT, 'Accept-Encoding': ACCEPT_ENCODING,
+                       'Connection': 'close'}
+        all_headers.update(headers or dict())
+        request_lines = ['GET ' + path + ' HTTP/1.1'] + \
+            [name + ': ' + value for (name, value) in all_headers.items()]
+        writer.write(('\r\n'.join(request_lines) + '\r\n\r\n').encode('latin-1'))
+        await asyncio.wait_for(writer.drain(), read_timeout)
+        status_line = (await asyncio.wait_for(reader.readline(), read_timeout)).decode('latin-1').strip()
+        status_parts = status_line.split(' ', 2)
+        if len(status_parts) < 2 or not status_parts[1].isdigit():
+            raise http.client.BadStatusLine(status_line)
+        status, reason = int(status_parts[1]), (status_parts[2] if len(status_parts) >= 3 else '')
+        response_headers = dict()
+        while True:
+            header_line = await asyncio.wait_for(reader.readline(), read_timeout)
+            if header_line.strip() == b'':
+                break
+            name, _, value = header_line.decode('latin-1').partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+        latency = time.monotonic() - start_time
+        if status not in OK_STATUSES:
+            raise FetchError(url, status, reason)
+        yield AsyncResponse(reader, status, reason, response_headers, read_timeout)
+    except Exception as e:
+        if metrics is not None:
+            if latency is None:
+                latency = time.monotonic() - start_time
+            metrics.record(parts.hostname, latency, e)
+        raise
+    else:
+        if metrics is not None:
+            metrics.record(parts.hostname, latency)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def is_transient(error):
+    """  Return True iff error may well not recur if the call is repeated: a timeout, a network error
+         (other than PERMANENT_ERRORS, e.g., a certificate that fails verification), or an HTTP status
+         meaning the server is overloaded or briefly failing [boolean].
+    :param error: exception raised by a request [Exception].
+    """
+    if isinstance(error, FetchError):
+        return error.status in RETRY_STATUSES
+    if isinstance(error, PERMANENT_ERRORS):
+        return False
+    return isinstance(error, (OSError, asyncio.TimeoutError, http.client.HTTPException))
+
+
+def retry_delay(attempt, base_delay=RETRY_BASE_DELAY_SECONDS, max_delay=RETRY_MAX_DELAY_SECONDS):
+    """  Return seconds to wait after a failed attempt: exponential backoff, with random jitter so that
+         many clients failing together do not all retry together [float].
+    :param attempt: number of the attempt just failed, first is 1 [int].
+    :param base_delay: delay after first attempt, before jitter [float].
+    :param max_delay: delay cap, before jitter [float].
+    """
+    delay = min(max_delay, base_delay * 2 ** (attempt - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def call_with_retries(function, max_attempts=RETRY_MAX_ATTEMPTS, base_delay=RETRY_BASE_DELAY_SECONDS,
+                      max_delay=RETRY_MAX_DELAY_SECONDS, breaker=None, metrics=None):
+    """  Call function, retrying after transient failures (as judged by is_transient()) with backoff.
+         Other failures are raised at once, as is the last failure once attempts are used up.
+    :param function: makes one attempt, e.g., a download [callable taking no arguments].
+    :param max_attempts: attempts in all, including the first [int].
+    :param base_delay: delay before first retry, doubling for each later retry [float].
+    :param max_delay: longest delay between attempts [float].
+    :param breaker: guards the service called, or None; if open, raises CircuitOpenError [CircuitBreaker].
+    :param metrics: counts retries and circuit rejections, or None [FetchMetrics].
+    :return: function's return value.
+    """
+    attempt = 1
+    while True:
+        _check_circuit(breaker, metrics)
+        try:
+            result = function()
+        except Exception as e:
+            delay = _after_failure(e, attempt, max_attempts, base_delay, max_delay, breaker, metrics)
+            if delay is None:
+                raise
+            time.sleep(delay)
+            attempt += 1
+            continue
+        if breaker is not None:
+            breaker.record_success()
+        return result
+
+
+async def acall_with_retries(function, max_attempts=RETRY_MAX_ATTEMPTS, base_delay=RETRY_BASE_DELAY_SECONDS,
+                             max_delay=RETRY_MAX_DELAY_SECONDS, breaker=None, metrics=None):
+    """  As call_with_retries(), but a coroutine, waiting between attempts without blocking the event loop.
+    :param function: returns a new coroutine making one attempt [callable taking no arguments].
+    :return: return value of function's coroutine.
+    """
+    attempt = 1
+    while True:
+        _check_circuit(breaker, metrics)
+        try:
+            result = await function()
+        except Exception as e:
+            delay = _after_failure(e, attempt, max_attempts, base_delay, max_delay, breaker, metrics)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+            attempt += 1
+            continue
+        if breaker is not None:
+            breaker.record_success()
+        return result
+
+
+def _check_circuit(breaker, metrics):
+    """  Raise CircuitOpenError if breaker does not allow a call now [None]. """
+    if breaker is not None and not breaker.allow():
+        if metrics is not None:
+            metrics.count('circuit_rejections')
+        raise CircuitOpenError('service unavailable: ' + str(breaker.n_failures) +
+                               ' consecutive failures, next trial in ' +
+                               '{:.0f}'.format(breaker.seconds_until_trial()) + ' seconds')
+
+
+def _after_failure(error, attempt, max_attempts, base_delay, max_delay, breaker, metrics):
+    """  Record a failed attempt; return seconds to wait before retrying, or None to give up [float]. """
+    if not is_transient(error):
+        if breaker is not None:
+            breaker.record_success()  # service answered (e.g., 404 Not Found), so it is up.
+        return None
+    if breaker is not None:
+        breaker.record_failure()
+        if breaker.state == 'open':
+            return None
+    if attempt >= max_attempts:
+        return None
+    if metrics is not None:
+        metrics.count('retries')
+    return retry_delay(attempt, base_delay, max_delay)
+
+
+class CircuitBreaker:
+    """  Tracks one service's health across all threads, so that callers stop waiting on a service that is
+         down. States: 'closed' (calls allowed), 'open' after failure_threshold consecutive transient
+         failures (calls rejected, so callers fall back at once, e.g., to cached data), then after
+         reset_seconds 'half-open' (one trial call allowed: its success closes the circuit, its failure
+         re-opens it).
+    """
+    def __init__(self, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_seconds=CIRCUIT_RESET_SECONDS):
+        """  Constructor.
+        :param failure_threshold: consecutive transient failures that open the circuit [int].
+        :param reset_seconds: seconds an open circuit rejects calls before allowing a trial call [float].
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = 'closed'
+        self.n_failures = 0  # consecutive.
+        self._opened_time = None  # time.monotonic() when circuit last opened.
+        self._trial_time = None  # time.monotonic() when half-open circuit's trial call began.
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """  Return True iff a call may be made now; if it is the half-open circuit's trial call,
+             it must be followed by record_success() or record_failure() [boolean].
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self.state == 'open' and now - self._opened_time >= self.reset_seconds:
+                self.state = 'half-open'
+                self._trial_time = None
+            if self.state == 'half-open':
+                # One trial at a time; a trial abandoned (e.g., cancelled) is superseded after reset_seconds.
+                if self._trial_time is None or now - self._trial_time >= self.reset_seconds:
+                    self._trial_time = now
+                    return True
+                return False
+            return self.state == 'closed'
+
+    def record_success(self):
+        """  Record a call that succeeded (or failed for reasons not the service's) [None]. """
+        with self._lock:
+            self.state = 'closed'
+            self.n_failures = 0
+
+    def record_failure(self):
+        """  Record a call that failed transiently, opening the circuit if failures are too many [None]. """
+        with self._lock:
+            self.n_failures += 1
+            if self.state == 'half-open' or self.n_failures >= self.failure_threshold:
+                self.state = 'open'
+                self._opened_time = time.monotonic()
+
+    def seconds_until_trial(self):
+        """  Return seconds until an open circuit allows a trial call, 0 if not open [float]. """
+        with self._lock:
+            if self.state != 'open':
+                return 0.0
+            return max(0.0, self.reset_seconds - (time.monotonic() - self._opened_time))
+
+
+class FetchMetrics:
+    """  Counts requests and failures per host, and keeps each host's recent request latencies
+         (seconds from sending a request to its status and headers arriving), across all threads.
+         Also counts named events, e.g., 'retries', 'circuit_rejections'. See summary().
+    """
+    def __init__(self, max_latencies=METRICS_LATENCIES_KEPT):
+        self.max_latencies = max_latencies
+        self._hosts = dict()  # host -> dict of statistics.
+        self._events = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, host, seconds, error=None):
+        """  Record one request's outcome.
+        :param host: host name [string].
+        :param seconds: latency, or time to failure [float].
+        :param error: exception raised by the request, or None if it succeeded [Exception].
+        :return: [None]
+        """
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = {'requests': 0, 'failures': 0, 'last_error': None,
+                                     'latencies': deque(maxlen=self.max_latencies)}
+            statistics = self._hosts[host]
+            statistics['requests'] += 1
+            statistics['latencies'].append(seconds)
+            if error is not None:
+                statistics['failures'] += 1
+                statistics['last_error'] = str(error) or type(error).__name__
+
+    def count(self, event, n=1):
+        """  Add n to the count of a named event [None]. """
+        with self._lock:
+            self._events[event] += n
+
+    def summary(self):
+        """  Return a snapshot of all metrics: 'hosts' maps each host to its 'requests', 'failures',
+             'failure_rate', 'latency_median' and 'latency_p95' (seconds, None if no requests yet)
+             and 'last_error'; 'events' maps each event to its count [dict].
+        """
+        with self._lock:
+            hosts = dict()
+            for host, statistics in self._hosts.items():
+                latencies = sorted(statistics['latencies'])
+                n = len(latencies)
+                hosts[host] = {'requests': statistics['requests'],
+                               'failures': statistics['failures'],
+                               'failure_rate': statistics['failures'] / max(1, statistics['requests']),
+                               'latency_median': latencies[n // 2] if n >= 1 else None,
+                               'latency_p95': latencies[min(n - 1, int(0.95 * n))] if n >= 1 else None,
+                               'last_error': statistics['last_error']}
+            return {'hosts': hosts, 'events': dict(self._events)}
@@ -0,0 +1,223 @@
+from collections import OrderedDict
+from math import isfinite
+import tkinter as tk
+import tkinter.ttk as ttk
+
+import numpy as np
+
+from pylcg.table_window import TableWindow, widest_values, format_cell
+from pylcg.util import jd_from_any_date_string
+
+__author__ = "Eric Dose :: New Mexico Mira Project, Albuquerque"
+
+"""  obs_window.py
+     Browses the current star's downloaded observations, one per row, in a virtual TableWindow,
+     filtered as the user types (by text, band, observer and JD range) and sortable on any column.
+     Works only on data already downloaded: never touches the network.
+"""
+
+OBS_WINDOW_COLUMNS = ['JD', 'mag', 'uncert', 'band', 'by', 'obsName', 'fainterThan', 'valFlag',
+                      'comCode', 'comments', 'charts', 'compStar1', 'compStar2', 'airmass',
+                      'obsID']  # displayed in this order, where present in data.
+OBS_WINDOW_FLOAT_FORMATS = {'JD': '{:.5f}', 'mag': '{:.3f}', 'uncert': '{:.3f}'}  # others by format_cell().
+FILTER_DELAY_MSEC = 150  # filters are applied once user pauses typing this long.
+JD_FILTER_DIGITS = 7  # a JD filter entry counts only once its integer part has this many digits.
+FILTER_ENTRIES = [('text', 'Text', 16), ('bands', 'Bands', 8), ('observer', 'Observer', 8),
+                  ('jd_low', 'JD from', 13), ('jd_high', 'to', 13)]  # (key, label, width in characters).
+
+
+class ObsWindow(TableWindow):
+    """  Browse observations in a standalone window: a virtual table (see TableWindow) whose rows are read
+         straight from the dataset's columns, under a row of filter entries.
+    """
+    def __init__(self, parent, star_id, adf, jd_low=None, jd_high=None):
+        """  Constructor.
+        :param parent: parent window from which this is called.
+        :param star_id: star whose observations these are [string].
+        :param adf: observations, already downloaded [ArrayDataFrame object].
+        :param jd_low: JD filter's initial lower limit, e.g., of plot now in view, or None [float].
+        :param jd_high: JD filter's initial upper limit, or None [float].
+        """
+        self.obs_filter = adf.obs_filter()
+        self.n_obs = adf.len()
+        self.initial_jds = (jd_low, jd_high)
+        self.filter_vars = None  # StringVar of each filter entry [OrderedDict].
+        self.filter_job = None  # pending after() call to apply filters.
+        self.count_label = None
+        column_names = [column_name for column_name in OBS_WINDOW_COLUMNS if column_name in adf.dict]
+        model = ObsTableModel(adf, column_names, self.obs_filter.rows(jd_low=jd_low, jd_high=jd_high))
+        header_text = '\n'.join(['OBSERVATIONS of ' + star_id.strip(),
+                                 '  ' + str(self.n_obs) + ' obs downloaded',
+                                 '', '(type to filter; click column header to sort, again to reverse)'])
+        TableWindow.__init__(self, parent, 'BROWSE OBSERVATIONS', header_text, column_names, None,
+                             horizontal_scrollbar=True, virtual=True, model=model)
+        self._show_count()
+
+    def _layout_window(self):
+        """  Lay out window as TableWindow does, with a row of filter entries above the table. """
+        TableWindow._layout_window(self)
+        filter_frame = ttk.Frame(self.this_window, padding=(10, 0, 10, 6))
+        filter_frame.pack(fill='x', before=self.this_frame)
+        self.filter_vars = OrderedDict()
+        for i_entry, (key, label, width) in enumerate(FILTER_ENTRIES):
+            self.filter_vars[key] = tk.StringVar()
+            ttk.Label(filter_frame, text=label).grid(row=0, column=2 * i_entry, padx=(8, 2))
+            ttk.Entry(filter_frame, textvariable=self.filter_vars[key], width=width)\
+                .grid(row=0, column=2 * i_entry + 1)
+        for key, jd in zip(['jd_low', 'jd_high'], self.initial_jds):
+            self.filter_vars[key].set('' if jd is None else '{:.3f}'.format(jd))
+        for var in self.filter_vars.values():
+            var.trace_add('write', self._on_filter_edit)  # (after initial values are set)
+        self.count_label = ttk.Label(filter_frame)
+        self.count_label.grid(row=0, column=2 * len(FILTER_ENTRIES), padx=(12, 0), sticky='w')
+
+    def _on_filter_edit(self, *args):
+        """  User has edited a filter entry: apply filters once typing pauses. """
+        if self.filter_job is not None:
+            self.this_window.after_cancel(self.filter_job)
+        self.filter_job = self.this_window.after(FILTER_DELAY_MSEC, self._apply_filters)
+
+    def _apply_filters(self):
+        self.filter_job = None
+        filters = parse_filters(**dict((key, var.get()) for (key, var) in self.filter_vars.items()))
+        self.model.set_rows(self.obs_filter.rows(**filters))
+        self.refresh()
+        self._show_count()
+
+    def _show_count(self):
+        self.count_label['text'] = '{} of {} obs'.format(len(self.model), self.n_obs)
+
+
+class ObsTableModel:
+    """  TableModel-like view (see table_window.py) of selected rows of an ArrayDataFrame, read straight
+         from its columns: no per-row tuples are made except for rows bound to TreeView items, and sort keys
+         come from float arrays and categorical codes (one string comparison per category, not per row).
+         Rows are identified by their indices in the ArrayDataFrame, so that selections survive re-filtering.
+    """
+    def __init__(self, adf, column_names, rows):
+        """  Constructor.
+        :param adf: observations [ArrayDataFrame object].
+        :param column_names: names of columns to display, left to right [list of strings].
+        :param rows: indices of rows to display, in display order [numpy integer array].
+        """
+        self.adf = adf
+        self.column_names = list(column_names)
+        self.columns = [self._column(column_name) for column_name in self.column_names]
+        self.rows = rows
+        self.sort_columns = []  # (column index, descending) of current sort, primary first.
+        self._sort_keys = dict()  # column index -> sort key of each row of adf [numpy float array].
+
+    def _column(self, column_name):
+        """  Return column as held for display: float array, or Categorical (list columns encoded once). """
+        values = self.adf.dict[column_name]
+        if isinstance(values, np.ndarray) and values.dtype != object:
+            return values
+        return self.adf.derive(('categorical', column_name), lambda: self.adf.categorical(column_name))
+
+    def __len__(self):
+        return len(self.rows)
+
+    def is_numeric(self, ix):
+        """  Return True iff column ix holds numbers [boolean]. """
+        return isinstance(self.columns[ix], np.ndarray)
+
+    def _format(self, ix, value):
+        if self.is_numeric(ix) and value == value:  # (nan != nan)
+            return OBS_WINDOW_FLOAT_FORMATS.get(self.column_names[ix], '{:.6g}').format(value)
+        return format_cell(value)
+
+    def widest_text(self, ix, n):
+        """  Return the n longest of column ix's values as displayed, for measuring column width:
+             among the categories for a text column, else among the extreme values [list of strings].
+        """
+        column = self.columns[ix]
+        if not self.is_numeric(ix):
+            return widest_values(column.categories, n)
+        if np.all(np.isnan(column)):
+            return []
+        return widest_values([self._format(ix, value) for value in [np.nanmin(column), np.nanmax(column)]], n)
+
+    def display_row(self, position):
+        """  Return values of row now at this display position, as displayed [tuple of strings]. """
+        row = int(self.rows[position])
+        return tuple(self._format(ix, column[row]) for (ix, column) in enumerate(self.columns))
+
+    def rows_at(self, start, stop):
+        """  Return indices (in adf) of rows now at display positions start to stop - 1 [list]. """
+        return self.rows[start:stop].tolist()
+
+    def set_rows(self, rows):
+        """  Display these rows (e.g., newly filtered), in the current sort order if any.
+        :param rows: indices of rows to display, e.g. in JD order [numpy integer array].
+        """
+        self.rows = rows
+        if len(self.sort_columns) >= 1:
+            self.sort(self.sort_columns)
+
+    def sort_key(self, ix):
+        """  Return column ix's sort key for every row of adf: each row's number, or for a text column,
+             the rank (ignoring case) of each row's category; nan for missing numbers [numpy float array].
+        """
+        if ix not in self._sort_keys:
+            column = self.columns[ix]
+            if self.is_numeric(ix):
+                key = column
+            else:
+                folded = np.array([c.casefold() for c in column.categories], dtype=object)
+                _, category_ranks = np.unique(folded, return_inverse=True)
+                key = category_ranks.reshape(-1).astype(np.float64)[column.codes]
+            self._sort_keys[ix] = key
+        return self._sort_keys[ix]
+
+    def sort(self, sort_columns):
+        """  Put rows in order of several columns at once, as TableModel.sort() does: stable (so rows
+             equal in all sort columns keep their order, e.g. by JD), missing numbers last.
+        :param sort_columns: (column index, descending) for each sort column, primary first
+            [list of 2-tuples of (int, boolean)].
+        :return: [None]
+        """
+        self.sort_columns = list(sort_columns)
+        if len(self.sort_columns) == 0 or len(self.rows) == 0:
+            return
+        keys = []
+        for ix, descending in reversed(self.sort_columns):  # (np.lexsort sorts by its last key first)
+            key = self.sort_key(ix)[self.rows]
+            key = -key if descending else key
+            keys.append(np.where(np.isnan(key), np.inf, key))
+        self.rows = self.rows[np.lexsort(keys)]
+
+
+def parse_filters(text='', bands='', observer='', jd_low='', jd_high=''):
+    """  Convert filter entries as typed into arguments for ObsFilter.rows(). An unreadable JD (or date)
+         is treated as blank, so that a half-typed one does not empty the table.
+    :param text: text to search for [string].
+    :param bands: bands wanted, separated by commas or spaces; blank for all [string].
+    :param observer: start of observer code [string].
+    :param jd_low: lowest JD, or date in US or European format; blank for no limit [string].
+    :param jd_high: highest JD or date, as jd_low [string].
+    :return: keyword arguments for ObsFilter.rows() [dict].
+    """
+    band_list = bands.replace(',', ' ').split()
+    return {'text': text, 'bands': band_list if len(band_list) >= 1 else None, 'observer': observer,
+            'jd_low': _jd_from_filter_entry(jd_low), 'jd_high': _jd_from_filter_entry(jd_high)}
+
+
+def _jd_from_filter_entry(entry):
+    """  Return JD from a JD filter entry as typed, or None if blank or not (yet) readable. A JD counts only
+         once it has all 7 integer digits, and a date once its year has all 4: '245' is a JD still being
+         typed, not JD 245, and '12/3/20' is a date still being typed, not one in year 20.
+    :param entry: JD, or date in US or European format (see util.jd_from_any_date_string()) [string].
+    :return: JD, or None [float].
+    """
+    entry = entry.strip()
+    try:
+        jd = float(entry)
+        if len(entry.split('.')[0].lstrip('+-')) < JD_FILTER_DIGITS:
+            return None
+        return jd if isfinite(jd) else None  # (e.g., not 'nan')
+    except ValueError:
+        pass
+    year = entry.replace('-', '/').replace('.', '/').split('/')[-1]
+    if len(year) != 4 or not year.isdigit():
+        return None
+    return jd_from_any_date_string(entry)
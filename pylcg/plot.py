@@ -1,13 +1,14 @@
-import matplotlib
-matplotlib.use('TkAgg')  # this must immediately follow 'import matplotlib', even if IDE complains.
 import matplotlib.ticker as mplticker
 import matplotlib.dates as mpldates
+from matplotlib.collections import LineCollection
 
 from datetime import datetime, timedelta, timezone
 
 import tkinter as tk
 from tkinter import ttk
-from math import isnan, floor, log10
+from math import floor, log10
+
+import numpy as np
 
 import pylcg.util as util
 
@@ -23,6 +24,7 @@ BAND_DEFAULT_COLOR_DEFAULT = 'gray'
 BAND_MARKERS = {'V': 'o', 'R': 'o', 'I': 'o', 'B': 'o', 'Vis.': 'v'}
 BAND_MARKERS_DEFAULT = 'x'
 HIGHLIGHT_COLOR = '#ffe090'  # very light orange
+ERRORBAR_CAPSIZE = 2  # points.
 
 LARGE_FONT = ("Verdana", 12)
 NORM_FONT = ("Verdana", 10)
@@ -30,6 +32,7 @@ SMALL_FONT = ("Verdana", 8)
 PLOT_TITLE_FONT = ('consolas', 20)
 PLOT_TITLE_COLOR = 'gray'
 GRID_COLOR = 'lightgray'
+PICK_RADIUS_PIXELS = 8  # cursor identifies the observation drawn nearest it, if within this distance.
 
 
 def set_jd_formatter(ax):
@@ -53,11 +56,13 @@ def set_jd_formatter(ax):
 def redraw_plot(canvas, mdf, star_id, bands_to_plot, show_errorbars=True, show_grid=True,
                 show_lessthans=False, observer_selected='',
                 highlight_observer=False, plot_observer_only=False,
-                plot_in_jd=True, jd_start=None, jd_end=None, num_days=None):
+                plot_in_jd=True, jd_start=None, jd_end=None, num_days=None, level_of_detail=False,
+                show_popup=True):
     """  Reformat data for matplotlib, then clear and redraw plot area only, and trigger replacement of
     the old plot by the new plot within the containing tkinter Frame.
     Do not touch other areas of main page, and do not change any external data.
-    :param plot_in_jd:
+    For repeated redraws of one canvas (as in the GUI), use a LightCurvePlot object instead, which
+    redraws incrementally.
     :param canvas: canvas containing LCG plot [matplotlib FigureCanvasTkAgg object].
     :param mdf: data to plot [MiniDataFrame object].
     :param star_id: star ID to plot [string].
@@ -73,148 +78,539 @@ def redraw_plot(canvas, mdf, star_id, bands_to_plot, show_errorbars=True, show_g
     :param jd_start: JD to be at plot's left edge [float].
     :param jd_end:  JD to be at plot's right edge, often the current JD [float].
     :param num_days:  number of days to plot [int or float]
-    :return [None]
+    :param level_of_detail: True to draw, per band, only the faintest and brightest points in each pixel
+        column (plus all of observer_selected's points), refined as x-limits change; False to draw
+        every point [boolean].
+    :param show_popup: True to tell user in a popup window if there are no observations to plot; False
+        (as when rendering headless) to just return False [boolean].
+    :return: True iff plot was drawn [boolean].
     """
-    if mdf.dict is None:
-        message_popup('No observations found for ' + star_id + ' in this date range.')
-        return False
-    if mdf.len() <= 0:
-        message_popup('No observations found for ' + star_id + ' in this date range.')
-        return False
-
-    # Clean up uncertainty data:
-    uncert = [0.0 if isnan(u) else u for u in mdf.column('uncert')]  # set any missing values to zero.
-    uncert = [max(0.0, u) for u in uncert]  # set any negatives to zero.
-    mdf.set_column('uncert', uncert)
-
-    # Remove less-than observations if flag dictates:
-    if not show_lessthans:
-        is_not_lessthan = [f == '0' for f in mdf.column('fainterThan')]
-        mdf = mdf.row_subset(is_not_lessthan)
-
-    # Construct plot elements:
-    ax = canvas.figure.axes[0]
-    ax.clear()
-    ax.set_title(star_id.upper(), color=PLOT_TITLE_COLOR, fontname='Consolas', fontsize=16, weight='bold')
-    if plot_in_jd:
-        ax.set_xlabel('JD')
-    else:
-        ax.set_xlabel('Date (UTC)')
-    ax.set_ylabel('Magnitude')
-    if show_grid:
-        ax.grid(True, color=GRID_COLOR, zorder=-1000)  # zorder->behind everything else.
-    if show_errorbars:
-        is_to_be_drawn = [b in bands_to_plot for b in mdf.column('band')]
-        mdf_to_be_drawn = mdf.row_subset(is_to_be_drawn)
-        if plot_observer_only:
-            is_observer = [o.upper() == observer_selected.upper() for o in mdf_to_be_drawn.column('by')]
-            mdf_to_be_drawn = mdf_to_be_drawn.row_subset(is_observer)
-        ax.errorbar(x=mdf_to_be_drawn.column('JD'), y=mdf_to_be_drawn.column('mag'),
-                    xerr=0.0, yerr=mdf_to_be_drawn.column('uncert'),
-                    fmt='none', ecolor='gray', capsize=2, alpha=1,
-                    zorder=+900)  # zorder->behind datapoint markers, above grid.
-    legend_handles, legend_labels = [], []  # defaults if no points to plot
-    x_to_highlight, y_to_highlight = [], []
-    for band in bands_to_plot:
-        band_color = BAND_DEFAULT_COLORS.get(band, BAND_DEFAULT_COLOR_DEFAULT)
-        band_marker = BAND_MARKERS.get(band, BAND_MARKERS_DEFAULT)
-        is_band = [b == band for b in mdf.column('band')]
-        mdf_band = mdf.row_subset(is_band)
-        if plot_observer_only:
-            is_observer = [o.upper() == observer_selected.upper() for o in mdf_band.column('by')]
-            mdf_band = mdf_band.row_subset(is_observer)
-        if mdf_band is not None:
-            if mdf_band.len() >= 1:
-                if plot_in_jd:
-                    x_plot = mdf_band.column('JD')  # use Julian Dates just as they are.
-                else:
-                    x_plot = [util.datetime_utc_from_jd(jd) for jd in mdf_band.column('JD')]  # to datetime.
-                y_plot = mdf_band.column('mag')
-                ax.scatter(x=x_plot, y=y_plot,
-                           color=band_color, marker=band_marker,
-                           s=25, alpha=0.9, zorder=+1000)  # zorder->on top.
+    return LightCurvePlot(canvas).redraw(mdf, star_id, bands_to_plot, show_errorbars, show_grid,
+                                         show_lessthans, observer_selected, highlight_observer,
+                                         plot_observer_only, plot_in_jd, jd_start, jd_end, num_days,
+                                         level_of_detail, show_popup)
+
+
+class LightCurvePlot:
+    """  Draws light curves on one canvas, keeping its matplotlib artists (per band: a PathCollection of
+         points, a LineCollection of errorbars with their caps, and a PathCollection of highlights) alive
+         between redraws. A redraw after changing only bands, grid, errorbars or highlighting just flips
+         artists' visibility; one after changing the data selected (e.g., less-thans or observer) just
+         swaps their offsets and segments; either then redraws via draw_idle(). Only a new star, new data
+         or switching between JD and calendar dates rebuilds the plot from a cleared axes.
+         In level-of-detail mode, artists hold only each band's envelope per pixel column (see
+         level_of_detail_rows()), recomputed whenever x-limits change (e.g., by toolbar zoom or pan).
+    """
+    def __init__(self, canvas):
+        """  Constructor.
+        :param canvas: canvas containing LCG plot [matplotlib FigureCanvasTkAgg object].
+        """
+        self.canvas = canvas
+        self.ax = None  # axes on which artists were last built.
+        self.plot_data = None  # PlotData from which artists were last built or updated.
+        self.plot_in_jd = None
+        self.band_artists = dict()  # band -> BandArtists object.
+        self.level_of_detail = False
+        self.artist_data_key = None  # identifies data now held by artists, to skip needless updates.
+        self.drawn_rows = dict()  # band -> indices (in plot_data's arrays) of points drawn, if not all.
+        self.adf = None  # observations last plotted [ArrayDataFrame object].
+        self.star_key = None  # star last plotted, normalized (as by get_plot_data()) [string].
+        self.plotted_xlim = None  # x-limits as last set by redraw(), i.e., before any zoom or pan.
+        self.point_index = None  # (view key, PointIndex, row of each indexed point), see nearest_row().
+
+    def redraw(self, mdf, star_id, bands_to_plot, show_errorbars=True, show_grid=True,
+               show_lessthans=False, observer_selected='',
+               highlight_observer=False, plot_observer_only=False,
+               plot_in_jd=True, jd_start=None, jd_end=None, num_days=None, level_of_detail=False,
+               show_popup=True):
+        """  Draw or update plot; parameters as for redraw_plot().
+        :return: True iff plot was drawn [boolean].
+        """
+        if mdf.dict is None or mdf.len() <= 0:
+            if show_popup:
+                message_popup('No observations found for ' + star_id + ' in this date range.')
+            return False
+        adf = util.ArrayDataFrame.from_minidataframe(mdf)  # no conversion if mdf is already array-backed.
+        observer_code = '' if observer_selected is None else observer_selected.strip()
+        plot_data = get_plot_data(adf, star_id, show_lessthans, observer_code, plot_observer_only, plot_in_jd)
+        star_key = star_id.strip().upper()
+
+        ax = self.canvas.figure.axes[0]
+        is_incremental = (ax is self.ax) and (adf is self.adf) and (star_key == self.star_key) and \
+            (plot_in_jd == self.plot_in_jd) and (set(plot_data.bands.keys()) == set(self.band_artists.keys()))
+        self.adf, self.star_key = adf, star_key
+        self.level_of_detail = level_of_detail
+        if not is_incremental:
+            self._build(ax, plot_data, plot_in_jd)
+        self.plot_data = plot_data
+
+        # Show or hide artists per options that only change how data are drawn:
+        ax.set_title(star_id.upper(), color=PLOT_TITLE_COLOR, fontname='Consolas', fontsize=16, weight='bold')
+        if show_grid:
+            ax.grid(True, color=GRID_COLOR, zorder=-1000)  # zorder->behind everything else.
+        else:
+            ax.grid(False)
+        show_highlights = highlight_observer and (observer_code != '')
+        legend_handles, legend_labels = [], []
+        for band, band_artists in self.band_artists.items():
+            is_band_shown = band in bands_to_plot
+            band_artists.set_visible(is_band_shown, show_errorbars, show_highlights)
+        for band in bands_to_plot:  # legend in order of bands_to_plot, as always.
+            if band in self.band_artists:
+                legend_handles.append(self.band_artists[band].points)
                 legend_labels.append(band)
-                # Before we leave this band, store x and y for any points to be highlighted for observer:
-                if highlight_observer:
-                    if observer_selected is not None:
-                        if observer_selected.strip() != '':
-                            is_obscode = [u.upper() == observer_selected.upper()
-                                          for u in mdf_band.column('by')]
-                            if sum(is_obscode) >= 1:
-                                x_highlight_this_band = [xx for (xx, keep) in zip(x_plot, is_obscode)
-                                                         if keep]
-                                y_highlight_this_band = [yy for (yy, keep) in zip(y_plot, is_obscode)
-                                                         if keep]
-                                x_to_highlight.extend(x_highlight_this_band)
-                                y_to_highlight.extend(y_highlight_this_band)
-
-    # Plot legend here, before more scatter plots can mess it up:
-    ax.legend(labels=legend_labels,
-              scatterpoints=1, bbox_to_anchor=(0, 1.02, 1, .102), loc=3, ncol=2, borderaxespad=0)
-
-    # Highlight observer's points, if requested:
-    if len(x_to_highlight) >= 1:
-        ax.scatter(x=x_to_highlight, y=y_to_highlight,
-                   color=HIGHLIGHT_COLOR, marker='o',
-                   s=200, alpha=0.75, zorder=+800)  # under point marker and errorbar.
-
-    # Compute x-axis limits:
-    if jd_end is None:
-        x_high = util.jd_now()
-    else:
-        x_high = jd_end
-    if jd_start is None:
-        x_low = x_high - num_days
-    else:
-        x_low = jd_start
-    if not plot_in_jd:
-        x_high = util.datetime_utc_from_jd(x_high)
-        x_low = util.datetime_utc_from_jd(x_low)
-    x_range = abs(x_high - x_low)
-    # print(x_low, x_high, x_range)
-    ax.set_xlim(x_low - 0.00 * x_range, x_high + 0.00 * x_range)
-
-    # Format x-axis labels:
-    if plot_in_jd:
-        set_jd_formatter(ax)
-    else:
-        # Improve default formatter's poor day spacing:
-        x_locator = mpldates.AutoDateLocator()
-        # TODO: remove too-close ticks here (low-priority).
-        ax.xaxis.set_major_locator(x_locator)
-        x_formatter = mpldates.AutoDateFormatter(x_locator)
-        # Quick improvements to x-axis tick labels in calendar mode:
-        x_formatter.scaled[1 / 24.0] = '%m-%d %H:%M'
-        x_formatter.scaled[1 / (24.0 * 60.0)] = '%m-%d %H:%M'
-        ax.xaxis.set_major_formatter(x_formatter)
-
-        # Rotate all tick labels for readability (date-based labels can be long):
-        for label in ax.get_xticklabels():  # list of matplotlib 'Text' objects
-            label.set_ha("right")
-            label.set_rotation(30)
-
-    # Arrange the y-axis limits (not trivial as we follow convention of brighter (lesser-value) magnitudes
-    #    to be plotted toward top of plot.
-    # We don't use ax.invert_yaxis() as it has side-effect of repeatedly inverting y on successive calls.
-    y_low, y_high = ax.set_ylim()
-    ax.set_ylim(max(y_low, y_high), min(y_low, y_high))
-
-    # Used for zoom/pan...declare and register callbacks:
-    def on_xlims_change(axes):
+        # Plot legend (replaces any previous legend):
+        ax.legend(handles=legend_handles, labels=legend_labels,
+                  scatterpoints=1, bbox_to_anchor=(0, 1.02, 1, .102), loc=3, ncol=2, borderaxespad=0)
+
+        # Compute x-axis limits:
+        if jd_end is None:
+            x_high = util.jd_now()
+        else:
+            x_high = jd_end
+        if jd_start is None:
+            x_low = x_high - num_days
+        else:
+            x_low = jd_start
+        if not plot_in_jd:
+            x_low, x_high = util.date_numbers_from_jds([x_low, x_high], date_number_epoch_jd()).tolist()
+        ax.set_xlim(x_low, x_high)
+        self.plotted_xlim = (x_low, x_high)
+        self.update_artist_data()  # (in case set_xlim() did not already, via on_xlims_change())
+
+        # Arrange the y-axis limits (not trivial as we follow convention of brighter (lesser-value) magnitudes
+        #    to be plotted toward top of plot.
+        # We don't use ax.invert_yaxis() as it has side-effect of repeatedly inverting y on successive calls.
+        y_low, y_high = plot_data.y_limits(bands_to_plot, show_errorbars, x_low, x_high)  # points in view.
+        if y_low is None:
+            y_low, y_high = ax.get_ylim()
+        ax.set_ylim(max(y_low, y_high), min(y_low, y_high))
+
+        if is_incremental:
+            self.canvas.draw_idle()  # redraw when GUI next idle (coalesces rapid toggles).
+        else:
+            self.canvas.draw()
+        return True
+
+    def jd_limits(self):
+        """  Return JD range now in view (e.g., after toolbar zoom), or (None, None) if nothing plotted yet.
+        :return: lowest and highest JD in view [2-tuple of floats].
+        """
+        if self.ax is None or self.plot_data is None:
+            return None, None
+        x_low, x_high = sorted(self.ax.get_xlim())
+        if self.plot_in_jd:
+            return x_low, x_high
+        return tuple(util.jds_from_date_numbers([x_low, x_high], date_number_epoch_jd()).tolist())
+
+    def zoomed_jd_limits(self):
+        """  Return JD range now in view if user has zoomed or panned since the plot was drawn, else
+             (None, None), e.g., so that a summary covers all data plotted rather than 'the range in view'.
+        :return: lowest and highest JD in view, or (None, None) [2-tuple of floats, or of None].
+        """
+        if self.ax is None or self.plotted_xlim is None or \
+                np.allclose(sorted(self.ax.get_xlim()), sorted(self.plotted_xlim), rtol=0.0, atol=1e-6):
+            return None, None
+        return self.jd_limits()
+
+    def visible_counts(self, bands):
+        """  Return number of points now in view for each band, by binary search (no scan of the data).
+        :param bands: bands to count [list of strings].
+        :return: number of points in view, for each band having any points at all [dict of band:int].
+        """
+        if self.ax is None or self.plot_data is None:
+            return dict()
+        x_low, x_high = sorted(self.ax.get_xlim())
+        return self.plot_data.count(bands, x_low, x_high)
+
+    def nearest_row(self, x_pixel, y_pixel, max_distance=PICK_RADIUS_PIXELS):
+        """  Return the observation drawn nearest a point on the canvas (e.g., the cursor), in constant time:
+             only a few grid cells of a PointIndex are searched. The index covers the shown bands' points
+             in view as drawn (in level-of-detail mode, only those the artists now hold), and is rebuilt
+             (in one vectorized pass) only after the view, data drawn, shown bands, axes size or max_distance
+             change.
+        :param x_pixel: x in display coordinates, as matplotlib event.x [float].
+        :param y_pixel: y in display coordinates, as matplotlib event.y [float].
+        :param max_distance: farthest an observation may be drawn from the point, in pixels [float].
+        :return: index of row in self.adf, or None if no observation drawn so near [int, or None].
+        """
+        if self.ax is None or self.plot_data is None:
+            return None
+        shown_bands = tuple(band for (band, band_artists) in self.band_artists.items()
+                            if band in self.plot_data.bands and band_artists.points.get_visible())
+        key = (self.artist_data_key, shown_bands, self.ax.get_xlim(), self.ax.get_ylim(), self.ax.bbox.bounds,
+               max_distance)  # (max_distance sets the index's cell size)
+        if self.point_index is None or self.point_index[0] != key:
+            x_low, x_high = sorted(self.ax.get_xlim())
+            xs, mags, rows = [np.zeros(0)], [np.zeros(0)], [np.zeros(0, dtype=np.int64)]
+            for band in shown_bands:
+                x, mag, _, _ = self.plot_data.bands[band]
+                drawn = self.drawn_rows.get(band)  # (in level-of-detail mode, only points drawn are indexed)
+                drawn = self.plot_data.x_range_slice(band, x_low, x_high) if drawn is None else drawn
+                xs.append(x[drawn])
+                mags.append(mag[drawn])
+                rows.append(self.plot_data.band_rows[band][drawn])
+            pixels = self.ax.transData.transform(np.column_stack([np.concatenate(xs), np.concatenate(mags)]))
+            point_index = PointIndex(pixels[:, 0], pixels[:, 1], self.ax.bbox.bounds, max_distance)
+            self.point_index = (key, point_index, np.concatenate(rows))
+        _, point_index, rows = self.point_index
+        i_point = point_index.nearest(x_pixel, y_pixel, max_distance)
+        return None if i_point is None else int(rows[i_point])
+
+    def update_artist_data(self):
+        """  Give artists the data they should now draw: all of self.plot_data, or in level-of-detail mode,
+             only that needed for the current x-limits and axes width. Does nothing if already done.
+        :return: [None]
+        """
+        if self.plot_data is None or self.ax is None:
+            return
+        if self.level_of_detail:
+            x_low, x_high = sorted(self.ax.get_xlim())
+            n_columns = max(1, int(round(self.ax.bbox.width)))  # pixel columns.
+            key = (self.plot_data, True, x_low, x_high, n_columns)
+        else:
+            key = (self.plot_data, False)
+        if key == self.artist_data_key:
+            return
+        self.drawn_rows = dict()
+        for band, band_artists in self.band_artists.items():
+            x, mag, uncert, is_observer = self.plot_data.bands[band]
+            if self.level_of_detail:
+                rows = level_of_detail_rows(x, mag, is_observer, x_low, x_high, n_columns)
+                band_artists.set_data(x[rows], mag[rows], uncert[rows], is_observer[rows])
+                self.drawn_rows[band] = rows
+            else:
+                band_artists.set_data(x, mag, uncert, is_observer)
+        self.artist_data_key = key
+
+    def _build(self, ax, plot_data, plot_in_jd):
+        """  Clear axes, then make all artists for all bands in plot_data (to be shown or hidden later). """
+        ax.clear()
+        if plot_in_jd:
+            ax.set_xlabel('JD')
+        else:
+            ax.set_xlabel('Date (UTC)')
+            ax.xaxis_date(tz=timezone.utc)  # x values are matplotlib date numbers.
+        ax.set_ylabel('Magnitude')
+        self.band_artists = dict()
+        for band, band_arrays in plot_data.bands.items():
+            self.band_artists[band] = BandArtists(ax, band, *band_arrays)
+        self.artist_data_key = (plot_data, False)
+        self.drawn_rows = dict()
+
+        # Format x-axis labels:
         if plot_in_jd:
             set_jd_formatter(ax)
-        # print("on_xlims_change(): ", ax.get_xlim())
+            ax.tick_params(axis='x', labelrotation=0)  # (ax.clear() keeps any earlier rotation)
+        else:
+            # Improve default formatter's poor day spacing:
+            x_locator = mpldates.AutoDateLocator()
+            # TODO: remove too-close ticks here (low-priority).
+            ax.xaxis.set_major_locator(x_locator)
+            x_formatter = mpldates.AutoDateFormatter(x_locator)
+            # Quick improvements to x-axis tick labels in calendar mode:
+            x_formatter.scaled[1 / 24.0] = '%m-%d %H:%M'
+            x_formatter.scaled[1 / (24.0 * 60.0)] = '%m-%d %H:%M'
+            ax.xaxis.set_major_formatter(x_formatter)
+
+            # Rotate all tick labels for readability (date-based labels can be long):
+            ax.tick_params(axis='x', labelrotation=30)
+            for label in ax.get_xticklabels():  # list of matplotlib 'Text' objects
+                label.set_ha("right")
+
+        # Used for zoom/pan...declare and register callbacks (ax.clear() removes any earlier ones):
+        def on_xlims_change(axes):
+            if plot_in_jd:
+                set_jd_formatter(ax)
+            self.update_artist_data()  # refine level of detail for new x-range.
+            # print("on_xlims_change(): ", ax.get_xlim())
+
+        def on_ylims_change(axes):
+            # print("on_ylims_change(): ", ax.get_ylim())
+            pass
 
-    def on_ylims_change(axes):
-        # print("on_ylims_change(): ", ax.get_ylim())
-        pass
+        ax.callbacks.connect('xlim_changed', on_xlims_change)
+        ax.callbacks.connect('ylim_changed', on_ylims_change)
+        self.ax = ax
+        self.plot_data = plot_data
+        self.plot_in_jd = plot_in_jd
 
-    ax.callbacks.connect('xlim_changed', on_xlims_change)
-    ax.callbacks.connect('ylim_changed', on_ylims_change)
 
-    # Must be last statement of this function:
-    canvas.draw()
-    pass
+class BandArtists:
+    """  The matplotlib artists drawing one band: points, errorbars (bars and caps), and highlights of
+         the selected observer's points. Data can be swapped and visibility flipped without re-creating them.
+    """
+    def __init__(self, ax, band, x, mag, uncert, is_observer):
+        """  Constructor: make artists and add them to ax (autoscaling is done by LightCurvePlot instead).
+        :param ax: axes to draw on [matplotlib Axes object].
+        :param band: AAVSO band code [string].
+        :param x: x values (JD or matplotlib date number) [numpy float array].
+        :param mag: magnitudes [numpy float array].
+        :param uncert: uncertainties, all >= 0 [numpy float array].
+        :param is_observer: True iff point is from the selected observer [numpy boolean array].
+        """
+        empty_offsets = np.zeros((0, 2))
+        self.points = ax.scatter(x=x, y=mag,
+                                 color=BAND_DEFAULT_COLORS.get(band, BAND_DEFAULT_COLOR_DEFAULT),
+                                 marker=BAND_MARKERS.get(band, BAND_MARKERS_DEFAULT),
+                                 s=25, alpha=0.9, zorder=+1000)  # zorder->on top.
+        self.errorbars = LineCollection([], colors='gray', alpha=1,
+                                        zorder=+900)  # zorder->behind datapoint markers, above grid.
+        ax.add_collection(self.errorbars, autolim=False)
+        self.caps, = ax.plot([], [], linestyle='none', marker='_', markersize=2 * ERRORBAR_CAPSIZE,
+                             color='gray', alpha=1, zorder=+900, scalex=False, scaley=False)
+        self.highlights = ax.scatter(x=empty_offsets[:, 0], y=empty_offsets[:, 1],
+                                     color=HIGHLIGHT_COLOR, marker='o',
+                                     s=200, alpha=0.75, zorder=+800)  # under point marker and errorbar.
+        self.set_data(x, mag, uncert, is_observer)
+
+    def set_data(self, x, mag, uncert, is_observer):
+        """  Swap in new data (same meanings as for constructor), keeping the same artists. """
+        self.points.set_offsets(np.column_stack([x, mag]))
+        self.errorbars.set_segments(np.stack([np.column_stack([x, mag - uncert]),
+                                              np.column_stack([x, mag + uncert])], axis=1))
+        self.caps.set_data(np.concatenate([x, x]), np.concatenate([mag - uncert, mag + uncert]))
+        self.highlights.set_offsets(np.column_stack([x[is_observer], mag[is_observer]]))
+
+    def set_visible(self, show_band, show_errorbars, show_highlights):
+        """  Show or hide this band's artists.
+        :param show_band: True iff this band is to be shown at all [boolean].
+        :param show_errorbars: True iff errorbars are to be shown with points [boolean].
+        :param show_highlights: True iff selected observer's points are to be highlighted [boolean].
+        """
+        self.points.set_visible(show_band)
+        self.errorbars.set_visible(show_band and show_errorbars)
+        self.caps.set_visible(show_band and show_errorbars)
+        self.highlights.set_visible(show_band and show_highlights)
+
+
+class PlotData:
+    """  Plot-ready arrays for one dataset under one combination of the options that select or transform
+         its data (as opposed to options like grid or errorbars that only change how it is drawn).
+         Holds, for every band present: x (JD, or matplotlib date number), magnitude, cleaned uncertainty,
+         and whether each point is from the selected observer.
+    """
+    def __init__(self, adf, show_lessthans, observer_code, plot_observer_only, plot_in_jd):
+        """  Constructor.
+        :param adf: one star's observations [ArrayDataFrame object].
+        :param show_lessthans: True to include "less-than" datapoints, else omit [boolean].
+        :param observer_code: observer code selected ('' means none) [string].
+        :param plot_observer_only: True iff only observations from observer_code to be included [boolean].
+        :param plot_in_jd: True for x in Julian Date, False for x in matplotlib date numbers [boolean].
+        """
+        jds, mags = adf.array('JD'), adf.array('mag')
+        uncert = adf.array('uncert')
+        uncert = np.where(np.isnan(uncert), 0.0, uncert)  # set any missing values to zero.
+        uncert = np.maximum(0.0, uncert)  # set any negatives to zero.
+
+        # Select rows via group indices, which are built once per dataset:
+        band_index = adf.group_index('band')
+        is_observer = adf.group_index('by').mask(observer_code, ignore_case=True)
+        is_shown = None  # None means every row is shown.
+        if not show_lessthans:
+            is_shown = adf.group_index('fainterThan').mask('0')  # remove less-than observations.
+        if plot_observer_only:
+            is_shown = is_observer if is_shown is None else is_shown & is_observer
+
+        self.bands = dict()  # band -> (x, mag, uncert, is_observer), each a numpy array sorted by x.
+        self.band_rows = dict()  # band -> index (in adf) of each of the band's points.
+        jd_index = adf.jd_index()
+        for band in band_index.values():
+            rows = jd_index.rows(band=band)  # sorted by JD, so that x ranges are found by binary search.
+            if is_shown is not None:
+                rows = rows[is_shown[rows]]
+            if len(rows) >= 1:
+                if plot_in_jd:
+                    x = jds[rows]  # use Julian Dates just as they are.
+                else:
+                    x = util.date_numbers_from_jds(jds[rows], date_number_epoch_jd())
+                self.bands[band] = (x, mags[rows], uncert[rows], is_observer[rows])
+                self.band_rows[band] = rows
+
+    def x_range_slice(self, band, x_low=None, x_high=None):
+        """  Return slice selecting this band's points within an x range (inclusive), by binary search.
+        :param band: band [string, must be in self.bands].
+        :param x_low: lowest x wanted, or None for no lower limit [float].
+        :param x_high: highest x wanted, or None for no upper limit [float].
+        :return: [slice object].
+        """
+        return slice(*util.jd_range_slice(self.bands[band][0], x_low, x_high))
+
+    def count(self, bands, x_low=None, x_high=None):
+        """  Return number of points of each band within an x range (inclusive), in O(log n) per band.
+        :param bands: bands to count [list of strings].
+        :param x_low: lowest x wanted, or None for no lower limit [float].
+        :param x_high: highest x wanted, or None for no upper limit [float].
+        :return: number of points, for each band having any points at all [dict of band:int].
+        """
+        counts = dict()
+        for band in bands:
+            if band in self.bands:
+                range_slice = self.x_range_slice(band, x_low, x_high)
+                counts[band] = range_slice.stop - range_slice.start
+        return counts
+
+    def y_limits(self, bands, include_uncert=False, x_low=None, x_high=None):
+        """  Return magnitude limits spanning all points in bands within an x range, with a 5% margin
+             each side (as matplotlib autoscaling would give), or (None, None) if there are no such points.
+        :param bands: bands to include [list of strings].
+        :param include_uncert: True iff limits are to span errorbars too [boolean].
+        :param x_low: lowest x to include, or None for no lower limit [float].
+        :param x_high: highest x to include, or None for no upper limit [float].
+        :return: lowest and highest magnitude [2-tuple of floats, or of None].
+        """
+        lows, highs = [], []
+        for band in bands:
+            if band in self.bands:
+                _, mag, uncert, _ = self.bands[band]
+                range_slice = self.x_range_slice(band, x_low, x_high)
+                mag, uncert = mag[range_slice], uncert[range_slice]
+                is_valid = ~np.isnan(mag)
+                if np.any(is_valid):
+                    mag, uncert = mag[is_valid], uncert[is_valid]
+                    lows.append(np.min(mag - uncert if include_uncert else mag))
+                    highs.append(np.max(mag + uncert if include_uncert else mag))
+        if len(lows) == 0:
+            return None, None
+        y_low, y_high = float(min(lows)), float(max(highs))
+        margin = 0.05 * (y_high - y_low) if y_high > y_low else 0.5
+        return y_low - margin, y_high + margin
+
+
+class PointIndex:
+    """  Points on a plot, indexed by a grid of square cells over a display-coordinate (pixel) rectangle,
+         so that the point nearest a pixel is found by searching only the 3 x 3 cells around it:
+         constant time however many points there are. Points outside the rectangle are not indexed.
+    """
+    def __init__(self, x, y, bounds, cell_size):
+        """  Constructor.
+        :param x: x of each point, in display coordinates [numpy float array].
+        :param y: y of each point, in display coordinates [numpy float array].
+        :param bounds: (left, bottom, width, height) of rectangle to index, e.g. axes' bbox.bounds [4-tuple].
+        :param cell_size: width of grid cells, at least the largest distance to be searched [float].
+        """
+        left, bottom, width, height = bounds
+        self.left, self.bottom, self.cell_size = left, bottom, cell_size
+        self.n_cells_x = int(width // cell_size) + 1
+        self.n_cells_y = int(height // cell_size) + 1
+        is_inside = (x >= left) & (x <= left + width) & (y >= bottom) & (y <= bottom + height)  # (not nan)
+        points = np.flatnonzero(is_inside)
+        cells = ((x[points] - left) // cell_size).astype(np.int64) * self.n_cells_y + \
+            ((y[points] - bottom) // cell_size).astype(np.int64)
+        order = np.argsort(cells, kind='stable')
+        self.points = points[order]  # indices of points (in x, y), grouped by cell.
+        self.x, self.y = x[self.points], y[self.points]
+        counts = np.bincount(cells, minlength=self.n_cells_x * self.n_cells_y)
+        self.cell_starts = np.concatenate([[0], np.cumsum(counts)])  # where each cell's points start.
+
+    def nearest(self, x, y, max_distance):
+        """  Return the point nearest (x, y), or None if none is within max_distance.
+        :param x: x in display coordinates [float].
+        :param y: y in display coordinates [float].
+        :param max_distance: farthest a point may be, at most cell_size [float].
+        :return: index of point, in x and y as given to constructor [int, or None].
+        """
+        i_cell_x = int((x - self.left) // self.cell_size)
+        i_cell_y = int((y - self.bottom) // self.cell_size)
+        i_cell_y_low, i_cell_y_high = max(0, i_cell_y - 1), min(self.n_cells_y - 1, i_cell_y + 1)
+        if i_cell_y_low > i_cell_y_high:
+            return None
+        candidates = []
+        for i_column in range(max(0, i_cell_x - 1), min(self.n_cells_x - 1, i_cell_x + 1) + 1):
+            # This column's 3 cells are consecutive in the grid, so their points are too:
+            start = self.cell_starts[i_column * self.n_cells_y + i_cell_y_low]
+            stop = self.cell_starts[i_column * self.n_cells_y + i_cell_y_high + 1]
+            candidates.append(np.arange(start, stop))
+        if len(candidates) == 0:
+            return None
+        candidates = np.concatenate(candidates)
+        if len(candidates) == 0:
+            return None
+        distances_squared = (self.x[candidates] - x) ** 2 + (self.y[candidates] - y) ** 2
+        i_nearest = int(np.argmin(distances_squared))
+        if distances_squared[i_nearest] > max_distance ** 2:
+            return None
+        return int(self.points[candidates[i_nearest]])
+
+
+def describe_observation(adf, row):
+    """  Return a one-line description of one observation, e.g. for a status bar:
+         observer code (and name), band, magnitude with uncertainty, and comment; any absent value omitted.
+    :param adf: observations [ArrayDataFrame object].
+    :param row: index of observation's row [int].
+    :return: [string].
+    """
+    def value(column_name):
+        if column_name not in adf.dict:
+            return ''
+        return str(adf.dict[column_name][row]).strip()
+    observer = value('by') + (' (' + value('obsName') + ')' if value('obsName') != '' else '')
+    magnitude = ''
+    if 'mag' in adf.dict and not np.isnan(adf.array('mag')[row]):
+        magnitude = '{:.3f}'.format(adf.array('mag')[row])
+        if value('fainterThan') == '1':
+            magnitude = '<' + magnitude
+        if 'uncert' in adf.dict and adf.array('uncert')[row] >= 0.0:  # (not nan, nor invalid)
+            magnitude += ' \u00b1 {:.3f}'.format(adf.array('uncert')[row])
+    comment = '"' + value('comments') + '"' if value('comments') != '' else ''
+    return '   '.join(part for part in [observer, value('band'), magnitude, comment] if part != '')
+
+
+def level_of_detail_rows(x, mag, is_kept, x_low, x_high, n_columns):
+    """  Select the points of one band worth drawing at this zoom: within x_low to x_high, the faintest
+         and brightest point in each of n_columns equal-width columns (so the envelope and any outliers
+         stay visible), plus every point flagged in is_kept. If there are already few enough points,
+         all within range are selected.
+    :param x: x values of all points, ascending [numpy float array].
+    :param mag: magnitudes of all points [numpy float array].
+    :param is_kept: True for points always to be selected, e.g., a highlighted observer's
+        [numpy boolean array].
+    :param x_low: lowest x in range [float].
+    :param x_high: highest x in range [float].
+    :param n_columns: number of columns (e.g., pixel columns) spanning the range [int].
+    :return: indices of selected points, ascending [numpy integer array].
+    """
+    i_low, i_high = util.jd_range_slice(x, x_low, x_high)  # binary search, as x is sorted.
+    rows_in_range = np.arange(i_low, i_high)
+    rows_in_range = rows_in_range[~np.isnan(mag[i_low:i_high])]  # (nan magnitude is never drawn)
+    if len(rows_in_range) <= 2 * n_columns or x_high <= x_low:
+        return rows_in_range
+    columns = ((x[rows_in_range] - x_low) * (n_columns / (x_high - x_low))).astype(np.int64)
+    columns = np.minimum(columns, n_columns - 1)  # x == x_high goes into last column.
+    order = np.lexsort((mag[rows_in_range], columns))  # by column, then by magnitude within column.
+    sorted_columns = columns[order]
+    is_first_in_column = np.concatenate([[True], sorted_columns[1:] != sorted_columns[:-1]])
+    is_last_in_column = np.concatenate([sorted_columns[1:] != sorted_columns[:-1], [True]])
+    selected = rows_in_range[order[is_first_in_column | is_last_in_column]]
+    kept = rows_in_range[is_kept[rows_in_range]]
+    return np.union1d(selected, kept)
+
+
+def date_number_epoch_jd():
+    """  Return Julian Date of matplotlib's date number zero (its date epoch, which is configurable) [float].
+    """
+    return util.jd_from_datetime_utc(mpldates.num2date(0.0))
+
+
+def get_plot_data(adf, star_id, show_lessthans, observer_code, plot_observer_only, plot_in_jd):
+    """  Return plot-ready data for this dataset and these options, reusing those made for the previous
+         redraw unless the options selecting or transforming data have changed. Held with the dataset,
+         so new data (e.g., a new download) always make new plot-ready data.
+    :param adf: one star's observations [ArrayDataFrame object].
+    :param star_id: star ID being plotted [string].
+    :param show_lessthans: True to include "less-than" datapoints, else omit [boolean].
+    :param observer_code: observer code selected ('' means none) [string].
+    :param plot_observer_only: True iff only observations from observer_code to be included [boolean].
+    :param plot_in_jd: True for x in Julian Date, False for x in matplotlib date numbers [boolean].
+    :return: plot-ready data [PlotData object].
+    """
+    key = (star_id.strip().upper(), show_lessthans, observer_code.upper(), plot_observer_only, plot_in_jd)
+    previous = adf.derived.get('plot_data')
+    if previous is not None and previous[0] == key:
+        return previous[1]
+    plot_data = PlotData(adf, show_lessthans, observer_code, plot_observer_only, plot_in_jd)
+    adf.derived['plot_data'] = (key, plot_data)  # replaces any previous (one set of options held at once).
+    return plot_data
 
 
 def quit_and_destroy(window_object):
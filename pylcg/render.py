@@ -0,0 +1,162 @@
+import io
+import multiprocessing
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+import pylcg.util as util
+import pylcg.plot as plot
+
+__author__ = "Eric Dose :: New Mexico Mira Project, Albuquerque"
+
+"""  Headless (Agg backend) rendering of light curves, one at a time or many at once on worker processes.
+     Used by batch mode, and by anything else needing many plots: exports, contact sheets, thumbnails.
+     Each job's data cross to its worker as one compact buffer (ArrayDataFrame.to_buffer()),
+     and results come back in the order jobs were submitted.
+     USAGE:
+         with RenderEngine() as engine:
+             for star_id, mdf in my_stars:
+                 engine.submit(star_id, mdf, {'jd_start': 2458000, 'jd_end': 2458500}, star_id + '.png')
+             for star_id, output, error in engine.results():
+                 ...
+"""
+
+RENDER_IMAGE_FORMATS = ['png', 'pdf']
+RENDER_DEFAULT_BANDS = ['B', 'V', 'R', 'I', 'Vis.']  # as pylcg's default preferences.
+RENDER_FIGURE_SIZE = (9.60, 6.80)  # inches, as the GUI's 'smaller' plot size.
+RENDER_DPI = 100
+PLOT_COLUMNS = ['JD', 'mag', 'uncert', 'band', 'by', 'fainterThan']  # all that plotting needs.
+
+
+def render_light_curve(star_id, mdf, fullpath=None, plot_options=None, image_format='png',
+                       figure_size=RENDER_FIGURE_SIZE, dpi=RENDER_DPI):
+    """  Render one star's light curve, headless (Agg backend), to an image file or to image bytes.
+    :param star_id: star ID to plot [string].
+    :param mdf: star's observations; if it has no rows, raises ValueError [MiniDataFrame or ArrayDataFrame
+        object].
+    :param fullpath: image file to write, or None to return image bytes instead [string].
+    :param plot_options: keyword arguments for plot.redraw_plot(), e.g., bands_to_plot, plot_in_jd,
+        jd_start, jd_end [dict].
+    :param image_format: 'png' or 'pdf' [string].
+    :param figure_size: width and height in inches [2-tuple of floats].
+    :param dpi: resolution of raster images, in dots per inch [int].
+    :return: fullpath of image file written, or image if fullpath is None [string, or bytes].
+    """
+    if mdf.dict is None or mdf.len() == 0:
+        raise ValueError('no observations to plot for ' + star_id)
+    plot_options = dict() if plot_options is None else dict(plot_options)
+    plot_options.setdefault('bands_to_plot', RENDER_DEFAULT_BANDS)
+    plot_options['show_popup'] = False  # never any Tk window, headless.
+    figure = Figure(figsize=figure_size, dpi=dpi)
+    figure.add_subplot(111)
+    canvas = FigureCanvasAgg(figure)
+    plot.redraw_plot(canvas, mdf, star_id, **plot_options)
+    if fullpath is not None:
+        figure.savefig(fullpath, format=image_format, dpi=dpi)
+        return fullpath
+    image = io.BytesIO()
+    figure.savefig(image, format=image_format, dpi=dpi)
+    return image.getvalue()
+
+
+def plot_columns_only(mdf):
+    """  Return array-backed copy of only those columns plotting needs, so that little data need be sent
+         to a worker process.
+    :param mdf: observations [MiniDataFrame or ArrayDataFrame object].
+    :return: observations, plotting columns only [ArrayDataFrame object].
+    """
+    adf = util.ArrayDataFrame.from_minidataframe(mdf)
+    return util.ArrayDataFrame(OrderedDict((column_name, adf.dict[column_name])
+                                           for column_name in PLOT_COLUMNS if column_name in adf.dict))
+
+
+class RenderEngine:
+    """  Renders light-curve jobs on a pool of worker processes (or in this process, if workers=0).
+         Submit jobs with submit(); collect (star_id, output, error) results with results(),
+         always in submission order, each as soon as it and all jobs before it are done.
+    """
+    def __init__(self, workers=None, figure_size=RENDER_FIGURE_SIZE, dpi=RENDER_DPI):
+        """  Constructor.
+        :param workers: number of worker processes, None for one per CPU core,
+            or 0 to render in this process [int].
+        :param figure_size: default width and height in inches [2-tuple of floats].
+        :param dpi: default resolution of raster images, in dots per inch [int].
+        """
+        self.figure_size = figure_size
+        self.dpi = dpi
+        if workers == 0:
+            self.pool = None
+        else:
+            self.pool = ProcessPoolExecutor(max_workers=workers,
+                                            mp_context=multiprocessing.get_context('spawn'))
+        self.pending = deque()  # (star_id, Future) per job submitted but not yet returned by results().
+
+    def submit(self, star_id, mdf, plot_options=None, fullpath=None, image_format='png',
+               figure_size=None, dpi=None):
+        """  Queue one light curve for rendering; parameters as for render_light_curve(),
+             figure_size and dpi defaulting to this engine's. Returns at once.
+        :return: [None]
+        """
+        figure_size = self.figure_size if figure_size is None else figure_size
+        dpi = self.dpi if dpi is None else dpi
+        args = (star_id, plot_columns_only(mdf).to_buffer(), plot_options, fullpath, image_format,
+                figure_size, dpi)
+        if self.pool is None:
+            future = Future()
+            try:
+                future.set_result(_render_job(*args))
+            except Exception as e:
+                future.set_exception(e)
+        else:
+            future = self.pool.submit(_render_job, *args)
+        self.pending.append((star_id, future))
+
+    def results(self, block=True):
+        """  Yield results of submitted jobs, in submission order.
+        :param block: True to wait for every job; False to yield only those ready now
+            (stopping at the first job not yet done) [boolean].
+        :return: one (star_id, output, error) per job, output being as render_light_curve() returns
+            (None on failure), error being None or a message [generator of 3-tuples].
+        """
+        while len(self.pending) >= 1:
+            star_id, future = self.pending[0]
+            if not block and not future.done():
+                return
+            self.pending.popleft()
+            try:
+                yield star_id, future.result(), None
+            except Exception as e:
+                yield star_id, None, 'render failed: ' + str(e)
+
+    def map(self, jobs, **kwargs):
+        """  Submit many jobs, yielding results in order as they complete.
+        :param jobs: (star_id, mdf, plot_options, fullpath) per job [iterable of 4-tuples].
+        :param kwargs: image_format, figure_size, dpi as for submit(), applied to every job.
+        :return: one (star_id, output, error) per job, in order [generator of 3-tuples].
+        """
+        for star_id, mdf, plot_options, fullpath in jobs:
+            self.submit(star_id, mdf, plot_options, fullpath, **kwargs)
+            yield from self.results(block=False)
+        yield from self.results()
+
+    def close(self):
+        """  Wait for jobs in progress, then stop worker processes. """
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _render_job(star_id, buffer, plot_options, fullpath, image_format, figure_size, dpi):
+    """  Run one job in a worker process: unpack data buffer, render. Parameters as for
+         render_light_curve(), but with data as made by ArrayDataFrame.to_buffer() [bytes].
+    """
+    adf = util.ArrayDataFrame.from_buffer(buffer)
+    return render_light_curve(star_id, adf, fullpath, plot_options, image_format, figure_size, dpi)
@@ -1,35 +1,64 @@
+import heapq
+from math import isnan, nan
 import tkinter as tk
 import tkinter.font as tkfont
 import tkinter.ttk as ttk
 
+import numpy as np
+
 """  table_window.py
      Produces a sortable, scrollable table in a standalone window. 
      Relies on tkinter (ttk) TreeView.
+     Large tables are virtualized: only the rows in view, plus a buffer above and below, exist as TreeView
+     items, which are re-bound to other rows' values as the user scrolls; so a table opens at once
+     however many rows it has.
      This code adapted beyond any recognition by E. Dose, from code found Oct 23 2018 at:
         https://www.daniweb.com/programming/software-development/threads/350266/creating-table-in-python     
 """
 
+VIRTUAL_MIN_ROWS = 200  # tables with more rows than this are virtualized, unless caller says otherwise.
+VIRTUAL_ITEMS = 120  # TreeView items in a virtualized table (more if many rows are in view at once).
+VIRTUAL_BUFFER_ROWS = 30  # items kept beyond the view at each end, so that scrolling seldom re-binds.
+WIDTH_SAMPLE_SIZE = 20  # per column, only this many longest values (by character count) are measured.
+MAX_SORT_COLUMNS = 3  # a sort orders by the column clicked, then by up to 2 columns clicked before it.
+SORT_ARROWS = {False: ' \u25b2', True: ' \u25bc'}  # appended to sort column's header, by descending.
+
 
 class TableWindow:
-    """  Make a sortable, scrollable table in a standalone window, using ttk.TreeView"""
+    """  Make a sortable, scrollable table in a standalone window, using ttk.TreeView.
+         Data stay in a TableModel, which sorts them; TreeView items only display rows, and after a sort
+         (or a scroll, if virtual) are re-bound to the rows now in their positions.
+    """
     def __init__(self, parent, window_label, header_text, column_names, data_list,
-                 horizontal_scrollbar=False):
+                 horizontal_scrollbar=False, virtual=None, model=None):
         """  Constructor.
         :param parent: parent window from which this is called.
         :param window_label: text that goes in the window's top border [string].
         :param header_text:  text that goes in window, above table [string].
         :param column_names: names of columns, left to right [list of strings].
-        :param data_list:  data to go in table, matching column name order [list of tuples].
+        :param data_list:  data to go in table, matching column name order; numbers left as numbers
+            (int or float) sort as numbers [list of tuples].
         :param horizontal_scrollbar: True iff user wants a horizontal scrollbar[boolean].
+        :param virtual: True to virtualize table, False not to, None to virtualize only if it has
+            more than VIRTUAL_MIN_ROWS rows [boolean, or None].
+        :param model: table's data, in place of data_list (which is then ignored), e.g. to display rows
+            straight from columnar data [TableModel, or object with the same methods].
         """
         self.tree = None
+        self.vsb = None
         self.this_frame = None
         self.parent = parent
         self.window_label = window_label
         self.header_text = header_text
         self.column_names = column_names
-        self.data_list = data_list
+        self.model = TableModel(column_names, data_list) if model is None else model
         self.horizontal_scrollbar = horizontal_scrollbar
+        self.is_virtual = (len(self.model) > VIRTUAL_MIN_ROWS) if virtual is None else virtual
+        self.sort_columns = []  # (column index, descending) of current sort, primary column first.
+        self.items = []  # TreeView item IDs, displaying rows at positions row_window.start onward.
+        self.row_window = None  # which display positions are bound to items [RowWindow object].
+        self.selected_rows = set()  # model rows (indices in data_list) selected, bound to items or not.
+        self.focus_row = None  # model row having keyboard focus.
         self._layout_window()
         self._layout_table()
         self._layout_columns()
@@ -49,8 +78,15 @@ class TableWindow:
     def _layout_table(self):
         # Create a treeview with vertical scrollbar & optionally horizontal scrollbar:
         self.tree = ttk.Treeview(self.this_frame, columns=self.column_names, show="headings", padding=20)
-        vsb = ttk.Scrollbar(self.this_frame, orient="vertical", command=self.tree.yview)
-        self.tree.configure(yscrollcommand=vsb.set)
+        if self.is_virtual:
+            # Scrollbar spans all rows, not just those bound to items; see _on_scrollbar(), _on_tree_yview():
+            vsb = ttk.Scrollbar(self.this_frame, orient="vertical", command=self._on_scrollbar)
+            self.tree.configure(yscrollcommand=self._on_tree_yview)
+        else:
+            vsb = ttk.Scrollbar(self.this_frame, orient="vertical", command=self.tree.yview)
+            self.tree.configure(yscrollcommand=vsb.set)
+        self.tree.bind('<<TreeviewSelect>>', self._on_select)
+        self.vsb = vsb
         vsb.grid(column=1, row=0, sticky='ns', in_=self.this_frame)
         if self.horizontal_scrollbar:
             hsb = ttk.Scrollbar(self.this_frame, orient="horizontal", command=self.tree.xview)
@@ -61,33 +97,262 @@ class TableWindow:
         self.this_frame.grid_rowconfigure(0, weight=1)
 
     def _layout_columns(self):
-        """  Add columns to table, and initially adjust each column's width to its header string."""
-        for col in self.column_names:
-            self.tree.heading(col, text=col.title(), command=lambda c=col: self._sort_by_column(c, 0))
-            self.tree.column(col, width=tkfont.Font().measure(col.title()))
+        """  Add columns to table (numeric ones right-aligned), and set each column's width to fit its
+             header (with room for a sort arrow) and its widest values.
+             Measures with one Font only, and only each column's longest values (by character count).
+        """
+        font = tkfont.Font()
+        for ix, col in enumerate(self.column_names):
+            self.tree.heading(col, text=col.title(), command=lambda c=col: self._sort_by_column(c))
+            sample = self.model.widest_text(ix, WIDTH_SAMPLE_SIZE)
+            width = max(font.measure(text) for text in [col.title() + SORT_ARROWS[True]] + sample)
+            self.tree.column(col, width=width, anchor='e' if self.model.is_numeric(ix) else 'w')
 
     def _populate_table(self):
-        """  Add rows (items) to table, and readjust column widths. """
-        for item in self.data_list:
-            self.tree.insert('', 'end', values=item)
-            # adjust column's width if necessary to fit each value
-            # TODO: move this loop outside of item loop (in order to loop on columns, not rows).
-            for ix, val in enumerate(item):
-                col_w = tkfont.Font().measure(val)
-                if self.tree.column(self.column_names[ix], width=None) < col_w:
-                    self.tree.column(self.column_names[ix], width=col_w)
-
-    def _sort_by_column(self, col, descending):
-        """Sort contents whenever user clicks on a column header."""
-        # NB: data should be in sortable text format for this method as written.
-        data = [(self.tree.set(child, col), child)
-                for child in self.tree.get_children('')]  # get table data.
-        # Sort the data in place
-        data.sort(reverse=descending)
-        for ix, item in enumerate(data):
-            self.tree.move(item[1], '', ix)
-        # switch the heading so it will sort in the opposite direction
-        self.tree.heading(col, command=lambda col=col: self._sort_by_column(col, int(not descending)))
+        """  Add rows (items) to table: all rows, or if virtual, only enough to fill the view plus buffer. """
+        n_items = VIRTUAL_ITEMS if self.is_virtual else len(self.model)
+        self.row_window = RowWindow(len(self.model), n_items, VIRTUAL_BUFFER_ROWS)
+        self.items = [self.tree.insert('', 'end', values=self.model.display_row(position))
+                      for position in range(self.row_window.n_items)]
+
+    def refresh(self):
+        """  Display table from its top again, after model's rows have changed (e.g., been filtered).
+             Items are re-bound, and made or deleted only as the number of rows requires.
+             Rows still present stay selected.
+        """
+        n_items = max(VIRTUAL_ITEMS, len(self.items)) if self.is_virtual else len(self.model)
+        self.row_window = RowWindow(len(self.model), n_items, VIRTUAL_BUFFER_ROWS)
+        surplus_items = self.items[self.row_window.n_items:]
+        if len(surplus_items) >= 1:
+            self.tree.delete(*surplus_items)
+            self.items = self.items[:self.row_window.n_items]
+        while len(self.items) < self.row_window.n_items:
+            self.items.append(self.tree.insert('', 'end', values=()))
+        self._rebind(0)
+        self.tree.yview_moveto(0)
+
+    def _on_tree_yview(self, first, last):
+        """  Virtual table: TreeView has scrolled among its items (by mouse wheel, keys, or moveto).
+             Re-bind items if view nears either end of them; set scrollbar to view's place among all rows.
+        :param first: fraction of items above view [string, as from tkinter].
+        :param last: fraction of items above view's bottom [string, as from tkinter].
+        """
+        n_rows, n_items = len(self.model), len(self.items)
+        if n_items == 0:
+            self.vsb.set(0, 1)
+            return
+        first_row = self.row_window.start + float(first) * n_items
+        n_visible = (float(last) - float(first)) * n_items
+        is_view_grown = n_visible + 2 * self.row_window.buffer_rows > n_items and float(last) < 1.0
+        if is_view_grown and n_items < n_rows and self.tree.winfo_ismapped():
+            self._add_items(int(n_visible) + 2 * self.row_window.buffer_rows)  # e.g., window enlarged.
+        new_start = self.row_window.placement(first_row, n_visible)
+        if new_start != self.row_window.start:
+            self._rebind(new_start)
+            self.tree.yview_moveto((first_row - new_start) / len(self.items))  # calls this method again.
+            return
+        self.vsb.set(first_row / n_rows, (first_row + n_visible) / n_rows)
+
+    def _on_scrollbar(self, *args):
+        """  Virtual table: user has moved scrollbar; args as tkinter passes to a yview command. """
+        n_rows, n_items = len(self.model), len(self.items)
+        if n_items == 0:
+            return
+        first, last = self.tree.yview()
+        first_row = self.row_window.start + first * n_items
+        n_visible = (last - first) * n_items
+        if args[0] == 'moveto':
+            target_row = float(args[1]) * n_rows
+        elif args[0] == 'scroll':
+            step = max(1.0, n_visible - 1) if args[2] == 'pages' else 1.0
+            target_row = first_row + int(args[1]) * step
+        else:
+            return
+        target_row = max(0.0, min(n_rows - n_visible, target_row))
+        new_start = self.row_window.placement(target_row, n_visible)
+        if new_start != self.row_window.start:
+            self._rebind(new_start)
+        self.tree.yview_moveto((target_row - new_start) / n_items)
+
+    def _on_select(self, event=None):
+        """  Record selection and focus by model row, as items will be re-bound to other rows. """
+        bound_rows = self.model.rows_at(self.row_window.start, self.row_window.start + len(self.items))
+        item_rows = dict(zip(self.items, bound_rows))
+        self.selected_rows.difference_update(bound_rows)
+        self.selected_rows.update(item_rows[iid] for iid in self.tree.selection())
+        focus_item = self.tree.focus()
+        if focus_item in item_rows:
+            self.focus_row = item_rows[focus_item]
+
+    def _rebind(self, new_start):
+        """  Bind items to rows at display positions from new_start, carrying selection and focus along. """
+        self.row_window.start = new_start
+        for i_item, iid in enumerate(self.items):
+            self.tree.item(iid, values=self.model.display_row(new_start + i_item))
+        bound_rows = self.model.rows_at(new_start, new_start + len(self.items))
+        self.tree.selection_set([iid for (iid, row) in zip(self.items, bound_rows)
+                                 if row in self.selected_rows])
+        if self.focus_row in bound_rows:
+            self.tree.focus(self.items[bound_rows.index(self.focus_row)])
+
+    def _add_items(self, n_items):
+        """  Virtual table: make more items, e.g., when enlarged window shows more rows at once. """
+        n_items = self.row_window.resize(n_items)
+        while len(self.items) < n_items:
+            self.items.append(self.tree.insert('', 'end', values=self.model.display_row(len(self.items))))
+        self._rebind(self.row_window.start)
+
+    def _sort_by_column(self, col):
+        """  Sort whenever user clicks on a column header: by that column, then (to break ties) by the
+             columns clicked before it. Clicking the primary column again reverses its order.
+             Sorting is done by the model; only items (not all rows) are then re-bound.
+        """
+        ix = self.column_names.index(col)
+        if len(self.sort_columns) >= 1 and self.sort_columns[0][0] == ix:
+            self.sort_columns[0] = (ix, not self.sort_columns[0][1])
+        else:
+            earlier_columns = [(i, descending) for (i, descending) in self.sort_columns if i != ix]
+            self.sort_columns = [(ix, False)] + earlier_columns[:MAX_SORT_COLUMNS - 1]
+        self.model.sort(self.sort_columns)
+        self._rebind(self.row_window.start)
+        primary_ix, primary_descending = self.sort_columns[0]
+        for i, column_name in enumerate(self.column_names):
+            arrow = SORT_ARROWS[primary_descending] if i == primary_ix else ''
+            self.tree.heading(column_name, text=column_name.title() + arrow)
+
+
+class TableModel:
+    """  A table's data, held Python-side with its current display order, so that sorting never reads
+         values back from (nor moves items in) the TreeView. A column whose values are all numbers
+         (int or float; None or nan for missing) is numeric, and sorts as numbers; other columns sort
+         as text, ignoring case. Each column's sort key is made once, on the first sort by that column.
+    """
+    def __init__(self, column_names, rows):
+        """  Constructor.
+        :param column_names: names of columns, left to right [list of strings].
+        :param rows: values of each row, matching column name order [list of tuples].
+        """
+        self.column_names = list(column_names)
+        self.rows = [tuple(row) for row in rows]
+        self.order = list(range(len(self.rows)))  # index (in self.rows) of row at each display position.
+        self._is_numeric = dict()  # column index -> True iff numeric.
+        self._sort_keys = dict()  # column index -> sort key of each row [numpy float array].
+
+    def __len__(self):
+        return len(self.rows)
+
+    def is_numeric(self, ix):
+        """  Return True iff column ix holds at least one number, and only numbers (None or nan
+             for missing) [boolean].
+        """
+        if ix not in self._is_numeric:
+            values = [row[ix] for row in self.rows if row[ix] is not None]
+            self._is_numeric[ix] = len(values) >= 1 and \
+                all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in values)
+        return self._is_numeric[ix]
+
+    def widest_text(self, ix, n):
+        """  Return the n longest of column ix's values as displayed, for measuring column width [list]. """
+        return widest_values([format_cell(row[ix]) for row in self.rows], n)
+
+    def display_row(self, position):
+        """  Return values of row now at this display position, as displayed [tuple of strings]. """
+        return tuple(format_cell(value) for value in self.rows[self.order[position]])
+
+    def rows_at(self, start, stop):
+        """  Return indices (in self.rows) of rows now at display positions start to stop - 1 [list]. """
+        return self.order[start:stop]
+
+    def sort_key(self, ix):
+        """  Return column ix's sort key: each row's number, or for a text column, each row's rank among
+             its distinct values; nan for missing numbers [numpy float array].
+        """
+        if ix not in self._sort_keys:
+            if self.is_numeric(ix):
+                key = np.array([nan if row[ix] is None else row[ix] for row in self.rows], dtype=np.float64)
+            else:
+                texts = [format_cell(row[ix]).casefold() for row in self.rows]
+                _, ranks = np.unique(np.array(texts, dtype=object), return_inverse=True)
+                key = ranks.reshape(-1).astype(np.float64)
+            self._sort_keys[ix] = key
+        return self._sort_keys[ix]
+
+    def sort(self, sort_columns):
+        """  Put rows in order of several columns at once (stable: rows equal in all of them keep
+             their original order); missing numbers go last, whether ascending or descending.
+        :param sort_columns: (column index, descending) for each sort column, primary first
+            [list of 2-tuples of (int, boolean)].
+        :return: [None]
+        """
+        keys = []
+        for ix, descending in reversed(sort_columns):  # (np.lexsort sorts by its last key first)
+            key = -self.sort_key(ix) if descending else self.sort_key(ix)
+            keys.append(np.where(np.isnan(key), np.inf, key))
+        if len(keys) == 0 or len(self.rows) == 0:
+            self.order = list(range(len(self.rows)))
+        else:
+            self.order = np.lexsort(keys).tolist()
+
+
+def format_cell(value):
+    """  Return value as displayed in a table cell: numbers plainly, None and nan as blank [string]. """
+    if value is None or (isinstance(value, float) and isnan(value)):
+        return ''
+    if isinstance(value, float):
+        return '{:.6g}'.format(value)
+    return str(value)
+
+
+class RowWindow:
+    """  Arithmetic of a virtualized table: n_items TreeView items are bound to the consecutive data rows
+         start to start + n_items - 1, out of n_rows in all. Decides when and where to move that window
+         of rows, so that rows in view always have at least buffer_rows bound rows beyond them (except
+         at either end of the table). Rows in view are given as floats, as TreeView scrolls fractionally.
+    """
+    def __init__(self, n_rows, n_items, buffer_rows):
+        """  Constructor.
+        :param n_rows: data rows in table [int].
+        :param n_items: items wanted; fewer if table has fewer rows [int].
+        :param buffer_rows: bound rows wanted beyond view at each end [int].
+        """
+        self.n_rows = n_rows
+        self.n_items = min(n_items, n_rows)
+        self.buffer_rows = buffer_rows
+        self.start = 0  # data row bound to first item.
+
+    def resize(self, n_items):
+        """  Change number of items (at most n_rows), moving start back if needed.
+        :return: new number of items [int].
+        """
+        self.n_items = min(max(n_items, self.n_items), self.n_rows)
+        self.start = min(self.start, self.n_rows - self.n_items)
+        return self.n_items
+
+    def placement(self, first_row, n_visible):
+        """  Return where window should start, for rows first_row to first_row + n_visible to be in view:
+             current start if they are already well inside window, else start that centers them.
+        :param first_row: data row at top of view (may be fractional) [float].
+        :param n_visible: number of rows view shows [float].
+        :return: data row to be bound to first item [int].
+        """
+        stop = self.start + self.n_items
+        last_row = first_row + n_visible
+        room_above_ok = self.start == 0 or first_row - self.start >= self.buffer_rows
+        room_below_ok = stop == self.n_rows or stop - last_row >= self.buffer_rows
+        if room_above_ok and room_below_ok and self.start <= first_row and last_row <= stop:
+            return self.start
+        centered_start = int(round(first_row - (self.n_items - n_visible) / 2))
+        return max(0, min(self.n_rows - self.n_items, centered_start))
+
+
+def widest_values(values, n):
+    """  Return the n longest of values (by character count), as strings, for measuring a column's width
+         without measuring every cell.
+    :param values: one column's values [list].
+    :param n: how many to return (fewer if fewer values) [int].
+    :return: [list of strings].
+    """
+    return heapq.nlargest(n, (str(value) for value in values), key=len)
 
 
 # Local data (for local testing only):
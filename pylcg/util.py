@@ -1,12 +1,28 @@
 from datetime import datetime, timezone, timedelta
 from collections import OrderedDict   # OrderedDict removes duplicates while preserving order
 #                                       (NB: in py 3.7+, native python dictionaries will do this too.)
+import json
+import struct
 import urllib.request
+from itertools import islice, compress
 from math import nan
 
+import numpy as np
+
 
 __author__ = "Eric Dose :: New Mexico Mira Project, Albuquerque"
 
+STREAM_CHUNK_LINES = 4096  # lines parsed together by MiniDataFrame.from_stream().
+ARRAY_FLOAT_COLUMNS = ['JD', 'mag', 'uncert']  # held by ArrayDataFrame as numpy float64 arrays.
+CATEGORICAL_COLUMNS = ['band', 'by', 'obsName', 'obsAffil', 'obsCountry',
+                       'fainterThan']  # held by ArrayDataFrame as Categorical objects.
+CATEGORICAL_CODE_DTYPE = np.int32
+BUFFER_HEADER_LENGTH_STRUCT = struct.Struct('<I')  # prefixes ArrayDataFrame.to_buffer() header.
+OBSERVER_KEY_COLUMNS = ['by', 'obsName', 'obsAffil', 'obsCountry']  # together identify one observer.
+OBS_TEXT_COLUMNS = ['by', 'obsName', 'comments', 'comCode', 'charts', 'compStar1',
+                    'compStar2']  # searched by ObsFilter's text filter, where present.
+DATE_NUMBER_EPOCH_JD = 2440587.5  # JD of 1970-01-01T00:00 UTC, matplotlib's default date epoch.
+
 
 def make_safe_star_id(star_id):
     """  Make a star id that is safe to include in a URL.
@@ -42,6 +58,25 @@ def datetime_utc_from_jd(jd=None):
     return datetime_j2000 + timedelta(seconds=seconds_since_j2000)
 
 
+def date_numbers_from_jds(jds, epoch_jd=DATE_NUMBER_EPOCH_JD):
+    """  Converts Julian Dates to date numbers (days since an epoch, as matplotlib plots dates) in one
+         affine transform over the whole array, with no datetime objects made.
+    :param jds: Julian dates to be converted [numpy float array, or list of floats].
+    :param epoch_jd: Julian Date of date number zero; default is matplotlib's default epoch [float].
+    :return: date numbers [numpy float64 array].
+    """
+    return np.asarray(jds, dtype=np.float64) - epoch_jd
+
+
+def jds_from_date_numbers(date_numbers, epoch_jd=DATE_NUMBER_EPOCH_JD):
+    """  Converts date numbers back to Julian Dates; inverse of date_numbers_from_jds().
+    :param date_numbers: days since epoch [numpy float array, or list of floats].
+    :param epoch_jd: Julian Date of date number zero; default is matplotlib's default epoch [float].
+    :return: Julian dates [numpy float64 array].
+    """
+    return np.asarray(date_numbers, dtype=np.float64) + epoch_jd
+
+
 def jd_now():
     """  Returns Julian date of moment this function is called. Imported from photrix (E. Dose).
     :return: Julian date for immediate present per system clock [float].
@@ -139,6 +174,73 @@ def get_star_ids_from_upload_file(fullpath):
     return star_ids
 
 
+def floats_from_strings(strings):
+    """  Convert strings to floats; any string that can't be converted becomes math.nan.
+    :param strings: values to convert [iterable of strings].
+    :return: converted values [list of floats].
+    """
+    strings = list(strings)
+    try:
+        return list(map(float, strings))  # fast path: every value converts.
+    except ValueError:
+        floats = []
+        for x in strings:
+            try:
+                float_x = float(x)
+            except ValueError:
+                float_x = nan
+            floats.append(float_x)
+        return floats
+
+
+def split_stream(byte_lines, delimiter):
+    """  Split delimited text into columns a modest chunk of lines at a time: fast (the per-value work
+         is done by built-ins), yet never holds more than one chunk of text.
+    :param byte_lines: lines of delimited text, header line first [iterable of bytes].
+    :param delimiter: delimiter between values within each line [string].
+    :return: (column_names, chunks), where chunks yields, for each chunk of lines, one tuple of raw
+        (unstripped) string values per column; column_names is None if no header line
+        [2-tuple of (list of strings, generator of lists of tuples)].
+    """
+    lines = iter(byte_lines)
+    header_line = next(lines, None)
+    if header_line is None:
+        return None, iter([])
+    column_names = [column_name.strip() for column_name in header_line.decode('utf-8').split(delimiter)]
+    n_columns = len(column_names)
+
+    def chunks():
+        while True:
+            chunk = list(islice(lines, STREAM_CHUNK_LINES))
+            if len(chunk) == 0:
+                return
+            chunk_columns = split_lines(chunk, delimiter, n_columns)
+            if chunk_columns is not None:
+                yield chunk_columns
+    return column_names, chunks()
+
+
+def split_lines(byte_lines, delimiter, n_columns):
+    """  Split a chunk of delimited data lines (no header) into columns.
+    :param byte_lines: lines of delimited text [list of bytes].
+    :param delimiter: delimiter between values within each line [string].
+    :param n_columns: number of columns; short lines are padded with '' [int].
+    :return: one tuple of raw (unstripped) string values per column, or None if no non-blank lines
+        [list of tuples].
+    """
+    rows = []
+    for line in byte_lines:
+        values = line.decode('utf-8').split(delimiter)
+        if len(values) < n_columns:
+            if line.strip() == b'':
+                continue  # skip blank lines (e.g., at end of text).
+            values.extend([''] * (n_columns - len(values)))
+        rows.append(values)
+    if len(rows) == 0:
+        return None
+    return list(zip(*rows))
+
+
 class TargetList:
     """  List of targets to service the Target 'Prev' and 'Next' buttons [list of strings]."""
     def __init__(self, target_or_list=None):
@@ -217,6 +319,15 @@ class TargetList:
             return None
         return self.targets[self.target_index]
 
+    def neighbors(self, n_next=1, n_prev=1):
+        """  Return targets likely to be wanted soon: up to n_next after current position (nearest first),
+             then up to n_prev before it (nearest first). Does not change current position. """
+        if self.is_empty() or self.target_index is None:
+            return []
+        next_targets = self.targets[self.target_index + 1:self.target_index + 1 + n_next]
+        prev_targets = self.targets[max(0, self.target_index - n_prev):self.target_index][::-1]
+        return next_targets + prev_targets
+
 
 class Error(Exception):
     pass
@@ -286,41 +397,41 @@ class MiniDataFrame:
         :param column_name: name of column to convert to floats [string].
         :return: No return; changes this MiniDataFrame object in-place.
         """
-        floats = []
-        for x in self.column(column_name):
-            try:
-                float_x = float(x)
-            except ValueError:
-                float_x = nan
-            floats.append(float_x)
-        self.dict[column_name] = floats
+        self.dict[column_name] = floats_from_strings(self.column(column_name))
 
     @staticmethod
-    def from_url(url, delimiter):
+    def from_url(url, delimiter, float_columns=None):
         """  Constructor: read data from url, parse into MiniDataFrame object, and return it.
         :param url: URL from which to get data [string].
         :param delimiter: delimiter to use in making request [1-character string].
+        :param float_columns: names of columns to parse directly to floats [list of strings, or None].
         :return: newly constructed object [MiniDataFrame object].
         """
-        # get nested list of data from URL:
-        byte_text = urllib.request.urlopen(url)
-        text = [line.decode('utf-8') for line in byte_text]
-        # reader = csv.reader(text, delimiter=delimiter)
-        # data = [row for row in reader]
-        data = [line.split(delimiter) for line in text]
-        # return data
-        # Now, parse nested list into a dict:
-        this_dict = dict()
-        if len(data) == 0:
+        return MiniDataFrame.from_stream(urllib.request.urlopen(url), delimiter, float_columns)
+
+    @staticmethod
+    def from_stream(byte_lines, delimiter, float_columns=None):
+        """  Constructor: parse delimited text into MiniDataFrame object incrementally as it is read,
+             appending values directly to their columns. No copy of the whole text is ever held.
+        :param byte_lines: lines of delimited text, header line first, e.g. a urllib response object
+            [iterable of bytes].
+        :param delimiter: delimiter between values within each line [string].
+        :param float_columns: names of columns to parse directly to floats (math.nan where not possible),
+            as to_float() would do later [list of strings, or None].
+        :return: newly constructed object, or None if no header line [MiniDataFrame object].
+        """
+        column_names, chunks = split_stream(byte_lines, delimiter)
+        if column_names is None:
             return None
-        column_names = []
-        for column_name in data[0]:
-            column_names.append(column_name.strip())
-            this_dict[column_name.strip()] = []
-        for row in data[1:]:
-            for i_col, column_name in enumerate(column_names):
-                this_dict[column_name].append(row[i_col].strip())
-        return MiniDataFrame(this_dict)
+        float_columns = [] if float_columns is None else float_columns
+        columns = [[] for _ in column_names]
+        for chunk_columns in chunks:
+            for column, column_name, values in zip(columns, column_names, chunk_columns):
+                if column_name in float_columns:
+                    column.extend(floats_from_strings(values))
+                else:
+                    column.extend(map(str.strip, values))
+        return MiniDataFrame(dict(zip(column_names, columns)))
 
     def row_subset(self, boolean_list):
         """  Return new MiniDataFrame object with rows selected by boolean_list; rows are copies.
@@ -336,3 +447,686 @@ class MiniDataFrame:
             new_list = [item for (item, boolean) in zipped if boolean is True]
             new_dict[column_name] = new_list
         return MiniDataFrame(new_dict)
+
+
+class Categorical:
+    """  Column of often-repeated strings, held as integer codes (one per row) into a lookup table
+         of the unique values (categories). Iterates, indexes and measures like the list it replaces.
+    """
+    def __init__(self, codes, categories):
+        """  Constructor.
+        :param codes: index into categories, one per row [numpy integer array].
+        :param categories: unique values, each held only once [list of strings].
+        """
+        self.codes = codes
+        self.categories = categories
+
+    @classmethod
+    def from_values(cls, values):
+        """  Constructor: encode values, categories in order of first appearance.
+        :param values: one value per row [iterable of strings].
+        :return: newly constructed object [Categorical object].
+        """
+        code_lookup = dict()
+        codes = [code_lookup.setdefault(value, len(code_lookup)) for value in values]
+        return cls(np.array(codes, dtype=CATEGORICAL_CODE_DTYPE), list(code_lookup.keys()))
+
+    @classmethod
+    def concatenate(cls, first, second):
+        """  Constructor: rows of first followed by rows of second, re-coding second's rows into
+             first's categories (extended by any values new in second).
+        :param first: [Categorical object].
+        :param second: [Categorical object].
+        :return: newly constructed object [Categorical object].
+        """
+        code_lookup = dict((category, code) for (code, category) in enumerate(first.categories))
+        recode = np.array([code_lookup.setdefault(category, len(code_lookup))
+                           for category in second.categories], dtype=CATEGORICAL_CODE_DTYPE)
+        second_codes = recode[second.codes] if len(second.codes) >= 1 else second.codes
+        return cls(np.concatenate([first.codes, second_codes]).astype(CATEGORICAL_CODE_DTYPE),
+                   list(code_lookup.keys()))
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __iter__(self):
+        categories = self.categories
+        return (categories[code] for code in self.codes.tolist())
+
+    def __getitem__(self, i):
+        return self.categories[self.codes[i]]
+
+    def tolist(self):
+        """  Return decoded values, one per row [list of strings]. """
+        categories = self.categories
+        return [categories[code] for code in self.codes.tolist()]
+
+    def equals(self, value, ignore_case=False):
+        """  Return mask of rows whose value equals value; compares strings once per category, not per row.
+        :param value: value to match [string].
+        :param ignore_case: True iff comparison to ignore upper/lower case [boolean].
+        :return: True for each matching row [numpy boolean array].
+        """
+        return self.isin([value], ignore_case)
+
+    def isin(self, values, ignore_case=False):
+        """  Return mask of rows whose value is any of values.
+        :param values: values to match [list of strings].
+        :param ignore_case: True iff comparison to ignore upper/lower case [boolean].
+        :return: True for each matching row [numpy boolean array].
+        """
+        if ignore_case:
+            wanted = set(v.upper() for v in values)
+            matching_codes = [code for (code, c) in enumerate(self.categories) if c.upper() in wanted]
+        else:
+            wanted = set(values)
+            matching_codes = [code for (code, c) in enumerate(self.categories) if c in wanted]
+        return np.isin(self.codes, matching_codes)
+
+    def subset(self, selector):
+        """  Return new Categorical of selected rows, sharing this one's categories.
+        :param selector: boolean mask or integer row indices [numpy array].
+        :return: subset [Categorical object].
+        """
+        return Categorical(self.codes[selector], self.categories)
+
+    def counts(self):
+        """  Return number of rows holding each category, in category order [numpy integer array]. """
+        return np.bincount(self.codes, minlength=len(self.categories))
+
+
+class GroupIndex:
+    """  Row indices for each distinct value of one Categorical column, built in a single pass
+         (one stable sort of the integer codes), so that selecting a group never rescans the dataset.
+         Row indices within each group are ascending.
+    """
+    def __init__(self, categorical):
+        """  Constructor.
+        :param categorical: column to group by [Categorical object].
+        """
+        self.categories = categorical.categories
+        self.n_rows = len(categorical)
+        self.counts = categorical.counts()
+        self.sorted_rows = np.argsort(categorical.codes, kind='stable')
+        self.starts = np.concatenate([[0], np.cumsum(self.counts)])
+
+    def _matching_codes(self, values, ignore_case=False):
+        if ignore_case:
+            wanted = set(v.upper() for v in values)
+            return [code for (code, c) in enumerate(self.categories) if c.upper() in wanted]
+        wanted = set(values)
+        return [code for (code, c) in enumerate(self.categories) if c in wanted]
+
+    def rows(self, values, ignore_case=False):
+        """  Return indices of rows holding any of values.
+        :param values: one value, or several [string, or list of strings].
+        :param ignore_case: True iff comparison to ignore upper/lower case [boolean].
+        :return: row indices, ascending [numpy integer array].
+        """
+        values = [values] if isinstance(values, str) else values
+        groups = [self.sorted_rows[self.starts[code]:self.starts[code + 1]]
+                  for code in self._matching_codes(values, ignore_case)]
+        if len(groups) == 0:
+            return np.zeros(0, dtype=self.sorted_rows.dtype)
+        if len(groups) == 1:
+            return groups[0]
+        return np.sort(np.concatenate(groups))
+
+    def mask(self, values, ignore_case=False):
+        """  Return boolean mask of rows holding any of values (as for Categorical.isin(), but touching
+             only the matching rows).
+        :param values: one value, or several [string, or list of strings].
+        :param ignore_case: True iff comparison to ignore upper/lower case [boolean].
+        :return: True for each matching row [numpy boolean array].
+        """
+        is_matching = np.zeros(self.n_rows, dtype=bool)
+        is_matching[self.rows(values, ignore_case)] = True
+        return is_matching
+
+    def values(self):
+        """  Return the values present in at least one row, in category order [list of strings]. """
+        return [category for (category, count) in zip(self.categories, self.counts.tolist()) if count > 0]
+
+
+class JDIndex:
+    """  Row indices sorted by JD, for all rows and for each band, so that the rows within any JD range
+         are found by binary search, in O(log n + k) for k rows found, rather than by scanning all rows.
+    """
+    def __init__(self, jds, band_index=None):
+        """  Constructor.
+        :param jds: JD of each row [numpy float array].
+        :param band_index: rows of each band, or None to index all rows only [GroupIndex object].
+        """
+        self.sorted_rows = np.argsort(jds, kind='stable')
+        self.sorted_jds = jds[self.sorted_rows]
+        self.band_sorted = dict()  # band -> (row indices, their JDs), both sorted by JD.
+        if band_index is not None:
+            for band in band_index.values():
+                rows = band_index.rows(band)
+                rows = rows[np.argsort(jds[rows], kind='stable')]
+                self.band_sorted[band] = (rows, jds[rows])
+
+    def _sorted(self, band):
+        if band is None:
+            return self.sorted_rows, self.sorted_jds
+        return self.band_sorted.get(band, (self.sorted_rows[:0], self.sorted_jds[:0]))
+
+    def rows(self, jd_low=None, jd_high=None, band=None):
+        """  Return indices of rows within a JD range (inclusive), sorted by JD.
+        :param jd_low: lowest JD wanted, or None for no lower limit [float].
+        :param jd_high: highest JD wanted, or None for no upper limit [float].
+        :param band: band wanted, or None for all bands [string].
+        :return: row indices [numpy integer array].
+        """
+        rows, sorted_jds = self._sorted(band)
+        i_low, i_high = jd_range_slice(sorted_jds, jd_low, jd_high)
+        return rows[i_low:i_high]
+
+    def count(self, jd_low=None, jd_high=None, band=None):
+        """  Return number of rows within a JD range (inclusive), without selecting them; as rows(). """
+        _, sorted_jds = self._sorted(band)
+        i_low, i_high = jd_range_slice(sorted_jds, jd_low, jd_high)
+        return int(i_high - i_low)
+
+
+class ObserverSummary:
+    """  Per-observer statistics of a dataset, all computed together from one grouping of the rows
+         (on integer codes: no string comparisons, and no rescan of the rows per observer):
+         observation count, counts per band, and first and latest JD. Each observer is identified by
+         the combination of code, name, affiliation and country. Observers are held in display order:
+         most observations first, then first seen first.
+    """
+    def __init__(self, adf, rows=None):
+        """  Constructor.
+        :param adf: observations, with columns JD, band and those of OBSERVER_KEY_COLUMNS [ArrayDataFrame].
+        :param rows: indices of rows to summarize, or None for all rows [numpy integer array].
+        """
+        key_categoricals = [adf.categorical(column_name) for column_name in OBSERVER_KEY_COLUMNS]
+        band_categorical = adf.categorical('band')
+        jds = adf.array('JD')
+        if rows is None:
+            rows = np.arange(len(jds))
+        key_codes = np.column_stack([categorical.codes[rows] for categorical in key_categoricals])
+        unique_keys, first_rows, key_of_row, counts = np.unique(key_codes, axis=0, return_index=True,
+                                                                 return_inverse=True, return_counts=True)
+        key_of_row = key_of_row.reshape(-1)  # (some numpy versions return it 2-D)
+        n_keys, n_bands = len(counts), len(band_categorical.categories)
+        self.bands = band_categorical.categories
+        band_counts = np.bincount(key_of_row * n_bands + band_categorical.codes[rows],
+                                  minlength=n_keys * n_bands).reshape(n_keys, n_bands)
+        if n_keys >= 1:
+            key_starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            row_jds = jds[rows][np.argsort(key_of_row, kind='stable')]  # grouped by observer.
+            first_jds = np.fmin.reduceat(row_jds, key_starts)  # (fmin, fmax ignore any nan JD)
+            latest_jds = np.fmax.reduceat(row_jds, key_starts)
+        else:
+            first_jds = latest_jds = np.zeros(0)
+        order = np.lexsort((first_rows, -counts))  # most observations first, then first seen first.
+        key_columns = [[categorical.categories[code] for code in unique_keys[order, i_column].tolist()]
+                       for (i_column, categorical) in enumerate(key_categoricals)]
+        self.obscodes, self.names, self.affiliations, self.countries = key_columns
+        self.counts = counts[order]
+        self.band_counts = band_counts[order]  # one row per observer, one column per band of self.bands.
+        self.first_jds = first_jds[order]
+        self.latest_jds = latest_jds[order]
+
+    def __len__(self):
+        return len(self.counts)
+
+    def n_obs(self):
+        """  Return total number of observations summarized [int]. """
+        return int(self.counts.sum())
+
+    def counts_by_band(self, i_observer):
+        """  Return one observer's observation counts per band, largest first.
+        :param i_observer: observer's position in this summary [int].
+        :return: (band, count) for each band observed [list of 2-tuples of (str, int)].
+        """
+        band_counts = self.band_counts[i_observer].tolist()
+        return sorted([(band, count) for (band, count) in zip(self.bands, band_counts) if count > 0],
+                      key=lambda band_and_count: -band_and_count[1])
+
+
+class ObsFilter:
+    """  Finds rows matching filters on text, band, observer and JD, without comparing strings row by row:
+         the JD range comes from the JD index by binary search, and each string filter is evaluated once
+         per distinct value (category), then applied to rows through their integer codes.
+         The latest filters and their result are kept, so that filters narrowing them (e.g., one more
+         character typed) are evaluated only on the rows already found.
+    """
+    def __init__(self, adf):
+        """  Constructor.
+        :param adf: observations, with column JD, and usually band, by and those of OBS_TEXT_COLUMNS
+            [ArrayDataFrame object].
+        """
+        self.adf = adf
+        self.latest_filters = None  # as normalized by rows().
+        self.latest_rows = None  # rows matching latest_filters.
+
+    def rows(self, text='', bands=None, observer='', jd_low=None, jd_high=None):
+        """  Return indices of rows matching all filters, in JD order.
+        :param text: text to appear, ignoring case, in any column of OBS_TEXT_COLUMNS; '' for any [string].
+        :param bands: bands wanted, ignoring case, or None for all bands [list of strings].
+        :param observer: start of observer code wanted, ignoring case; '' for all observers [string].
+        :param jd_low: lowest JD wanted, or None for no lower limit [float].
+        :param jd_high: highest JD wanted, or None for no upper limit [float].
+        :return: row indices [numpy integer array].
+        """
+        filters = (text.strip().lower(), None if bands is None else frozenset(b.upper() for b in bands),
+                   observer.strip().upper(), jd_low, jd_high)
+        if filters == self.latest_filters:
+            return self.latest_rows
+        if self.latest_filters is not None and filters_narrow(filters, self.latest_filters):
+            rows = self.latest_rows
+            jds = self.adf.array('JD')[rows]
+            rows = rows[(jds >= (-np.inf if jd_low is None else jd_low)) &
+                        (jds <= (np.inf if jd_high is None else jd_high))]
+        else:
+            rows = self.adf.jd_index().rows(jd_low, jd_high)
+        text, bands, observer = filters[:3]
+        if bands is not None:
+            rows = self._matching(rows, 'band', lambda band: band.upper() in bands)
+        if observer != '':
+            rows = self._matching(rows, 'by', lambda obscode: obscode.upper().startswith(observer))
+        if text != '':
+            is_matching = np.zeros(len(rows), dtype=bool)
+            for column_name in [c for c in OBS_TEXT_COLUMNS if c in self.adf.dict]:
+                codes, lowered_categories = self._lowered_categorical(column_name)
+                is_category_matching = np.array([text in c for c in lowered_categories], dtype=bool)
+                is_matching |= is_category_matching[codes[rows]]
+            rows = rows[is_matching]
+        self.latest_filters, self.latest_rows = filters, rows
+        return rows
+
+    def _matching(self, rows, column_name, is_wanted):
+        """  Return those of rows whose value in column is wanted; is_wanted called once per category. """
+        if column_name not in self.adf.dict:
+            return rows[:0]
+        categorical = self.adf.derive(('categorical', column_name), lambda: self.adf.categorical(column_name))
+        is_category_wanted = np.array([is_wanted(c) for c in categorical.categories], dtype=bool)
+        return rows[is_category_wanted[categorical.codes[rows]]]
+
+    def _lowered_categorical(self, column_name):
+        """  Return column's codes and its categories in lower case, both made once per dataset. """
+        def make():
+            categorical = self.adf.categorical(column_name)
+            return categorical.codes, [c.lower() for c in categorical.categories]
+        return self.adf.derive(('lowered_categorical', column_name), make)
+
+
+def filters_narrow(filters, earlier_filters):
+    """  Return True iff every row matching filters must also match earlier_filters (as normalized
+         by ObsFilter.rows()), so that only earlier_filters' rows need be searched.
+    :param filters: (text, bands, observer, jd_low, jd_high) [5-tuple].
+    :param earlier_filters: the same, from an earlier search [5-tuple].
+    :return: [boolean].
+    """
+    text, bands, observer, jd_low, jd_high = filters
+    earlier_text, earlier_bands, earlier_observer, earlier_jd_low, earlier_jd_high = earlier_filters
+    return earlier_text in text and observer.startswith(earlier_observer) and \
+        (earlier_bands is None or (bands is not None and bands <= earlier_bands)) and \
+        (earlier_jd_low is None or (jd_low is not None and jd_low >= earlier_jd_low)) and \
+        (earlier_jd_high is None or (jd_high is not None and jd_high <= earlier_jd_high))
+
+
+def jd_range_slice(sorted_values, value_low=None, value_high=None):
+    """  Return (start, stop) of slice of sorted_values lying within a range (inclusive), by binary search.
+    :param sorted_values: values in ascending order, any nan at end [numpy float array].
+    :param value_low: lowest value wanted, or None for no lower limit [float].
+    :param value_high: highest value wanted, or None for no upper limit [float].
+    :return: start and stop indices [2-tuple of ints].
+    """
+    value_low = -np.inf if value_low is None else value_low
+    value_high = np.inf if value_high is None else value_high  # (nan sorts after inf, so is excluded)
+    i_low = int(np.searchsorted(sorted_values, value_low, side='left'))
+    i_high = int(np.searchsorted(sorted_values, value_high, side='right'))
+    return i_low, max(i_low, i_high)
+
+
+class CategoricalEncoder:
+    """  Builds a Categorical incrementally (e.g., while text is streamed in), so that only integer codes
+         and one copy of each distinct value are ever held, never the per-row strings.
+    """
+    def __init__(self):
+        self.code_lookup = dict()
+        self.code_arrays = []
+
+    def extend(self, values):
+        """  Encode and append values.
+        :param values: one value per row [iterable of strings].
+        :return: [None]
+        """
+        code_lookup = self.code_lookup
+        codes = [code_lookup.setdefault(value, len(code_lookup)) for value in values]
+        self.code_arrays.append(np.array(codes, dtype=CATEGORICAL_CODE_DTYPE))
+
+    def to_categorical(self):
+        """  Return all values appended so far [Categorical object]. """
+        if len(self.code_arrays) == 0:
+            codes = np.zeros(0, dtype=CATEGORICAL_CODE_DTYPE)
+        else:
+            codes = np.concatenate(self.code_arrays)
+        return Categorical(codes, list(self.code_lookup.keys()))
+
+
+class ArrayDataFrameParser:
+    """  Parses delimited text into an ArrayDataFrame incrementally: lines may be fed in any number of
+         batches (e.g., as they arrive from a network), each parsed at once and only its arrays kept.
+         Categorical columns are encoded chunk by chunk, so their per-row strings are never all held at once.
+         Usage: parser = ArrayDataFrameParser('@@@'); parser.feed(lines); ...; adf = parser.result()
+    """
+    def __init__(self, delimiter, float_columns=None, categorical_columns=None):
+        """  Constructor.
+        :param delimiter: delimiter between values within each line [string].
+        :param float_columns: names of columns to hold as float64 arrays; defaults to ARRAY_FLOAT_COLUMNS.
+        :param categorical_columns: names of columns to hold as Categorical; default CATEGORICAL_COLUMNS.
+        """
+        self.delimiter = delimiter
+        self.float_columns = ARRAY_FLOAT_COLUMNS if float_columns is None else float_columns
+        self.categorical_columns = CATEGORICAL_COLUMNS if categorical_columns is None else categorical_columns
+        self.column_names = None  # from header line, the first line fed.
+        self.columns = None
+
+    def feed(self, byte_lines):
+        """  Parse more lines, the very first being the header line.
+        :param byte_lines: complete lines of delimited text [iterable of bytes].
+        :return: [None]
+        """
+        lines = iter(byte_lines)
+        if self.column_names is None:
+            header_line = next(lines, None)
+            if header_line is None:
+                return
+            self.column_names = [column_name.strip()
+                                 for column_name in header_line.decode('utf-8').split(self.delimiter)]
+            self.columns = [CategoricalEncoder() if column_name in self.categorical_columns else []
+                            for column_name in self.column_names]
+        n_columns = len(self.column_names)
+        while True:
+            chunk = list(islice(lines, STREAM_CHUNK_LINES))
+            if len(chunk) == 0:
+                return
+            chunk_columns = split_lines(chunk, self.delimiter, n_columns)
+            if chunk_columns is None:
+                continue
+            for column, column_name, values in zip(self.columns, self.column_names, chunk_columns):
+                if column_name in self.float_columns:
+                    column.extend(floats_from_strings(values))
+                else:
+                    column.extend(map(str.strip, values))
+
+    def result(self):
+        """  Return all data fed so far [ArrayDataFrame object], or None if no header line yet. """
+        if self.column_names is None:
+            return None
+        new_dict = OrderedDict()
+        for column, column_name in zip(self.columns, self.column_names):
+            if isinstance(column, CategoricalEncoder):
+                new_dict[column_name] = column.to_categorical()
+            elif column_name in self.float_columns:
+                new_dict[column_name] = np.array(column, dtype=np.float64)
+            else:
+                new_dict[column_name] = column
+        return ArrayDataFrame(new_dict)
+
+
+class ArrayDataFrame(MiniDataFrame):
+    """  MiniDataFrame variant for large datasets: float columns held as contiguous numpy float64 arrays,
+         repetitive string columns as Categorical objects (integer codes plus lookup table), any other
+         columns as plain lists. Keeps MiniDataFrame's list API (e.g., column() still returns a list),
+         adds direct array access and boolean-mask row subsetting.
+    """
+    def __init__(self, dict_of_columns=None):
+        """  Constructor.
+        :param dict_of_columns: columns of equal length, each a numpy array, Categorical, or list
+            [dict or OrderedDict], or None for a dataframe with no data.
+        """
+        self.dict = None
+        if isinstance(dict_of_columns, dict) and len(dict_of_columns) >= 1:
+            lengths = set(len(values) for values in dict_of_columns.values())
+            if len(lengths) == 1:
+                self.dict = OrderedDict(dict_of_columns)
+        self.derived = dict()  # structures computed from (and reused with) this data, see derive().
+
+    @classmethod
+    def from_minidataframe(cls, mdf, float_columns=None, categorical_columns=None):
+        """  Constructor: convert a list-based MiniDataFrame.
+        :param mdf: dataframe to convert [MiniDataFrame object].
+        :param float_columns: names of columns to hold as float64 arrays; defaults to ARRAY_FLOAT_COLUMNS.
+        :param categorical_columns: names of columns to hold as Categorical; default CATEGORICAL_COLUMNS.
+        :return: newly constructed object [ArrayDataFrame object].
+        """
+        if isinstance(mdf, ArrayDataFrame):
+            return mdf
+        if mdf.dict is None:
+            return cls(None)
+        float_columns = ARRAY_FLOAT_COLUMNS if float_columns is None else float_columns
+        categorical_columns = CATEGORICAL_COLUMNS if categorical_columns is None else categorical_columns
+        new_dict = OrderedDict()
+        for column_name in mdf.column_names():
+            values = mdf.column(column_name)
+            if column_name in float_columns:
+                new_dict[column_name] = np.array(floats_from_strings(values), dtype=np.float64)
+            elif column_name in categorical_columns:
+                new_dict[column_name] = Categorical.from_values(values)
+            else:
+                new_dict[column_name] = list(values)
+        return cls(new_dict)
+
+    @classmethod
+    def from_url(cls, url, delimiter, float_columns=None, categorical_columns=None):
+        """  Constructor: read data from url, parsing directly into arrays and Categoricals.
+        :param url: URL from which to get data [string].
+        :param delimiter: delimiter to use in making request [1-character string].
+        :param float_columns: names of columns to hold as float64 arrays; defaults to ARRAY_FLOAT_COLUMNS.
+        :param categorical_columns: names of columns to hold as Categorical; default CATEGORICAL_COLUMNS.
+        :return: newly constructed object, or None if no header line [ArrayDataFrame object].
+        """
+        return cls.from_stream(urllib.request.urlopen(url), delimiter, float_columns, categorical_columns)
+
+    @classmethod
+    def from_stream(cls, byte_lines, delimiter, float_columns=None, categorical_columns=None):
+        """  Constructor: parse delimited text incrementally as it is read. Categorical columns are encoded
+             chunk by chunk, so their per-row strings are never all held at once.
+        :param byte_lines: lines of delimited text, header line first [iterable of bytes].
+        :param delimiter: delimiter between values within each line [string].
+        :param float_columns: names of columns to hold as float64 arrays; defaults to ARRAY_FLOAT_COLUMNS.
+        :param categorical_columns: names of columns to hold as Categorical; default CATEGORICAL_COLUMNS.
+        :return: newly constructed object, or None if no header line [ArrayDataFrame object].
+        """
+        parser = ArrayDataFrameParser(delimiter, float_columns, categorical_columns)
+        parser.feed(byte_lines)
+        return parser.result()
+
+    def column(self, column_name):
+        """  Return list of values in this column (as for MiniDataFrame). """
+        values = self.dict[column_name]
+        if isinstance(values, list):
+            return values
+        return values.tolist()
+
+    def array(self, column_name):
+        """  Return this column as a numpy array, without copying if already held as one. """
+        values = self.dict[column_name]
+        if isinstance(values, np.ndarray):
+            return values
+        return np.array(self.column(column_name), dtype=object)
+
+    def categorical(self, column_name):
+        """  Return this column as a Categorical, encoding it now if not already held as one. """
+        values = self.dict[column_name]
+        if isinstance(values, Categorical):
+            return values
+        return Categorical.from_values(self.column(column_name))
+
+    def derive(self, key, make):
+        """  Return a structure derived from this data (e.g., an index), made on first request only,
+             then held with this data until it changes.
+        :param key: identifies the derived structure [hashable, typically a tuple].
+        :param make: makes the derived structure when not already held [callable taking no arguments].
+        :return: the derived structure [any].
+        """
+        if key not in self.derived:
+            self.derived[key] = make()
+        return self.derived[key]
+
+    def group_index(self, column_name):
+        """  Return index of rows by value of this (categorical) column, made once per dataset.
+        :param column_name: name of column to group by, e.g., 'band' or 'by' [string].
+        :return: rows for each value [GroupIndex object].
+        """
+        return self.derive(('group_index', column_name), lambda: GroupIndex(self.categorical(column_name)))
+
+    def jd_index(self):
+        """  Return index of rows sorted by JD, overall and per band, made once per dataset [JDIndex]. """
+        return self.derive(('jd_index',), lambda: JDIndex(self.array('JD'), self.group_index('band')))
+
+    def observer_summary(self, jd_low=None, jd_high=None):
+        """  Return per-observer statistics of rows within a JD range (inclusive). The summary of all rows
+             is made once per dataset; of JD ranges (e.g., zooms), only the latest is held.
+        :param jd_low: lowest JD wanted, or None for no lower limit [float].
+        :param jd_high: highest JD wanted, or None for no upper limit [float].
+        :return: [ObserverSummary object].
+        """
+        if jd_low is None and jd_high is None:
+            return self.derive(('observer_summary',), lambda: ObserverSummary(self))
+        key = (jd_low, jd_high)
+        previous = self.derived.get('observer_summary_in_range')
+        if previous is not None and previous[0] == key:
+            return previous[1]
+        summary = ObserverSummary(self, self.jd_index().rows(jd_low, jd_high))
+        self.derived['observer_summary_in_range'] = (key, summary)  # replaces any previous range's.
+        return summary
+
+    def obs_filter(self):
+        """  Return filter of this data's rows, made once per dataset, so that it keeps (and can narrow)
+             its latest result [ObsFilter object].
+        """
+        return self.derive(('obs_filter',), lambda: ObsFilter(self))
+
+    def set_column(self, new_column_name, new_values):
+        """  Add or replace column with a copy of new_values.
+        :param new_column_name: column name to add or replace [string]
+        :param new_values: value for new column [list, numpy array, or Categorical object].
+        :return: No return; changes this ArrayDataFrame object in-place.
+        """
+        self.derived.clear()
+        if len(new_values) != self.len():
+            raise UnequalLengthError
+        if isinstance(new_values, np.ndarray):
+            self.dict[new_column_name] = new_values.copy()
+        elif isinstance(new_values, Categorical):
+            self.dict[new_column_name] = Categorical(new_values.codes.copy(), new_values.categories)
+        elif new_column_name in ARRAY_FLOAT_COLUMNS:
+            self.dict[new_column_name] = np.array(new_values, dtype=np.float64)
+        else:
+            self.dict[new_column_name] = list(new_values)
+
+    def to_float(self, column_name):
+        """  Convert one column's data into a float64 array; if not possible make value math.nan. """
+        self.derived.clear()
+        self.dict[column_name] = np.array(floats_from_strings(self.column(column_name)), dtype=np.float64)
+
+    def row_subset(self, boolean_list):
+        """  Return new ArrayDataFrame object with rows selected; rows are copies.
+        :param boolean_list: True iff row is to be kept in subset [list of booleans or numpy boolean array,
+            length must equal length of this ArrayDataFrame].
+        :return: subset ArrayDataFrame, or None if boolean_list is of wrong length [ArrayDataFrame object].
+        """
+        if len(boolean_list) != self.len():
+            return None
+        mask = np.asarray(boolean_list, dtype=bool)
+        new_dict = OrderedDict()
+        for column_name, values in self.dict.items():
+            if isinstance(values, np.ndarray):
+                new_dict[column_name] = values[mask]
+            elif isinstance(values, Categorical):
+                new_dict[column_name] = values.subset(mask)
+            else:
+                new_dict[column_name] = list(compress(values, mask.tolist()))
+        return ArrayDataFrame(new_dict)
+
+    def take(self, row_indices):
+        """  Return new ArrayDataFrame object with rows in order given by row_indices; rows are copies.
+        :param row_indices: indices of rows to take, in new order [numpy integer array].
+        :return: reordered or subset ArrayDataFrame [ArrayDataFrame object].
+        """
+        new_dict = OrderedDict()
+        for column_name, values in self.dict.items():
+            if isinstance(values, np.ndarray):
+                new_dict[column_name] = values[row_indices]
+            elif isinstance(values, Categorical):
+                new_dict[column_name] = values.subset(row_indices)
+            else:
+                new_dict[column_name] = [values[i] for i in row_indices.tolist()]
+        return ArrayDataFrame(new_dict)
+
+    @classmethod
+    def concatenate(cls, first, second):
+        """  Constructor: rows of first followed by rows of second. Columns are those of first;
+             any missing from second are filled with nan (float columns) or '' (others).
+        :param first: [ArrayDataFrame object].
+        :param second: [ArrayDataFrame object].
+        :return: newly constructed object [ArrayDataFrame object].
+        """
+        n_second = second.len()
+        new_dict = OrderedDict()
+        for column_name, values in first.dict.items():
+            if isinstance(values, np.ndarray):
+                second_values = np.asarray(second.array(column_name), dtype=np.float64) \
+                    if column_name in second.dict else np.full(n_second, nan)
+                new_dict[column_name] = np.concatenate([values, second_values])
+            elif isinstance(values, Categorical):
+                second_values = second.categorical(column_name) if column_name in second.dict \
+                    else Categorical.from_values([''] * n_second)
+                new_dict[column_name] = Categorical.concatenate(values, second_values)
+            else:
+                second_values = second.column(column_name) if column_name in second.dict \
+                    else [''] * n_second
+                new_dict[column_name] = values + list(second_values)
+        return cls(new_dict)
+
+    def to_buffer(self):
+        """  Return this data as one compact bytes object: a short JSON header (column names, kinds,
+             categories) followed by the raw bytes of each column's array. List columns are sent as
+             codes plus categories too, so no per-row string is ever pickled.
+             Suited to crossing a process boundary; see from_buffer().
+        :return: packed data [bytes].
+        """
+        header_columns, array_bytes = [], []
+        if self.dict is not None:
+            for column_name, values in self.dict.items():
+                if isinstance(values, np.ndarray) and values.dtype != object:
+                    kind, categories, array = 'array', None, np.ascontiguousarray(values)
+                else:
+                    kind = 'categorical' if isinstance(values, Categorical) else 'list'
+                    categorical = self.categorical(column_name)
+                    categories = categorical.categories
+                    array = np.ascontiguousarray(categorical.codes, dtype=CATEGORICAL_CODE_DTYPE)
+                header_columns.append([column_name, kind, array.dtype.str, len(array), categories])
+                array_bytes.append(array.tobytes())
+        header = json.dumps(header_columns).encode('utf-8')
+        return b''.join([BUFFER_HEADER_LENGTH_STRUCT.pack(len(header)), header] + array_bytes)
+
+    @classmethod
+    def from_buffer(cls, buffer):
+        """  Constructor: unpack data packed by to_buffer().
+        :param buffer: packed data [bytes or other bytes-like object].
+        :return: newly constructed object [ArrayDataFrame object].
+        """
+        header_length = BUFFER_HEADER_LENGTH_STRUCT.unpack_from(buffer, 0)[0]
+        offset = BUFFER_HEADER_LENGTH_STRUCT.size
+        header_columns = json.loads(bytes(buffer[offset:offset + header_length]).decode('utf-8'))
+        offset += header_length
+        new_dict = OrderedDict()
+        for column_name, kind, dtype_str, n_rows, categories in header_columns:
+            dtype = np.dtype(dtype_str)
+            array = np.frombuffer(buffer, dtype=dtype, count=n_rows, offset=offset).copy()
+            offset += n_rows * dtype.itemsize
+            if kind == 'array':
+                new_dict[column_name] = array
+            elif kind == 'categorical':
+                new_dict[column_name] = Categorical(array, categories)
+            else:
+                new_dict[column_name] = Categorical(array, categories).tolist()
+        return cls(new_dict if len(new_dict) >= 1 else None)
@@ -1,55 +1,534 @@
+import atexit
+import asyncio
+import weakref
+import warnings
+import threading
 import webbrowser
-import functools
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 
 import pylcg.util as util
+from pylcg.cache import ObsCache, make_star_key, uncovered_ranges, default_cache_directory
+from pylcg.fetch import ConnectionPool, RateLimiter, CircuitBreaker, CircuitOpenError, FetchMetrics, \
+    arequest, response_line_batches, conditional_headers, validators_from_headers, is_transient, \
+    call_with_retries, acall_with_retries
 
 __author__ = "Eric Dose :: New Mexico Mira Project, Albuquerque"
 
 VSX_OBSERVATIONS_HEADER = 'https://www.aavso.org/vsx/index.php?view=api.delim'
 VSX_DELIMITER = '@@@'  # NB: ',' fails as obsName values already have a comma.
+VSX_FLOAT_COLUMNS = ['JD', 'mag', 'uncert']  # parsed directly to floats as downloaded.
 PYLCG_REPO_URL = 'https://www.github.com/edose/pylcg'
 VSX_URL_STUB = 'https://www.aavso.org/vsx/index.php?view=results.get&ident='
 WEBOBS_URL_STUB = 'https://www.aavso.org/apps/webobs/results?star='
+OBS_CACHE_DIRECTORY = default_cache_directory()  # per user, not within the installed package.
+
+VSX_FIRST_PAGE_DAYS = 100  # JD span of a download's first (newest) page, so a first plot comes quickly.
+VSX_MAX_PAGE_DAYS = 1600  # later pages double in span up to this: 20 years take 8 requests.
+
+PREFETCH_WORKERS = 3  # worker threads downloading upcoming targets in the background.
+ASYNC_MAX_CONCURRENT = 32  # downloads in progress at once in agather_vsx_obs().
+
+_obs_cache = None  # the persistent on-disk cache, made on first use by get_obs_cache().
+_obs_cache_lock = threading.Lock()
+_connection_pool = None  # persistent connections shared by all downloads, made by get_connection_pool().
+_connection_pool_lock = threading.Lock()
+_star_locks = dict()  # star key -> lock, so one star is never downloaded by two threads at once.
+_star_locks_lock = threading.Lock()
+_async_star_locks = weakref.WeakKeyDictionary()  # event loop -> (star key -> asyncio.Lock).
+_circuit_breaker = CircuitBreaker()  # VSX's health; when open, cached data are used without waiting.
+_fetch_metrics = FetchMetrics()  # latency and failures of all VSX requests, see get_fetch_metrics().
 
 
-@functools.lru_cache(maxsize=128, typed=False)
-def get_vsx_obs(star_id, max_num_obs=None, jd_start=None, jd_end=None, num_days=500):
+def get_vsx_obs(star_id, max_num_obs=None, jd_start=None, jd_end=None, num_days=500, on_page=None,
+                on_fallback=None):
     """
-    Downloads observations from AAVSO's webobs for ONE star (not fov), returns MiniDataFrame.
+    Gets observations for ONE star (not fov) from local cache, first downloading from AAVSO's webobs
+       (and caching) only those parts of the JD range not already cached; returns MiniDataFrame.
        If star not in AAVSO's webobs site, return a dataframe with no rows.
+       If on_page or max_num_obs is given, long JD ranges are downloaded in pages, newest first (see
+       download_ranges()), each cached on arrival, so that a plot can be drawn from the first page(s)
+       and older pages skipped once enough rows are in hand; otherwise in as few requests as possible.
+       Transient download failures are retried; if AAVSO still cannot be reached (or recently could not,
+       see CircuitBreaker), returns whatever observations are cached, even if stale or incomplete.
        Columns: target_name, date_string, filter, observer, jd, mag, error.
     :param star_id: the STAR id (not the fov's name).
-    :param max_num_obs: maximum number of observations to get [int].  --  NOT YET IMPLEMENTED.
+    :param max_num_obs: maximum number of observations to get, the most recent; older pages are not
+        downloaded once this many are in hand [int, or None for no limit].
     :param jd_start: optional Julian date.
     :param jd_end: optional JD.
-    :return: MiniDataFrame containing data for 1 star, 1 row per observation downloaded,
-        (or None if there was some problem).
+    :param num_days: days before jd_end, if jd_start not given [float].
+    :param on_page: called on this thread with observations from the newest JD to the end of each page
+        downloaded, while more pages are to come (not while there are none so far); if it returns False,
+        no more pages are downloaded and observations so far are returned
+        [callable taking an ArrayDataFrame, or None].
+    :param on_fallback: called on this thread with the exception that ended a download, when cached
+        observations are returned in its place, e.g. to tell the user; if None, a RuntimeWarning is issued
+        [callable taking an Exception, or None].
+    :return: ArrayDataFrame containing data for 1 star, 1 row per observation downloaded,
+        (or MiniDataFrame as downloaded, if data do not appear valid).
+    """
+    if jd_end is None:
+        jd_end = util.jd_now()
+    if jd_start is None:
+        jd_start = jd_end - num_days
+    obs_cache = get_obs_cache()
+    try:
+        # If another thread (e.g., a prefetch) is downloading this star, wait for it, then use its result.
+        with _get_star_lock(star_id):
+            # Download only JD ranges not already cached (often just the hours since this star's last plot):
+            pages = download_ranges(obs_cache.missing_ranges(star_id, jd_start, jd_end),
+                                    obs_cache.validated_ranges(star_id, jd_start, jd_end),
+                                    is_paged=(on_page is not None or max_num_obs is not None))
+            for i_page, (page_start, page_end) in enumerate(pages):
+                if max_num_obs is not None or (on_page is not None and i_page >= 1):
+                    # Pages come newest first, so all of page_end to jd_end is cached by now:
+                    if _page_ends_download(obs_cache.get(star_id, page_end, jd_end), max_num_obs,
+                                           on_page if i_page >= 1 else None):
+                        jd_start = page_end
+                        break
+                validators = obs_cache.validators(star_id, page_start, page_end)  # of page's last download.
+                minidataframe = _download_with_retries(star_id, page_start, page_end, validators)
+                if minidataframe is None:  # unchanged since last downloaded, so just mark cached rows fresh:
+                    if not obs_cache.refresh(star_id, page_start, page_end):
+                        minidataframe = _download_with_retries(star_id, page_start, page_end)
+                if minidataframe is not None:
+                    if not minidataframe_can_be_cached(minidataframe):
+                        return minidataframe  # nothing usable to cache; return as downloaded.
+                    obs_cache.add(star_id, page_start, page_end, minidataframe, validators)
+            minidataframe = obs_cache.get(star_id, jd_start, jd_end)
+        if minidataframe is None:  # cache could not serve even what was just added (e.g., zero TTL).
+            minidataframe = util.ArrayDataFrame.from_minidataframe(
+                _download_with_retries(star_id, jd_start, jd_end))
+    except Exception as e:
+        try:
+            cached_minidataframe = obs_cache.get(star_id, jd_start, jd_end, partial=True)
+        except Exception:
+            raise e  # cache failing too (e.g., database locked): report the download's error, not the cache's.
+        minidataframe = _cached_fallback(cached_minidataframe, star_id, e, on_fallback)
+        if minidataframe is None:
+            raise
+    return newest_rows(minidataframe, max_num_obs)
+
+
+def page_ranges(missing_ranges, first_page_days=VSX_FIRST_PAGE_DAYS, max_page_days=VSX_MAX_PAGE_DAYS):
+    """  Split JD ranges to be downloaded into pages, newest first, the first page spanning first_page_days
+         and each later page twice its predecessor's span (up to max_page_days). A remainder shorter
+         than a quarter page is merged into the page before it, rather than downloaded alone.
+    :param missing_ranges: JD ranges to download [list of 2-tuples of floats].
+    :param first_page_days: JD span of first (newest) page [float].
+    :param max_page_days: JD span of the longest pages [float].
+    :return: (jd_start, jd_end) of each page, in decreasing JD order [list of 2-tuples of floats].
     """
+    pages = []
+    page_days = first_page_days
+    for (range_start, range_end) in sorted(missing_ranges, reverse=True):
+        page_end = range_end
+        while page_end > range_start:
+            page_start = page_end - page_days
+            if page_start - range_start < page_days / 4:
+                page_start = range_start
+            pages.append((page_start, page_end))
+            page_end = page_start
+            page_days = min(max_page_days, 2 * page_days)
+    return pages
+
+
+def download_ranges(missing_ranges, validated_ranges, is_paged=True):
+    """  Return JD ranges to download, newest first: each range whose validators are stored and which
+         overlaps the missing ranges, exactly as first downloaded (so as to be re-validated, usually at the
+         cost of a 304 response, though the missing ranges have since moved), then the rest: in pages
+         (see page_ranges()) if is_paged, else whole, each split only if longer than VSX_MAX_PAGE_DAYS.
+    :param missing_ranges: JD ranges to download, disjoint [list of 2-tuples of floats].
+    :param validated_ranges: JD ranges of stored validators, disjoint [list of 2-tuples of floats].
+    :param is_paged: True iff caller wants the newest observations first, e.g. to plot them at once,
+        or only the most recent ones; False to download in as few requests as possible [boolean].
+    :return: (jd_start, jd_end) of each download, in decreasing JD order [list of 2-tuples of floats].
+    """
+    to_revalidate = [(start, end) for (start, end) in validated_ranges
+                     if any(start < missing_end and end > missing_start
+                            for (missing_start, missing_end) in missing_ranges)]
+    intervals = [[start, end, None] for (start, end) in to_revalidate]
+    rest = [gap for (missing_start, missing_end) in missing_ranges
+            for gap in uncovered_ranges(intervals, missing_start, missing_end)]
+    first_page_days = VSX_FIRST_PAGE_DAYS if is_paged else VSX_MAX_PAGE_DAYS
+    return sorted(to_revalidate + page_ranges(rest, first_page_days),
+                  key=lambda download_range: download_range[1], reverse=True)
+
+
+def newest_rows(minidataframe, max_num_obs):
+    """  Return observations limited to the max_num_obs most recent (assumes rows sorted by JD, as cached).
+    :param minidataframe: observations [ArrayDataFrame, or MiniDataFrame].
+    :param max_num_obs: most rows to keep [int, or None for no limit].
+    :return: the most recent rows, or minidataframe itself if not too many [as minidataframe].
+    """
+    if max_num_obs is None or minidataframe.dict is None or minidataframe.len() <= max_num_obs:
+        return minidataframe
+    adf = util.ArrayDataFrame.from_minidataframe(minidataframe)
+    return adf.take(np.arange(adf.len() - max_num_obs, adf.len()))
+
+
+def _page_ends_download(minidataframe, max_num_obs, on_page):
+    """  Before a page is downloaded: check row limit, then pass observations so far to on_page, if given.
+    :param minidataframe: cached observations newer than the page, to the end of the JD range wanted
+        [ArrayDataFrame, or None if cache could not serve them (e.g., zero TTL)].
+    :param max_num_obs: as for get_vsx_obs() [int, or None].
+    :param on_page: as for get_vsx_obs(), or None if not to be called (e.g., before first page) [callable].
+    :return: True iff no more pages should be downloaded: row limit reached, or on_page returned False.
+        on_page is not called if there are no observations yet.
+    """
+    if minidataframe is None:
+        return False
+    if max_num_obs is not None and minidataframe.len() >= max_num_obs:
+        return True
+    if on_page is not None and minidataframe.len() >= 1:  # (an empty partial result is not worth showing)
+        return on_page(newest_rows(minidataframe, max_num_obs)) is False
+    return False
+
+
+def _download_with_retries(star_id, jd_start, jd_end, validators=None):
+    """  As download_vsx_obs(), but retrying transient failures, and guarded by VSX's circuit breaker. """
+    return call_with_retries(lambda: download_vsx_obs(star_id, jd_start, jd_end, validators),
+                             breaker=_circuit_breaker, metrics=_fetch_metrics)
+
+
+def _cached_fallback(cached_minidataframe, star_id, error, on_fallback=None):
+    """  Decide whether cached data may stand in for a download that failed.
+    :param cached_minidataframe: from ObsCache.get(..., partial=True) [ArrayDataFrame, or None].
+    :param star_id: the STAR id [string].
+    :param error: exception that ended the download [Exception].
+    :param on_fallback: as for get_vsx_obs() [callable taking an Exception, or None].
+    :return: cached_minidataframe if error means AAVSO is unreachable or degraded and some observations
+        are cached, else None (error should be raised) [ArrayDataFrame, or None].
+    """
+    if not (is_transient(error) or isinstance(error, CircuitOpenError)):
+        return None
+    if cached_minidataframe is None or not minidataframe_has_data(cached_minidataframe):
+        return None
+    _fetch_metrics.count('cache_fallbacks')
+    if on_fallback is not None:
+        on_fallback(error)
+    else:
+        warnings.warn('AAVSO UNAVAILABLE (' + str(error) + '): using cached observations for ' + star_id,
+                      RuntimeWarning, stacklevel=3)
+    return cached_minidataframe
+
+
+def download_vsx_obs(star_id, jd_start, jd_end, validators=None):
+    """  Downloads observations from AAVSO's webobs for ONE star over a JD range (no cache involved).
+         Text arrives gzip-compressed (if server agrees), decompressed and parsed as it streams in.
+    :param star_id: the STAR id (not the fov's name).
+    :param jd_start: Julian date of earliest observation wanted [float].
+    :param jd_end: Julian date of latest observation wanted [float].
+    :param validators: validators of the last download of exactly this JD range, for a conditional
+        request; updated in place with this download's validators [dict, or None for a plain request].
+    :return: ArrayDataFrame containing data for 1 star, 1 row per observation downloaded; JD, mag, uncert
+        parsed to floats and band, observer etc. encoded as Categoricals as downloaded
+        (missing uncert becomes nan). Has no rows if star not in webobs.
+        None if validators given and data are unchanged since (HTTP 304, or same content hash).
+    """
+    url = make_vsx_url(star_id, jd_start, jd_end)
+    parser = util.ArrayDataFrameParser(VSX_DELIMITER, float_columns=VSX_FLOAT_COLUMNS)
+    with get_connection_pool().request(url, conditional_headers(validators)) as response:
+        if response.status == 304:
+            return None
+        decoder, line_batches = response_line_batches(response)
+        for lines in line_batches:
+            parser.feed(lines)
+        new_validators = validators_from_headers(response.headers)
+    if _update_validators(validators, new_validators, decoder.content_hash):
+        return None
+    minidataframe = parser.result()
+    if minidataframe is None:
+        return util.ArrayDataFrame()  # no observations; say nothing, as callers may be threads or batches.
+    return minidataframe
+
+
+def make_vsx_url(star_id, jd_start, jd_end):
+    """  Return URL of AAVSO's webobs observations for ONE star over a JD range [string]. """
     # Simpler single multiple-character delimiter adopted Nov 7 2018 per G. Silvis recommendation.
     parm_ident = '&ident=' + util.make_safe_star_id(star_id)
+    parm_tojd = '&tojd=' + '{:20.5f}'.format(jd_end).strip()
+    parm_fromjd = '&fromjd=' + '{:20.5f}'.format(jd_start).strip()
+    parm_delimiter = '&delimiter=' + VSX_DELIMITER
+    return VSX_OBSERVATIONS_HEADER + parm_ident + parm_tojd + parm_fromjd + parm_delimiter
+
+
+def _update_validators(validators, new_validators, content_hash):
+    """  Replace validators' contents with a new download's (including its body's content hash).
+    :param validators: validators sent with the request, or None if none [dict].
+    :param new_validators: validators from the response headers [dict].
+    :param content_hash: hash of the response's decoded body [string].
+    :return: True iff the body is the same as that of validators' download [boolean].
+    """
+    if validators is None:
+        return False
+    is_unchanged = validators.get('content_hash') == content_hash
+    validators.clear()
+    validators.update(new_validators, content_hash=content_hash)
+    return is_unchanged
+
+
+def get_vsx_obs_many(star_ids, jd_start=None, jd_end=None, num_days=500, max_workers=None):
+    """  Gets observations for many stars concurrently, each as by get_vsx_obs() (so each star's download
+         goes into the cache as soon as it completes), over the shared pool of persistent connections,
+         which also limits request rate per host.
+         Usage: for star_id, minidataframe, error in get_vsx_obs_many(star_ids, jd_start, jd_end): ...
+    :param star_ids: star IDs to get [list of strings].
+    :param jd_start: optional Julian date, as for get_vsx_obs().
+    :param jd_end: optional JD, as for get_vsx_obs().
+    :param num_days: days before jd_end, if jd_start not given [float].
+    :param max_workers: concurrent downloads, default as many as connections per host [int].
+    :return: one (star_id, minidataframe or None, exception or None) per star, in order of completion
+        [generator of 3-tuples]. Closing the generator early cancels downloads not yet begun.
+    """
     if jd_end is None:
         jd_end = util.jd_now()
-    parm_tojd = '&tojd=' + '{:20.5f}'.format(jd_end).strip()
     if jd_start is None:
         jd_start = jd_end - num_days
-    parm_fromjd = '&fromjd=' + '{:20.5f}'.format(jd_start).strip()
+    if max_workers is None:
+        max_workers = get_connection_pool().max_per_host
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        futures = dict((executor.submit(get_vsx_obs, star_id, jd_start=jd_start, jd_end=jd_end), star_id)
+                       for star_id in star_ids)
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as e:
+                yield futures[future], None, e
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
 
-    parm_delimiter = '&delimiter=' + VSX_DELIMITER
-    url = VSX_OBSERVATIONS_HEADER + parm_ident + parm_tojd + parm_fromjd + parm_delimiter
-    minidataframe = util.MiniDataFrame.from_url(url, delimiter=VSX_DELIMITER)
 
-    if 'uncert' in minidataframe.column_names():
-        uncert_value_strings = [u if u != '' else '0' for u in minidataframe.column('uncert')]
-        minidataframe.set_column('uncert', uncert_value_strings)
-    if minidataframe_has_data(minidataframe):
-        if minidataframe_data_appear_valid(minidataframe):
-            for column_name in ['JD', 'mag', 'uncert']:
-                minidataframe.to_float(column_name)
+async def aget_vsx_obs(star_id, max_num_obs=None, jd_start=None, jd_end=None, num_days=500, timeout=None,
+                       on_page=None, on_fallback=None):
+    """  As get_vsx_obs(), but a coroutine: downloads and parses without blocking the event loop,
+         sharing the same observation cache (whose brief disk operations run on the loop's executor).
+         Cancelling the awaiting task abandons the download at once; data already cached stay cached.
+    :param star_id: the STAR id (not the fov's name).
+    :param max_num_obs: as for get_vsx_obs().
+    :param jd_start: optional Julian date.
+    :param jd_end: optional JD.
+    :param num_days: days before jd_end, if jd_start not given [float].
+    :param timeout: seconds allowed for the whole call, or None for no limit [float];
+        if exceeded, raises asyncio.TimeoutError.
+    :param on_page: as for get_vsx_obs(), called on the event loop's thread [callable, or None].
+    :param on_fallback: as for get_vsx_obs(), called on the event loop's thread [callable, or None].
+    :return: as for get_vsx_obs().
+    """
+    if timeout is not None:
+        return await asyncio.wait_for(aget_vsx_obs(star_id, max_num_obs, jd_start, jd_end, num_days,
+                                                   on_page=on_page, on_fallback=on_fallback), timeout)
+    if jd_end is None:
+        jd_end = util.jd_now()
+    if jd_start is None:
+        jd_start = jd_end - num_days
+    obs_cache = get_obs_cache()
+    try:
+        async with _get_async_star_lock(star_id):
+            missing_ranges = await asyncio.to_thread(obs_cache.missing_ranges, star_id, jd_start, jd_end)
+            validated_ranges = await asyncio.to_thread(obs_cache.validated_ranges, star_id, jd_start, jd_end)
+            pages = download_ranges(missing_ranges, validated_ranges,
+                                    is_paged=(on_page is not None or max_num_obs is not None))
+            for i_page, (page_start, page_end) in enumerate(pages):
+                if max_num_obs is not None or (on_page is not None and i_page >= 1):
+                    newer_minidataframe = await asyncio.to_thread(obs_cache.get, star_id, page_end, jd_end)
+                    if _page_ends_download(newer_minidataframe, max_num_obs,
+                                           on_page if i_page >= 1 else None):
+                        jd_start = page_end
+                        break
+                validators = await asyncio.to_thread(obs_cache.validators, star_id, page_start, page_end)
+                minidataframe = await _adownload_with_retries(star_id, page_start, page_end, validators)
+                if minidataframe is None:  # unchanged since last downloaded, so just mark cached rows fresh:
+                    if not await asyncio.to_thread(obs_cache.refresh, star_id, page_start, page_end):
+                        minidataframe = await _adownload_with_retries(star_id, page_start, page_end)
+                if minidataframe is not None:
+                    if not minidataframe_can_be_cached(minidataframe):
+                        return minidataframe  # nothing usable to cache; return as downloaded.
+                    await asyncio.to_thread(obs_cache.add, star_id, page_start, page_end, minidataframe,
+                                            validators)
+            minidataframe = await asyncio.to_thread(obs_cache.get, star_id, jd_start, jd_end)
+        if minidataframe is None:  # cache could not serve even what was just added (e.g., zero TTL).
+            minidataframe = await _adownload_with_retries(star_id, jd_start, jd_end)
+    except Exception as e:
+        try:
+            cached_minidataframe = await asyncio.to_thread(obs_cache.get, star_id, jd_start, jd_end, True)
+        except Exception:
+            raise e  # cache failing too (e.g., database locked): report the download's error, not the cache's.
+        minidataframe = _cached_fallback(cached_minidataframe, star_id, e, on_fallback)
+        if minidataframe is None:
+            raise
+    return newest_rows(minidataframe, max_num_obs)
+
+
+async def _adownload_with_retries(star_id, jd_start, jd_end, validators=None):
+    """  As adownload_vsx_obs(), but retrying transient failures, and guarded by VSX's circuit breaker. """
+    return await acall_with_retries(lambda: adownload_vsx_obs(star_id, jd_start, jd_end, validators),
+                                    breaker=_circuit_breaker, metrics=_fetch_metrics)
+
+
+async def adownload_vsx_obs(star_id, jd_start, jd_end, validators=None):
+    """  As download_vsx_obs(), but a coroutine, parsing lines in batches as they arrive.
+    :return: as for download_vsx_obs().
+    """
+    url = make_vsx_url(star_id, jd_start, jd_end)
+    parser = util.ArrayDataFrameParser(VSX_DELIMITER, float_columns=VSX_FLOAT_COLUMNS)
+    async with arequest(url, conditional_headers(validators), rate_limiter=get_connection_pool().rate_limiter,
+                        metrics=_fetch_metrics) as response:
+        if response.status == 304:
+            return None
+        async for lines in response.line_batches():
+            parser.feed(lines)
+        new_validators = validators_from_headers(response.headers)
+    if _update_validators(validators, new_validators, response.content_hash):
+        return None
+    minidataframe = parser.result()
     if minidataframe is None:
-        print('NO DATA: url=\"' + url + '\"' + ' delim=' + VSX_DELIMITER)
+        return util.ArrayDataFrame()  # no observations; say nothing, as callers may be event loops or batches.
     return minidataframe
 
 
+async def agather_vsx_obs(star_ids, jd_start=None, jd_end=None, num_days=500,
+                          max_concurrent=ASYNC_MAX_CONCURRENT, timeout=None):
+    """  Get observations for many stars at once on the event loop, each as by aget_vsx_obs(),
+         at most max_concurrent downloading at a time (and all subject to the shared per-host rate limit).
+    :param star_ids: star IDs to get [list of strings].
+    :param jd_start: optional Julian date, as for get_vsx_obs().
+    :param jd_end: optional JD, as for get_vsx_obs().
+    :param num_days: days before jd_end, if jd_start not given [float].
+    :param max_concurrent: most stars downloading at once [int].
+    :param timeout: seconds allowed for each star, or None for no limit [float].
+    :return: for each star, in order of star_ids, its data or the exception it raised (e.g.,
+        asyncio.TimeoutError) [list of MiniDataFrame objects and exceptions].
+    """
+    if jd_end is None:
+        jd_end = util.jd_now()
+    if jd_start is None:
+        jd_start = jd_end - num_days
+    semaphore = asyncio.Semaphore(max_concurrent)
+
+    async def get_one(star_id):
+        async with semaphore:
+            return await aget_vsx_obs(star_id, jd_start=jd_start, jd_end=jd_end, timeout=timeout)
+    return await asyncio.gather(*[get_one(star_id) for star_id in star_ids], return_exceptions=True)
+
+
+def get_cached_vsx_obs(star_id, jd_start, jd_end):
+    """  Get observations for ONE star from local cache only, never downloading (so always fast).
+    :param star_id: the STAR id (not the fov's name).
+    :param jd_start: Julian date of earliest observation wanted [float].
+    :param jd_end: Julian date of latest observation wanted [float].
+    :return: MiniDataFrame as from get_vsx_obs(), or None if this JD range is not fully cached.
+    """
+    return get_obs_cache().get(star_id, jd_start, jd_end)
+
+
+def _get_star_lock(star_id):
+    """  Return the lock serializing downloads of this star, across all threads [threading.Lock]. """
+    star_key = make_star_key(star_id)
+    with _star_locks_lock:
+        if star_key not in _star_locks:
+            _star_locks[star_key] = threading.Lock()
+        return _star_locks[star_key]
+
+
+def _get_async_star_lock(star_id):
+    """  Return the asyncio lock serializing this star's downloads by coroutines of the running event loop,
+         (the counterpart of _get_star_lock() for threads) [asyncio.Lock].
+    """
+    star_locks = _async_star_locks.setdefault(asyncio.get_running_loop(), dict())
+    star_key = make_star_key(star_id)
+    if star_key not in star_locks:
+        star_locks[star_key] = asyncio.Lock()
+    return star_locks[star_key]
+
+
+class Prefetcher:
+    """  Downloads (into the observation cache) stars the user will probably plot next, using a pool of
+         worker threads, so that a later get_vsx_obs() call for them is served from cache at once.
+         Usage: prefetcher = Prefetcher(); prefetcher.prefetch(['SS Cyg', 'R CrB'], jd_start, jd_end)
+    """
+    def __init__(self, max_workers=PREFETCH_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._futures = dict()  # (star key, jd_start, jd_end) -> Future, for prefetches not yet done.
+        self._lock = threading.Lock()
+
+    def prefetch(self, star_ids, jd_start, jd_end):
+        """  Queue background downloads, in the order given. Queued downloads (not yet started) of stars
+             no longer in star_ids are cancelled, so that the queue follows the user's navigation.
+        :param star_ids: star IDs in order of priority, most likely to be plotted next first [list of str].
+        :param jd_start: Julian date of earliest observation wanted [float].
+        :param jd_end: Julian date of latest observation wanted [float].
+        :return: [None]
+        """
+        wanted = [((make_star_key(star_id), jd_start, jd_end), star_id) for star_id in star_ids]
+        wanted_keys = [key for (key, _) in wanted]
+        with self._lock:
+            for key, future in list(self._futures.items()):
+                if future.done() or (key not in wanted_keys and future.cancel()):
+                    del self._futures[key]
+            for key, star_id in wanted:
+                if key not in self._futures:
+                    self._futures[key] = self._executor.submit(_prefetch_one, star_id, jd_start, jd_end)
+
+    def wait(self, timeout=None):
+        """  Block until all queued downloads are done (or timeout seconds have passed) [None]. """
+        with self._lock:
+            futures = list(self._futures.values())
+        concurrent.futures.wait(futures, timeout=timeout)
+
+    def shutdown(self):
+        """  Cancel all queued downloads and release worker threads (those downloading will finish). """
+        with self._lock:
+            for future in self._futures.values():
+                future.cancel()
+            self._futures.clear()
+        self._executor.shutdown(wait=False)
+
+
+def _prefetch_one(star_id, jd_start, jd_end):
+    """  Download one star into the cache. Prefetching is only an optimization, so any failure is ignored
+         here; it will surface normally if and when the user actually plots this star. """
+    try:
+        get_vsx_obs(star_id, jd_start=jd_start, jd_end=jd_end)
+    except Exception:
+        pass
+
+
+def get_obs_cache():
+    """  Return the persistent observation cache, opening it on first call [ObsCache object]. """
+    global _obs_cache
+    with _obs_cache_lock:
+        if _obs_cache is None:
+            _obs_cache = ObsCache(OBS_CACHE_DIRECTORY)
+            atexit.register(_obs_cache.close)  # keep recency of this session's reads, for eviction.
+        return _obs_cache
+
+
+def get_connection_pool():
+    """  Return the connection pool shared by all downloads, making it on first call [ConnectionPool]. """
+    global _connection_pool
+    with _connection_pool_lock:
+        if _connection_pool is None:
+            _connection_pool = ConnectionPool(rate_limiter=RateLimiter(), metrics=_fetch_metrics)
+        return _connection_pool
+
+
+def get_fetch_metrics():
+    """  Return latency and failure statistics of all VSX downloads so far, with counts of retries,
+         circuit-breaker rejections and fallbacks to cached data [dict, as from FetchMetrics.summary()].
+    """
+    return _fetch_metrics.summary()
+
+
+def clear_obs_cache():
+    """  Clear all downloaded data, both in memory and on disk, so that later plots download afresh. """
+    get_obs_cache().clear()
+
+
 def minidataframe_has_data(minidataframe):
     """  Determines whether MiniDataframe (from observation download) has data in it or not.
     :param minidataframe: minidataframe to test [MiniDataframe object].
@@ -62,20 +541,49 @@ def minidataframe_has_data(minidataframe):
     return True
 
 
-def minidataframe_data_appear_valid(minidataframe):
-    """  Determines whether MiniDataframe (from observation download) appears valid for use in pylcg.
+def minidataframe_columns_appear_valid(minidataframe):
+    """  Determines whether MiniDataframe (from observation download) has the columns pylcg needs,
+         whether or not it has any rows.
     :param minidataframe: minidataframe to test [MiniDataframe object].
-    :return: True iff minidataframe appears valid for use in pylcg [boolean].
+    :return: True iff minidataframe has the columns pylcg needs [boolean].
     """
+    if minidataframe.dict is None:
+        return False
     if minidataframe.ncol() < 20:
         return False
     for column_name in ['uncert', 'JD', 'mag', 'band']:
         if column_name not in minidataframe.column_names():
             return False
-    if not isinstance(minidataframe.column('uncert')[0], str):
+    return True
+
+
+def minidataframe_can_be_cached(minidataframe):
+    """  Determines whether MiniDataframe (from observation download) may be cached: it has the right
+         columns, and either has no rows (star has no observations in range) or has valid data.
+    :param minidataframe: minidataframe to test [MiniDataframe object].
+    :return: True iff minidataframe may be cached [boolean].
+    """
+    if not minidataframe_columns_appear_valid(minidataframe):
+        return False
+    if minidataframe_has_data(minidataframe):
+        return minidataframe_data_appear_valid(minidataframe)
+    return True
+
+
+def minidataframe_data_appear_valid(minidataframe):
+    """  Determines whether MiniDataframe (from observation download) appears valid for use in pylcg.
+    :param minidataframe: minidataframe to test [MiniDataframe object].
+    :return: True iff minidataframe appears valid for use in pylcg [boolean].
+    """
+    if not minidataframe_columns_appear_valid(minidataframe):
+        return False
+    first_uncert = minidataframe.dict['uncert'][0]  # (not .column(), which may convert whole column)
+    if isinstance(first_uncert, float):
+        return True  # already converted to floats.
+    if not isinstance(first_uncert, str):
         return False
     try:
-        _ = float(minidataframe.column('uncert')[0])
+        _ = float(first_uncert)
     except ValueError:
         return False
     return True
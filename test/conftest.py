@@ -0,0 +1,149 @@
+import gzip
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from pylcg import util
+
+__author__ = "Eric Dose :: New Mexico Mira Project, Albuquerque"
+
+"""  Fixtures shared by test modules (pytest finds this file itself). """
+
+VSX_COLUMN_NAMES = ['obsID', 'JD', 'mag', 'uncert', 'band', 'by', 'comCode', 'compStar1', 'compStar2',
+                    'charts', 'comments', 'transformed', 'airmass', 'valFlag', 'cmag', 'kmag',
+                    'HJD', 'starName', 'obsAffil', 'mtype', 'obsName', 'obsCountry', 'obsType',
+                    'fainterThan']  # as downloaded from AAVSO's VSX, in its order.
+
+
+def make_obs_mdf(jds, mags=None, uncerts=0.02, bands='V', observers='DERA', fainter_thans='0',
+                 vsx_columns=False, **other_columns):
+    """  Return downloaded-style observations, JD, mag and uncert already converted to floats.
+         Each column's values are given as a list (one per row, or repeated as needed, so that
+         e.g. ['V', 'I'] alternates), or as one value for all rows, or None for no such column.
+    :param jds: JD of each observation [list of floats].
+    :param mags: magnitudes; default 12.0 for the first row, growing 0.1 per row [list, float or None].
+    :param uncerts: uncertainties [list, float or None].
+    :param bands: bands [list, string or None].
+    :param observers: observer codes, column 'by' [list, string or None].
+    :param fainter_thans: '1' for a less-than, else '0' [list, string or None].
+    :param vsx_columns: True to include all VSX_COLUMN_NAMES, in their order, those not given blank [boolean].
+    :param other_columns: more columns, by name, e.g., comments=['cloudy', ''] [lists or strings].
+    :return: observations [MiniDataFrame object].
+    """
+    n = len(jds)
+    columns = {'JD': [float(jd) for jd in jds],
+               'mag': [12.0 + 0.1 * i for i in range(n)] if mags is None else mags,
+               'uncert': uncerts, 'band': bands, 'by': observers, 'fainterThan': fainter_thans}
+    columns.update(other_columns)
+    column_names = VSX_COLUMN_NAMES if vsx_columns else list(columns.keys())
+    d = dict()
+    for column_name in column_names:
+        values = columns.get(column_name, '')
+        if values is not None:
+            d[column_name] = [values[i % len(values)] for i in range(n)] if isinstance(values, list) \
+                else [values] * n
+    return util.MiniDataFrame(d)
+
+
+class FakeServer:
+    """  Local HTTP/1.1 (keep-alive) server, for tests: serves self.body at any path except /missing,
+         records each request's path, headers and client port (one port per connection), and the most
+         requests it ever handled at once. If chunked, sends body in 2 chunks. If use_gzip, compresses body
+         for clients accepting it. If etag, sends it, and answers 304 to a request already holding it.
+         Each status in fail_statuses (e.g., 503) answers one request, in turn, before serving normally.
+         If truncated (and chunked), closes the connection after the first chunk, as a dropped connection.
+    """
+    def __init__(self, body=b'line 1\nline 2\n', delay=0.0, chunked=False, use_gzip=False, etag=None,
+                 fail_statuses=None, truncated=False):
+        self.body, self.delay, self.chunked, self.use_gzip, self.etag = body, delay, chunked, use_gzip, etag
+        self.truncated = truncated
+        self.fail_statuses = list(fail_statuses or [])
+        self.paths, self.request_headers, self.client_ports = [], [], set()
+        self.n_active, self.max_active = 0, 0
+        self.lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                with server.lock:
+                    server.paths.append(self.path)
+                    server.request_headers.append(dict(self.headers))
+                    server.client_ports.add(self.client_address[1])
+                    server.n_active += 1
+                    server.max_active = max(server.max_active, server.n_active)
+                time.sleep(server.delay)
+                try:
+                    self.respond()
+                finally:
+                    with server.lock:
+                        server.n_active -= 1
+
+            def respond(self):
+                with server.lock:
+                    fail_status = server.fail_statuses.pop(0) if len(server.fail_statuses) >= 1 else None
+                if fail_status is not None or self.path == '/missing':
+                    self.send_response(fail_status or 404)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                if server.etag is not None and self.headers.get('If-None-Match') == server.etag:
+                    self.send_response(304)
+                    self.send_header('ETag', server.etag)
+                    self.end_headers()
+                    return
+                body = server.body
+                self.send_response(200)
+                if server.etag is not None:
+                    self.send_header('ETag', server.etag)
+                if server.use_gzip and 'gzip' in self.headers.get('Accept-Encoding', ''):
+                    body = gzip.compress(body)
+                    self.send_header('Content-Encoding', 'gzip')
+                if server.chunked:
+                    self.send_header('Transfer-Encoding', 'chunked')
+                    self.end_headers()
+                    half = len(body) // 2
+                    for i_chunk, chunk in enumerate([body[:half], body[half:], b'']):
+                        if server.truncated and i_chunk >= 1:
+                            self.close_connection = True
+                            return
+                        self.wfile.write('{:x}'.format(len(chunk)).encode() + b'\r\n' + chunk + b'\r\n')
+                else:
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.handle_error = lambda request, client_address: None  # e.g., client timed out: expected.
+        self.url = 'http://127.0.0.1:' + str(self.httpd.server_address[1])
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def fake_server():
+    """  Return a function making FakeServer objects (keyword arguments as for FakeServer),
+         each closed when the test ends. """
+    servers = []
+
+    def make(**kwargs):
+        servers.append(FakeServer(**kwargs))
+        return servers[-1]
+    yield make
+    for server in servers:
+        server.close()
+
+
+@pytest.fixture
+def obs_mdf():
+    """  Return make_obs_mdf(), to make downloaded-style observations for tests and their fakes. """
+    return make_obs_mdf
@@ -0,0 +1,47 @@
+import os
+
+from pylcg import batch
+from pylcg import util
+from pylcg import web
+
+__author__ = "Eric Dose :: New Mexico Mira Project, Albuquerque"
+
+TEST_TOP_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+UPLOAD_FULLPATH = os.path.join(TEST_TOP_DIRECTORY, '$data_for_test', 'AAVSOreport-20180813.txt')
+
+FUNCTION_TESTS_______________ = 0
+
+
+def test_make_image_fullpaths():
+    fullpaths = batch.make_image_fullpaths(['ST Tri', 'V0336 Ser', 'st tri', 'R/Leo*'], 'out', 'png')
+    assert fullpaths['ST Tri'] == os.path.join('out', 'ST_Tri.png')
+    assert fullpaths['V0336 Ser'] == os.path.join('out', 'V0336_Ser.png')
+    assert fullpaths['st tri'] == os.path.join('out', 'st_tri_2.png')  # unique even on case-blind systems.
+    assert fullpaths['R/Leo*'] == os.path.join('out', 'R_Leo.png')
+
+
+def test_render_upload_file(tmp_path, monkeypatch, obs_mdf):
+    def fake_get_vsx_obs(star_id, max_num_obs=None, jd_start=None, jd_end=None, num_days=500):
+        # Stands in for web.get_vsx_obs(): one target has no observations, the rest a few V and I each.
+        if star_id.upper() == 'AH SER':
+            return util.MiniDataFrame()
+        return obs_mdf([jd_start + 10.0 * (i + 1) for i in range(6)], bands=['V', 'I'],
+                       observers=['DERA', 'XYZ'], vsx_columns=True)
+    monkeypatch.setattr(web, 'get_vsx_obs', fake_get_vsx_obs)
+    star_ids = util.get_star_ids_from_upload_file(UPLOAD_FULLPATH)
+    output_directory = str(tmp_path / 'plots')
+    progress_star_ids = []
+    results = batch.render_upload_file(UPLOAD_FULLPATH, output_directory, 'png',
+                                       plot_options={'jd_end': 2458344.0, 'plot_in_jd': False},
+                                       render_workers=0, download_workers=4,
+                                       progress=lambda result: progress_star_ids.append(result[0]))
+    assert [result[0] for result in results] == star_ids  # in upload file's order.
+    assert sorted(progress_star_ids) == sorted(star_ids)
+    for star_id, fullpath, message in results:
+        if star_id == 'AH SER':
+            assert (fullpath, message) == (None, 'no observations')
+        else:
+            assert message == 'ok'
+            with open(fullpath, 'rb') as f:
+                assert f.read(8) == b'\x89PNG\r\n\x1a\n'
+    assert len(os.listdir(output_directory)) == len(star_ids) - 1
@@ -0,0 +1,178 @@
+import os
+import sqlite3
+from math import isnan
+
+from pylcg import cache
+from pylcg import util
+
+__author__ = "Eric Dose :: New Mexico Mira Project, Albuquerque"
+
+FUNCTION_TESTS_______________ = 0
+
+
+def test_make_star_key():
+    assert cache.make_star_key('ST Tri') == 'ST TRI'
+    assert cache.make_star_key('  st   tri ') == 'ST TRI'
+
+
+def test_default_cache_directory(monkeypatch):
+    monkeypatch.setattr(cache.sys, 'platform', 'linux')
+    monkeypatch.setenv('XDG_CACHE_HOME', '/xdg/cache')
+    assert cache.default_cache_directory() == os.path.join('/xdg/cache', 'pylcg')
+    monkeypatch.delenv('XDG_CACHE_HOME')
+    assert cache.default_cache_directory() == os.path.join(os.path.expanduser('~/.cache'), 'pylcg')
+    monkeypatch.setattr(cache.sys, 'platform', 'win32')
+    monkeypatch.setenv('LOCALAPPDATA', 'C:/Users/me/AppData/Local')
+    assert cache.default_cache_directory() == os.path.join('C:/Users/me/AppData/Local', 'pylcg')
+
+
+def test_payload_round_trip(tmp_path, obs_mdf):
+    mdf = obs_mdf([2458000.1, 2458001.2, 2458002.3])
+    mdf.column('uncert')[1] = float('nan')
+    cache.ObsCache(str(tmp_path)).add('ST Tri', 2458000.0, 2458003.0, mdf)
+    mdf2 = cache.ObsCache(str(tmp_path)).get('ST Tri', 2458000.0, 2458003.0)  # new object, so from disk.
+    assert mdf2.column_names() == mdf.column_names()
+    assert mdf2.column('JD') == mdf.column('JD')
+    assert mdf2.column('by') == mdf.column('by')
+    assert isnan(mdf2.column('uncert')[1])
+    assert isinstance(mdf2.dict['by'], util.Categorical)  # categorical stored as codes, not per-row.
+
+
+def test_uncovered_ranges():
+    intervals = [[10.0, 20.0, 0.0], [30.0, 40.0, 0.0]]
+    assert cache.uncovered_ranges([], 5.0, 25.0) == [(5.0, 25.0)]
+    assert cache.uncovered_ranges(intervals, 12.0, 18.0) == []
+    assert cache.uncovered_ranges(intervals, 5.0, 25.0) == [(5.0, 10.0), (20.0, 25.0)]
+    assert cache.uncovered_ranges(intervals, 15.0, 45.0) == [(20.0, 30.0), (40.0, 45.0)]
+    assert cache.uncovered_ranges(intervals, 15.0, 20.0 + cache.MIN_GAP_DAYS / 2.0) == []  # tiny gap.
+
+
+def test_add_interval():
+    intervals = cache.add_interval([], 10.0, 20.0, 1.0)
+    assert intervals == [[10.0, 20.0, 1.0]]
+    intervals = cache.add_interval(intervals, 30.0, 40.0, 2.0)
+    assert intervals == [[10.0, 20.0, 1.0], [30.0, 40.0, 2.0]]
+    intervals = cache.add_interval(intervals, 20.0, 30.0, 3.0)  # fills gap; coalesces, keeps oldest fetch.
+    assert intervals == [[10.0, 40.0, 1.0]]
+    intervals = cache.add_interval([[10.0, 40.0, 1.0]], 15.0, 25.0, 3.0)  # inside: trims, then coalesces.
+    assert intervals == [[10.0, 40.0, 1.0]]
+
+
+def test_merge_minidataframes(obs_mdf):
+    cached_mdf = obs_mdf([1.0, 2.0, 3.0, 4.0], observers='OLD')
+    new_mdf = obs_mdf([2.5, 3.0, 5.0], observers='NEW')
+    merged = cache.merge_minidataframes(cached_mdf, new_mdf, 2.5, 5.0)
+    assert merged.column('JD') == [1.0, 2.0, 2.5, 3.0, 5.0]
+    assert merged.column('by') == ['OLD', 'OLD', 'NEW', 'NEW', 'NEW']
+    assert merged.categorical('by').categories == ['OLD', 'NEW']  # each value held once.
+    merged = cache.merge_minidataframes(cached_mdf, obs_mdf([]), 2.5, 3.5)  # no new rows.
+    assert merged.column('JD') == [1.0, 2.0, 4.0]
+
+
+def test_class_obscache(tmp_path, obs_mdf):
+    directory = str(tmp_path)
+    obs_cache = cache.ObsCache(directory)
+    assert os.path.isfile(os.path.join(directory, cache.OBS_CACHE_FILENAME))
+    assert obs_cache.get('ST Tri', 2458000.0, 2458010.0) is None  # empty cache.
+    assert obs_cache.missing_ranges('ST Tri', 2458000.0, 2458010.0) == [(2458000.0, 2458010.0)]
+
+    # Entry serves its range and any range inside it:
+    obs_cache.add('ST Tri', 2458000.0, 2458010.0, obs_mdf([2458001.0, 2458005.0, 2458009.0]))
+    mdf = obs_cache.get('st tri', 2458000.0, 2458010.0)
+    assert mdf.column('JD') == [2458001.0, 2458005.0, 2458009.0]
+    mdf = obs_cache.get('ST Tri', 2458004.0, 2458010.0)
+    assert mdf.column('JD') == [2458005.0, 2458009.0]
+    assert obs_cache.get('ST Tri', 2457990.0, 2458010.0) is None  # starts before cached range.
+    assert obs_cache.get('ST Tri', 2458000.0, 2458020.0) is None  # ends after cached range.
+
+    # Only the uncovered slice is missing; adding it merges rows into the entry:
+    assert obs_cache.missing_ranges('ST Tri', 2458000.0, 2458020.0) == [(2458010.0, 2458020.0)]
+    obs_cache.add('ST Tri', 2458010.0, 2458020.0, obs_mdf([2458012.0]))
+    mdf = obs_cache.get('ST Tri', 2458000.0, 2458020.0)
+    assert mdf.column('JD') == [2458001.0, 2458005.0, 2458009.0, 2458012.0]
+
+    # Persistence across instances (e.g., across app restarts):
+    obs_cache2 = cache.ObsCache(directory)
+    assert obs_cache2.get('ST Tri', 2458000.0, 2458020.0).len() == 4
+    assert obs_cache2.total_bytes() > 0
+
+    # Clear:
+    obs_cache2.clear()
+    assert obs_cache2.total_bytes() == 0
+    assert cache.ObsCache(directory).get('ST Tri', 2458000.0, 2458010.0) is None
+
+
+def test_obscache_ttl(tmp_path, obs_mdf):
+    obs_cache = cache.ObsCache(str(tmp_path), ttl_days=0.0)  # every interval is stale at once.
+    obs_cache.add('ST Tri', 2458000.0, 2458010.0, obs_mdf([2458001.0]))
+    assert obs_cache.get('ST Tri', 2458000.0, 2458010.0) is None
+    assert obs_cache.missing_ranges('ST Tri', 2458000.0, 2458010.0) == [(2458000.0, 2458010.0)]
+
+
+def test_obscache_eviction(tmp_path, obs_mdf):
+    obs_cache = cache.ObsCache(str(tmp_path))
+    jds = [2458000.0 + 0.37 * i for i in range(200)]
+    obs_cache.add('AA Aur', 2458000.0, 2458100.0, obs_mdf(jds))
+    one_entry_bytes = obs_cache.total_bytes()
+    obs_cache.max_bytes = int(2.5 * one_entry_bytes)  # room for only 2 entries.
+    obs_cache.add('BB Aur', 2458000.0, 2458100.0, obs_mdf(jds))
+    with sqlite3.connect(obs_cache.fullpath) as connection:
+        last_used_jds = connection.execute('SELECT star_key, last_used_jd FROM observations').fetchall()
+    _ = obs_cache.get('AA Aur', 2458000.0, 2458100.0)  # AA Aur now more recently used than BB Aur.
+    with sqlite3.connect(obs_cache.fullpath) as connection:  # but not yet written, as reads never write.
+        assert connection.execute('SELECT star_key, last_used_jd FROM observations').fetchall() == \
+            last_used_jds
+    obs_cache.add('CC Aur', 2458000.0, 2458100.0, obs_mdf(jds))
+    assert obs_cache.get('AA Aur', 2458000.0, 2458100.0) is not None
+    assert obs_cache.get('BB Aur', 2458000.0, 2458100.0) is None  # least recently used, so evicted.
+    assert obs_cache.get('CC Aur', 2458000.0, 2458100.0) is not None
+    assert obs_cache.total_bytes() <= obs_cache.max_bytes
+
+
+def test_obscache_recency_of_reads_persists(tmp_path, monkeypatch, obs_mdf):
+    jd_now = 2458200.0
+    monkeypatch.setattr(util, 'jd_now', lambda: jd_now)
+    jds = [2458000.0 + 0.37 * i for i in range(200)]
+    obs_cache = cache.ObsCache(str(tmp_path))
+    obs_cache.add('AA Aur', 2458000.0, 2458100.0, obs_mdf(jds))
+    jd_now += 0.1
+    obs_cache.add('BB Aur', 2458000.0, 2458100.0, obs_mdf(jds))
+
+    # Next session only reads AA Aur, then closes:
+    jd_now += 1.0
+    obs_cache = cache.ObsCache(str(tmp_path))
+    assert obs_cache.get('AA Aur', 2458000.0, 2458100.0) is not None
+    obs_cache.close()
+
+    # Session after: AA Aur's read still counts, so BB Aur is evicted first.
+    jd_now += 1.0
+    obs_cache = cache.ObsCache(str(tmp_path))
+    obs_cache.max_bytes = int(2.5 * obs_cache.total_bytes() / 2)  # room for only 2 entries.
+    obs_cache.add('CC Aur', 2458000.0, 2458100.0, obs_mdf(jds))
+    assert obs_cache.get('AA Aur', 2458000.0, 2458100.0) is not None
+    assert obs_cache.get('BB Aur', 2458000.0, 2458100.0) is None
+
+
+def test_obscache_validators_and_refresh(tmp_path, monkeypatch, obs_mdf):
+    jd_now = 2458020.0
+    monkeypatch.setattr(util, 'jd_now', lambda: jd_now)
+    obs_cache = cache.ObsCache(str(tmp_path))
+    obs_cache.add('ST Tri', 2458000.0, 2458010.0, obs_mdf([2458001.0, 2458005.0]),
+                  {'etag': '"v1"', 'content_hash': 'abc'})
+    assert obs_cache.validators('ST Tri', 2458000.0, 2458010.0) == {'etag': '"v1"', 'content_hash': 'abc'}
+    assert obs_cache.validators('ST Tri', 2458000.0, 2458011.0) == {}  # only for exactly that range.
+    assert obs_cache.validated_ranges('ST Tri', 2458005.0, 2458015.0) == [(2458000.0, 2458010.0)]
+    assert obs_cache.validated_ranges('ST Tri', 2458010.0, 2458015.0) == []
+
+    jd_now += cache.OBS_CACHE_TTL_DAYS + 1.0  # now stale: not served, but rows kept for re-validation.
+    assert obs_cache.get('ST Tri', 2458000.0, 2458010.0) is None
+    assert obs_cache.missing_ranges('ST Tri', 2458000.0, 2458010.0) == [(2458000.0, 2458010.0)]
+    assert obs_cache.refresh('ST Tri', 2458000.0, 2458010.0) is True
+    assert cache.ObsCache(str(tmp_path)).get('ST Tri', 2458000.0, 2458010.0).column('JD') == \
+        [2458001.0, 2458005.0]  # served again, also after restart.
+    assert obs_cache.refresh('ST Tri', 2458000.0, 2458011.0) is False  # no validators for that range.
+
+    # A later download overlapping the range supersedes its validators:
+    obs_cache.add('ST Tri', 2458008.0, 2458012.0, obs_mdf([2458009.0]))
+    assert obs_cache.validators('ST Tri', 2458000.0, 2458010.0) == {}
+    assert obs_cache.refresh('ST Tri', 2458000.0, 2458010.0) is False
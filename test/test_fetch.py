@@ -0,0 +1,237 @@
+import ssl
+import gzip
+import time
+import asyncio
+import threading
+
+import pytest
+
+from pylcg import fetch
+
+__author__ = "Eric Dose :: New Mexico Mira Project, Albuquerque"
+
+FUNCTION_TESTS_______________ = 0
+
+
+def test_class_ratelimiter():
+    rate_limiter = fetch.RateLimiter(min_interval=0.05)
+    start = time.monotonic()
+    for i in range(4):
+        rate_limiter.wait('host1')
+    rate_limiter.wait('host2')  # other hosts not delayed by host1's requests.
+    elapsed = time.monotonic() - start
+    assert 0.15 <= elapsed < 0.5
+
+
+def test_class_connectionpool(fake_server):
+    server = fake_server()
+    pool = fetch.ConnectionPool(max_per_host=2)
+    for i in range(3):
+        with pool.request(server.url + '/data?i=' + str(i)) as response:
+            assert list(response) == [b'line 1\n', b'line 2\n']
+    assert server.paths == ['/data?i=0', '/data?i=1', '/data?i=2']
+    assert pool.n_connections_made == 1  # one persistent connection, reused.
+    assert len(server.client_ports) == 1
+    assert server.request_headers[0]['Accept-Encoding'] == 'gzip'
+
+    with pytest.raises(fetch.FetchError) as e:
+        with pool.request(server.url + '/missing'):
+            pass
+    assert e.value.status == 404
+    with pool.request(server.url + '/data') as response:
+        assert response.read() == b'line 1\nline 2\n'  # pool still works after an error.
+    pool.close()
+
+
+def test_connectionpool_bounds_concurrency(fake_server):
+    server = fake_server(delay=0.05)
+    pool = fetch.ConnectionPool(max_per_host=2)
+
+    def get():
+        with pool.request(server.url + '/data') as response:
+            response.read()
+    threads = [threading.Thread(target=get) for i in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(server.paths) == 6
+    assert server.max_active <= 2
+    assert pool.n_connections_made <= 2
+    pool.close()
+
+
+def test_class_linedecoder():
+    body = b'header\n' + b''.join(b'row ' + str(i).encode() + b'\n' for i in range(3000)) + b'no newline'
+    plain_lines = [line for batch in fetch.LineDecoder().line_batches([body[:100], body[100:]])
+                   for line in batch]
+    assert b''.join(plain_lines) == body
+    assert plain_lines[0] == b'header\n' and plain_lines[-1] == b'no newline'
+
+    compressed = gzip.compress(body)
+    blocks = [compressed[i:i + 50] for i in range(0, len(compressed), 50)]  # decompressed as streamed.
+    decoder = fetch.LineDecoder('gzip')
+    gzip_lines = [line for batch in decoder.line_batches(blocks) for line in batch]
+    assert gzip_lines == plain_lines
+    plain_decoder = fetch.LineDecoder()
+    _ = list(plain_decoder.line_batches([body]))
+    assert decoder.content_hash == plain_decoder.content_hash  # hash is of decoded body.
+    with pytest.raises(ValueError):
+        fetch.LineDecoder('br')
+
+
+def test_conditional_requests(fake_server):
+    assert fetch.conditional_headers(None) == {}
+    assert fetch.conditional_headers({'etag': '"v1"', 'last_modified': 'Tue, 01 Jan 2019 00:00:00 GMT',
+                                      'content_hash': 'abc'}) == \
+        {'If-None-Match': '"v1"', 'If-Modified-Since': 'Tue, 01 Jan 2019 00:00:00 GMT'}
+    assert fetch.validators_from_headers({'etag': '"v1"', 'content-type': 'text/plain'}) == {'etag': '"v1"'}
+
+    server = fake_server(body=b'a\nb\n' * 1000, use_gzip=True, etag='"v1"')
+    pool = fetch.ConnectionPool()
+    with pool.request(server.url + '/data') as response:
+        assert response.getheader('Content-Encoding') == 'gzip'
+        assert int(response.getheader('Content-Length')) < 100  # compressed in transit.
+        decoder, line_batches = fetch.response_line_batches(response)
+        assert sum(len(batch) for batch in line_batches) == 2000
+        validators = fetch.validators_from_headers(response.headers)
+    assert validators == {'etag': '"v1"'}
+    with pool.request(server.url + '/data', fetch.conditional_headers(validators)) as response:
+        assert response.status == 304
+        assert response.read() == b''
+    assert pool.n_connections_made == 1  # connection reused even after 304.
+
+
+def test_arequest(fake_server):
+    async def get_lines(url, timeout=5.0, headers=None):
+        lines = []
+        async with fetch.arequest(url, headers, read_timeout=timeout) as response:
+            async for line_batch in response.line_batches():
+                lines.extend(line_batch)
+        return response.status, lines
+
+    body = b'header\n' + b''.join(b'row ' + str(i).encode() + b'\n' for i in range(5000)) + b'no newline'
+    for chunked, use_gzip in [(False, False), (True, False), (False, True), (True, True)]:
+        server = fake_server(body=body, chunked=chunked, use_gzip=use_gzip, etag='"v1"')
+        status, lines = asyncio.run(get_lines(server.url + '/data?x=1'))
+        assert status == 200
+        assert b''.join(lines) == body
+        assert lines[0] == b'header\n' and lines[-1] == b'no newline'
+        assert server.paths == ['/data?x=1']
+        assert asyncio.run(get_lines(server.url + '/data', headers={'If-None-Match': '"v1"'})) == (304, [])
+        with pytest.raises(fetch.FetchError):
+            asyncio.run(get_lines(server.url + '/missing'))
+
+    server = fake_server(body=body, chunked=True, truncated=True)  # connection drops after first chunk.
+    with pytest.raises(ConnectionError):
+        asyncio.run(get_lines(server.url + '/data'))
+
+    server = fake_server(delay=0.5)
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(get_lines(server.url + '/data', timeout=0.1))
+
+
+def test_call_with_retries():
+    calls = []
+
+    def flaky(errors):
+        calls.append(1)
+        if len(errors) >= 1:
+            raise errors.pop(0)
+        return 'data'
+    metrics = fetch.FetchMetrics()
+    errors = [ConnectionResetError(), fetch.FetchError('url', 503, 'Service Unavailable')]
+    assert fetch.call_with_retries(lambda: flaky(errors), base_delay=0.001, metrics=metrics) == 'data'
+    assert len(calls) == 3
+    assert metrics.summary()['events'] == {'retries': 2}
+
+    calls.clear()
+    with pytest.raises(fetch.FetchError):  # not transient, so not retried.
+        fetch.call_with_retries(lambda: flaky([fetch.FetchError('url', 404, 'Not Found')]), base_delay=0.001)
+    assert len(calls) == 1
+    calls.clear()
+    with pytest.raises(TimeoutError):  # transient, but attempts used up.
+        fetch.call_with_retries(lambda: flaky([TimeoutError()] * 5), max_attempts=3, base_delay=0.001)
+    assert len(calls) == 3
+
+    calls.clear()
+    errors = [asyncio.TimeoutError(), ConnectionRefusedError()]
+
+    async def aflaky():
+        return flaky(errors)
+    assert asyncio.run(fetch.acall_with_retries(aflaky, base_delay=0.001)) == 'data'
+    assert len(calls) == 3
+
+    assert fetch.is_transient(OSError()) and fetch.is_transient(fetch.FetchError('url', 429, 'Too Many'))
+    assert not fetch.is_transient(ValueError()) and not fetch.is_transient(fetch.FetchError('url', 403, ''))
+    assert not fetch.is_transient(ssl.SSLCertVerificationError())  # misconfigured, not worth retrying.
+    for attempt in [1, 2, 3, 10]:
+        expected = min(8.0, 2 ** (attempt - 1))
+        assert expected / 2 <= fetch.retry_delay(attempt, 1.0, 8.0) <= expected
+
+
+def test_class_circuitbreaker():
+    breaker = fetch.CircuitBreaker(failure_threshold=2, reset_seconds=0.1)
+    calls = []
+
+    def failing():
+        calls.append(1)
+        raise ConnectionRefusedError()
+    metrics = fetch.FetchMetrics()
+    with pytest.raises(ConnectionRefusedError):
+        fetch.call_with_retries(failing, max_attempts=5, base_delay=0.001, breaker=breaker, metrics=metrics)
+    assert len(calls) == 2  # retries stop once circuit opens.
+    assert breaker.state == 'open' and 0 < breaker.seconds_until_trial() <= 0.1
+    with pytest.raises(fetch.CircuitOpenError):
+        fetch.call_with_retries(failing, breaker=breaker, metrics=metrics)
+    assert len(calls) == 2  # rejected without calling.
+    assert metrics.summary()['events']['circuit_rejections'] == 1
+
+    time.sleep(0.12)
+    assert breaker.allow() and breaker.state == 'half-open'
+    assert not breaker.allow()  # only one trial call at a time.
+    breaker.record_failure()
+    assert breaker.state == 'open'  # failed trial re-opens at once.
+    time.sleep(0.12)
+    assert fetch.call_with_retries(lambda: 'data', breaker=breaker) == 'data'
+    assert breaker.state == 'closed' and breaker.n_failures == 0
+
+
+def test_connectionpool_timeouts_and_metrics(fake_server):
+    metrics = fetch.FetchMetrics()
+    server = fake_server(fail_statuses=[503, 502])
+    pool = fetch.ConnectionPool(metrics=metrics)
+
+    def get():
+        with pool.request(server.url + '/data') as response:
+            return response.read()
+    assert fetch.call_with_retries(get, base_delay=0.001, metrics=metrics) == b'line 1\nline 2\n'
+    summary = metrics.summary()
+    host_summary = summary['hosts']['127.0.0.1']
+    assert host_summary['requests'] == 3 and host_summary['failures'] == 2
+    assert host_summary['failure_rate'] == pytest.approx(2 / 3)
+    assert 'HTTP 502' in host_summary['last_error']
+    assert 0 < host_summary['latency_median'] <= host_summary['latency_p95'] < 1
+    assert summary['events'] == {'retries': 2}
+
+    slow_server = fake_server(delay=0.5)
+    slow_pool = fetch.ConnectionPool(read_timeout=0.1, metrics=metrics)
+    start = time.monotonic()
+    with pytest.raises(TimeoutError):
+        with slow_pool.request(slow_server.url + '/data'):
+            pass
+    assert time.monotonic() - start < 0.4  # read timeout applies, not connect timeout.
+    assert metrics.summary()['hosts']['127.0.0.1']['failures'] == 3
+
+    with pytest.raises(OSError):  # nothing listening: fails to connect.
+        with pool.request('http://127.0.0.1:1/data'):
+            pass
+    pool.close()
+
+    async def aget(url):
+        async with fetch.arequest(url, read_timeout=0.1, metrics=metrics) as response:
+            return b''.join([block async for block in response.blocks()])
+    assert asyncio.run(aget(server.url + '/data')) == b'line 1\nline 2\n'
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(aget(slow_server.url + '/data'))
+    assert metrics.summary()['hosts']['127.0.0.1']['requests'] == 7
@@ -0,0 +1,51 @@
+from math import nan
+
+import numpy as np
+
+from pylcg import obs_window
+from pylcg import util
+
+__author__ = "Eric Dose :: New Mexico Mira Project, Albuquerque"
+
+FUNCTION_TESTS_______________ = 0
+
+
+def test_class_obstablemodel(obs_mdf):
+    adf = util.ArrayDataFrame.from_minidataframe(obs_mdf(  # deliberately not in JD order.
+        [2458003.5, 2458001.5, 2458005.5, 2458002.5, 2458004.5, 2458000.5],
+        mags=[12.5, nan, 11.0, 12.5, 13.25, 10.0], bands=['V', 'Vis.', 'V', 'I', 'V', 'I'],
+        observers=['DERA', 'xyz', 'DERB', 'DERA', 'XYZ', 'DERA'],
+        comments=['cloudy', '', 'Clouds near moon', '', 'moon', '']))
+    model = obs_window.ObsTableModel(adf, ['JD', 'mag', 'band', 'by', 'comments'], adf.obs_filter().rows())
+    assert len(model) == 6
+    assert model.rows_at(0, 6) == [5, 1, 3, 0, 4, 2]  # JD order.
+    assert [model.is_numeric(ix) for ix in range(5)] == [True, True, False, False, False]
+    assert model.display_row(0) == ('2458000.50000', '10.000', 'I', 'DERA', '')
+    assert model.display_row(1)[1] == ''  # missing mag.
+    assert model.widest_text(1, 5) == ['10.000', '13.250']
+    assert model.widest_text(4, 1) == ['Clouds near moon']
+
+    model.sort([(3, False), (1, True)])  # observer (ignoring case), then mag descending.
+    assert model.rows_at(0, 6) == [3, 0, 5, 2, 4, 1]  # (DERA's 12.5 tie stays in JD order)
+    model.sort([(1, False)])
+    assert model.rows_at(0, 6) == [5, 2, 3, 0, 4, 1]  # missing mag last.
+    model.set_rows(adf.obs_filter().rows(bands=['V']))
+    assert model.rows_at(0, 3) == [2, 0, 4]  # new rows keep current sort.
+
+
+def test_parse_filters():
+    assert obs_window.parse_filters() == \
+        {'text': '', 'bands': None, 'observer': '', 'jd_low': None, 'jd_high': None}
+    filters = obs_window.parse_filters(text='moon', bands='V, I vis.', observer='DER',
+                                       jd_low=' 2458001.5', jd_high='2458')
+    assert filters['bands'] == ['V', 'I', 'vis.'] and filters['jd_low'] == 2458001.5
+    assert filters['jd_high'] is None  # JD still being typed...
+    assert obs_window.parse_filters(jd_high='245')['jd_high'] is None
+    assert obs_window.parse_filters(jd_high='2458.')['jd_high'] is None
+    assert obs_window.parse_filters(jd_high='2458010')['jd_high'] == 2458010.0  # ...until all 7 digits.
+    assert np.isclose(obs_window.parse_filters(jd_low='1/15/2020')['jd_low'], 2458863.5)  # (US date)
+    assert obs_window.parse_filters(jd_low='1/15')['jd_low'] is None  # half-typed date ignored...
+    assert obs_window.parse_filters(jd_low='12/3/20')['jd_low'] is None  # ...also while year is typed...
+    assert obs_window.parse_filters(jd_low='3.12.202')['jd_low'] is None
+    assert obs_window.parse_filters(jd_low='nan', jd_high='  ')['jd_low'] is None  # ...and nonsense.
+    assert np.isclose(obs_window.parse_filters(jd_high='01.01.2019')['jd_high'], 2458484.5)
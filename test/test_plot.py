@@ -0,0 +1,256 @@
+from math import nan
+
+import numpy as np
+import pytest
+
+from pylcg import plot
+from pylcg import util
+
+__author__ = "Eric Dose :: New Mexico Mira Project, Albuquerque"
+
+HELPER_FUNCTIONS______________________ = 0
+
+
+@pytest.fixture
+def obs_adf(obs_mdf):
+    # Small downloaded-style ArrayDataFrame: 2 bands, 2 observers (one in lower case), one less-than.
+    return util.ArrayDataFrame.from_minidataframe(obs_mdf(
+        [2458001.0, 2458002.0, 2458003.0, 2458004.0, 2458005.0], mags=[12.1, 12.2, 12.3, 12.4, 12.5],
+        uncerts=[0.02, nan, -1.0, 0.03, 0.04], bands=['V', 'V', 'B', 'V', 'B'],
+        observers=['DERA', 'XYZ', 'dera', 'DERA', 'XYZ'], fainter_thans=['0', '0', '0', '1', '0']))
+
+
+FUNCTION_TESTS_______________ = 0
+
+
+def test_class_plotdata(obs_adf):
+    adf = obs_adf
+    plot_data = plot.PlotData(adf, show_lessthans=False, observer_code='Dera',
+                              plot_observer_only=False, plot_in_jd=True)
+    assert sorted(plot_data.bands.keys()) == ['B', 'V']
+    x, mag, uncert, is_observer = plot_data.bands['V']
+    assert x.tolist() == [2458001.0, 2458002.0]  # less-than at 2458004 omitted.
+    assert mag.tolist() == [12.1, 12.2]
+    assert uncert.tolist() == [0.02, 0.0]  # missing uncertainty -> zero.
+    assert is_observer.tolist() == [True, False]  # case-insensitive observer match.
+    assert plot_data.bands['B'][2].tolist() == [0.0, 0.04]  # negative uncertainty -> zero.
+    y_low, y_high = plot_data.y_limits(['V', 'B', 'R'])
+    assert (y_low, y_high) == pytest.approx((12.1 - 0.02, 12.5 + 0.02))  # 5% margins.
+    y_low, y_high = plot_data.y_limits(['V'], include_uncert=True)
+    assert (y_low, y_high) == pytest.approx((12.08 - 0.006, 12.2 + 0.006))  # spans errorbars.
+    assert plot_data.y_limits(['R']) == (None, None)  # no points.
+    y_low, y_high = plot_data.y_limits(['V', 'B'], x_low=2458002.0, x_high=2458003.0)  # only in x range.
+    assert (y_low, y_high) == pytest.approx((12.2 - 0.005, 12.3 + 0.005))
+    assert plot_data.count(['V', 'B', 'R']) == {'V': 2, 'B': 2}
+    assert plot_data.count(['V', 'B'], 2458001.5, 2458005.0) == {'V': 1, 'B': 2}
+
+    # Observer only, with less-thans:
+    plot_data = plot.PlotData(adf, show_lessthans=True, observer_code='DERA',
+                              plot_observer_only=True, plot_in_jd=True)
+    assert plot_data.bands['V'][0].tolist() == [2458001.0, 2458004.0]
+    assert plot_data.bands['B'][0].tolist() == [2458003.0]
+
+    # Calendar mode: x values are matplotlib date numbers:
+    plot_data = plot.PlotData(adf, show_lessthans=False, observer_code='',
+                              plot_observer_only=False, plot_in_jd=False)
+    x = plot_data.bands['V'][0]
+    assert x.dtype == np.float64
+    assert plot.mpldates.num2date(x[0]) == util.datetime_utc_from_jd(2458001.0)
+
+
+def test_level_of_detail_rows():
+    x = np.array([0.1, 0.2, 0.3, 0.4, 1.1, 1.2, 1.3, 2.5, 3.5, 9.0])
+    mag = np.array([12.0, 14.0, 11.0, 13.0, 12.0, 12.5, nan, 12.0, 12.0, 12.0])
+    is_kept = np.zeros(len(x), dtype=bool)
+    is_kept[3] = True
+    # Few enough points for the columns: all in range selected.
+    assert plot.level_of_detail_rows(x, mag, is_kept, 0.0, 4.0, n_columns=10).tolist() == \
+        [0, 1, 2, 3, 4, 5, 7, 8]  # (row 6 has no magnitude, row 9 is out of range)
+    # 2 columns: faintest & brightest per column, plus kept row 3:
+    assert plot.level_of_detail_rows(x, mag, is_kept, 0.0, 4.0, n_columns=2).tolist() == [1, 2, 3, 7, 8]
+    assert plot.level_of_detail_rows(x, mag, is_kept, 5.0, 6.0, n_columns=2).tolist() == []
+
+
+def test_get_plot_data(obs_adf):
+    adf = obs_adf
+    plot_data = plot.get_plot_data(adf, 'ST Tri', False, 'DERA', False, True)
+    assert plot.get_plot_data(adf, 'st tri', False, 'dera', False, True) is plot_data  # reused.
+    plot_data_2 = plot.get_plot_data(adf, 'ST Tri', True, 'DERA', False, True)  # options changed.
+    assert plot_data_2 is not plot_data
+    assert plot.get_plot_data(adf, 'ST Tri', True, 'DERA', False, True) is plot_data_2
+    adf.set_column('mag', np.array([1.0, 2.0, 3.0, 4.0, 5.0]))  # data changed.
+    assert plot.get_plot_data(adf, 'ST Tri', True, 'DERA', False, True) is not plot_data_2
+
+
+def test_class_lightcurveplot(obs_adf):
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    figure = Figure(figsize=(6, 4), dpi=50)
+    figure.add_subplot(111)
+    light_curve_plot = plot.LightCurvePlot(FigureCanvasAgg(figure))
+    adf = obs_adf
+    options = dict(bands_to_plot=['V', 'B'], show_errorbars=True, show_grid=True, show_lessthans=False,
+                   observer_selected='DERA', highlight_observer=True, plot_observer_only=False,
+                   plot_in_jd=True, jd_start=2458000.0, jd_end=2458006.0)
+    assert light_curve_plot.redraw(adf, 'ST Tri', **options) is True
+    v_artists = light_curve_plot.band_artists['V']
+    assert v_artists.points.get_offsets().tolist() == [[2458001.0, 12.1], [2458002.0, 12.2]]
+    assert v_artists.highlights.get_offsets().tolist() == [[2458001.0, 12.1]]
+    assert v_artists.errorbars.get_visible()
+    ax = figure.axes[0]
+    assert ax.get_xlim() == (2458000.0, 2458006.0)
+    assert light_curve_plot.jd_limits() == (2458000.0, 2458006.0)
+    assert light_curve_plot.zoomed_jd_limits() == (None, None)  # as drawn, so not zoomed.
+    ax.set_xlim(2458001.5, 2458003.0)
+    assert light_curve_plot.zoomed_jd_limits() == (2458001.5, 2458003.0)
+    ax.set_xlim(2458000.0, 2458006.0)
+    assert light_curve_plot.visible_counts(['V', 'B']) == {'V': 2, 'B': 2}
+    assert ax.get_ylim()[0] > ax.get_ylim()[1]  # brighter magnitudes toward top.
+
+    # Display-only options just flip visibility of the same artists:
+    options.update(bands_to_plot=['B'], show_errorbars=False)
+    light_curve_plot.redraw(adf, 'ST Tri', **options)
+    assert light_curve_plot.band_artists['V'] is v_artists
+    assert not v_artists.points.get_visible()
+    assert light_curve_plot.band_artists['B'].points.get_visible()
+    assert not light_curve_plot.band_artists['B'].errorbars.get_visible()
+    assert [text.get_text() for text in ax.get_legend().get_texts()] == ['B']
+
+    # Data-selecting options swap data within the same artists:
+    options.update(bands_to_plot=['V', 'B'], show_lessthans=True)
+    light_curve_plot.redraw(adf, 'ST Tri', **options)
+    assert light_curve_plot.band_artists['V'] is v_artists
+    assert len(v_artists.points.get_offsets()) == 3
+
+    # A new star, or new data (even of the same star), rebuilds the plot with new artists:
+    light_curve_plot.redraw(adf, 'RR Lyr', **options)
+    assert light_curve_plot.band_artists['V'] is not v_artists
+    assert ax.get_title() == 'RR LYR'
+    v_artists = light_curve_plot.band_artists['V']
+    light_curve_plot.redraw(adf.take(np.arange(adf.len())), 'RR Lyr', **options)  # same rows, new data.
+    assert light_curve_plot.band_artists['V'] is not v_artists
+    v_artists = light_curve_plot.band_artists['V']
+
+    # Calendar dates need new artists:
+    options.update(plot_in_jd=False)
+    light_curve_plot.redraw(adf, 'ST Tri', **options)
+    assert light_curve_plot.band_artists['V'] is not v_artists
+    assert light_curve_plot.jd_limits() == pytest.approx((2458000.0, 2458006.0))
+    assert light_curve_plot.zoomed_jd_limits() == (None, None)
+
+    # Level of detail: artists hold each band's envelope, refined when x-limits change:
+    adf = util.ArrayDataFrame.from_minidataframe(util.MiniDataFrame(
+        {'JD': [2458000.0 + 0.001 * i for i in range(5000)], 'mag': [12.0 + (i % 7) for i in range(5000)],
+         'uncert': [0.01] * 5000, 'band': ['V'] * 5000, 'by': ['XYZ'] * 5000, 'fainterThan': ['0'] * 5000}))
+    options.update(bands_to_plot=['V'], plot_in_jd=True, level_of_detail=True)
+    light_curve_plot.redraw(adf, 'ST Tri', **options)
+    n_drawn = len(light_curve_plot.band_artists['V'].points.get_offsets())
+    assert n_drawn <= 2 * ax.bbox.width < 5000
+    ax.set_xlim(2458001.0, 2458001.1)  # zoom in (as toolbar would).
+    assert len(light_curve_plot.band_artists['V'].points.get_offsets()) == 101  # all points in view.
+
+
+def test_lightcurveplot_option_toggles_reuse_plot_data(obs_adf):
+    # Toggling display options re-plots the data held (as app does), so derived data are not rebuilt:
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    figure = Figure(figsize=(6, 4), dpi=50)
+    figure.add_subplot(111)
+    light_curve_plot = plot.LightCurvePlot(FigureCanvasAgg(figure))
+    adf = obs_adf
+    options = dict(bands_to_plot=['V', 'B'], show_errorbars=True, show_grid=True, show_lessthans=False,
+                   observer_selected='DERA', highlight_observer=True, plot_observer_only=False,
+                   plot_in_jd=True, jd_start=2458000.0, jd_end=2458006.0)
+    light_curve_plot.redraw(adf, 'ST Tri', **options)
+    plot_data, artist_data_key = light_curve_plot.plot_data, light_curve_plot.artist_data_key
+    options.update(show_grid=False)
+    light_curve_plot.redraw(adf, 'ST Tri', **options)
+    assert light_curve_plot.plot_data is plot_data
+    options.update(show_errorbars=False, bands_to_plot=['V'])
+    light_curve_plot.redraw(adf, 'ST Tri', **options)
+    assert light_curve_plot.plot_data is plot_data
+    assert light_curve_plot.artist_data_key == artist_data_key  # artists' data were not set again.
+
+
+def test_class_pointindex():
+    x = np.array([10.0, 12.0, 50.0, 51.0, nan, 200.0, 99.5])
+    y = np.array([10.0, 10.0, 50.0, 57.0, 20.0, 20.0, 0.0])
+    point_index = plot.PointIndex(x, y, bounds=(0.0, 0.0, 100.0, 80.0), cell_size=8.0)
+    assert sorted(point_index.points.tolist()) == [0, 1, 2, 3, 6]  # nan & outside bounds not indexed.
+    assert point_index.nearest(11.5, 11.0, 8.0) == 1
+    assert point_index.nearest(10.5, 9.0, 8.0) == 0
+    assert point_index.nearest(50.5, 55.0, 8.0) == 3  # in neighboring cell.
+    assert point_index.nearest(50.0, 42.5, 8.0) == 2
+    assert point_index.nearest(30.0, 30.0, 8.0) is None  # none near enough.
+    assert point_index.nearest(104.0, 1.0, 8.0) == 6  # cursor just outside bounds.
+    assert point_index.nearest(500.0, 500.0, 8.0) is None
+    empty_index = plot.PointIndex(np.zeros(0), np.zeros(0), (0.0, 0.0, 100.0, 80.0), 8.0)
+    assert empty_index.nearest(5.0, 5.0, 8.0) is None
+
+    # Same as searching every point, on larger random data:
+    rng = np.random.default_rng(2019)
+    x, y = rng.uniform(0.0, 600.0, 20000), rng.uniform(0.0, 400.0, 20000)
+    point_index = plot.PointIndex(x, y, (0.0, 0.0, 600.0, 400.0), 8.0)
+    for x_cursor, y_cursor in rng.uniform(0.0, 400.0, (200, 2)):
+        distances = np.hypot(x - x_cursor, y - y_cursor)
+        expected = int(np.argmin(distances)) if distances.min() <= 8.0 else None
+        assert point_index.nearest(x_cursor, y_cursor, 8.0) == expected
+
+
+def test_describe_observation(obs_adf):
+    adf = obs_adf
+    assert plot.describe_observation(adf, 0) == 'DERA   V   12.100 ± 0.020'
+    assert plot.describe_observation(adf, 1) == 'XYZ   V   12.200'  # (no uncertainty)
+    assert plot.describe_observation(adf, 3) == 'DERA   V   <12.400 ± 0.030'  # less-than.
+    adf.set_column('comments', ['', '', 'cloudy', '', ''])
+    adf.set_column('obsName', ['Al', 'Bo', 'Al', 'Al', 'Bo'])
+    assert plot.describe_observation(adf, 2) == 'dera (Al)   B   12.300   "cloudy"'  # (invalid uncertainty)
+
+
+def test_lightcurveplot_nearest_row(obs_adf):
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    figure = Figure(figsize=(6, 4), dpi=50)
+    figure.add_subplot(111)
+    light_curve_plot = plot.LightCurvePlot(FigureCanvasAgg(figure))
+    assert light_curve_plot.nearest_row(10.0, 10.0) is None  # nothing plotted yet.
+    adf = obs_adf
+    options = dict(bands_to_plot=['V', 'B'], show_lessthans=False, plot_in_jd=True,
+                   jd_start=2458000.0, jd_end=2458006.0)
+    light_curve_plot.redraw(adf, 'ST Tri', **options)
+    ax = figure.axes[0]
+    x_pixel, y_pixel = ax.transData.transform((2458003.0, 12.3))
+    assert light_curve_plot.nearest_row(x_pixel + 3, y_pixel - 2) == 2
+    point_index = light_curve_plot.point_index
+    assert light_curve_plot.nearest_row(x_pixel, y_pixel) == 2
+    assert light_curve_plot.point_index is point_index  # view unchanged: index reused.
+    assert light_curve_plot.nearest_row(x_pixel + 20, y_pixel) is None
+    assert light_curve_plot.nearest_row(x_pixel + 20, y_pixel, max_distance=25) == 2  # wider search...
+    assert light_curve_plot.nearest_row(x_pixel + 20, y_pixel) is None  # ...then default again.
+
+    x_pixel, y_pixel = ax.transData.transform((2458004.0, 12.4))
+    assert light_curve_plot.nearest_row(x_pixel, y_pixel) is None  # less-than not plotted.
+    options.update(bands_to_plot=['V'])
+    light_curve_plot.redraw(adf, 'ST Tri', **options)
+    x_pixel, y_pixel = ax.transData.transform((2458005.0, 12.5))
+    assert light_curve_plot.nearest_row(x_pixel, y_pixel) is None  # band B now hidden.
+    ax.set_xlim(2458001.5, 2458006.0)  # zoom (as toolbar would): index rebuilt for new view.
+    x_pixel, y_pixel = ax.transData.transform((2458002.0, 12.2))
+    assert light_curve_plot.nearest_row(x_pixel, y_pixel) == 1
+    assert light_curve_plot.point_index is not point_index
+
+    # Level of detail: only observations actually drawn are found, not others drawn over or left out:
+    adf = util.ArrayDataFrame.from_minidataframe(util.MiniDataFrame(
+        {'JD': [2458000.0 + 0.001 * i for i in range(5000)], 'mag': [12.0 + (i % 7) for i in range(5000)],
+         'uncert': [0.01] * 5000, 'band': ['V'] * 5000, 'by': ['XYZ'] * 5000, 'fainterThan': ['0'] * 5000}))
+    options.update(jd_start=2458000.0, jd_end=2458005.0, level_of_detail=True)
+    light_curve_plot.redraw(adf, 'ST Tri', **options)
+    drawn_rows = light_curve_plot.drawn_rows['V']
+    assert len(drawn_rows) < 5000
+    row_not_drawn = 2502  # mag 15.0, mid-envelope, so not drawn.
+    assert row_not_drawn not in drawn_rows
+    x_pixel, y_pixel = ax.transData.transform((2458000.0 + 0.001 * row_not_drawn, 12.0 + (row_not_drawn % 7)))
+    assert light_curve_plot.nearest_row(x_pixel, y_pixel) is None
+    row_drawn = int(drawn_rows[len(drawn_rows) // 2])
+    x_pixel, y_pixel = ax.transData.transform((2458000.0 + 0.001 * row_drawn, 12.0 + (row_drawn % 7)))
+    assert light_curve_plot.nearest_row(x_pixel, y_pixel) == row_drawn
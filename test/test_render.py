@@ -0,0 +1,53 @@
+import os
+
+from pylcg import render
+
+__author__ = "Eric Dose :: New Mexico Mira Project, Albuquerque"
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+PLOT_OPTIONS = {'bands_to_plot': ['V', 'I'], 'jd_start': 2458000.0, 'jd_end': 2458010.0}
+JDS = [2458000.5 + i for i in range(8)]
+OBS_COLUMNS = {'bands': ['V', 'I'], 'observers': ['DERA', 'XYZ'], 'comments': 'not plotted'}  # for obs_mdf().
+
+FUNCTION_TESTS_______________ = 0
+
+
+def test_plot_columns_only(obs_mdf):
+    adf = render.plot_columns_only(obs_mdf(JDS[:3], **OBS_COLUMNS))
+    assert adf.column_names() == render.PLOT_COLUMNS  # 'comments' not sent to workers.
+    assert adf.column('JD') == [2458000.5, 2458001.5, 2458002.5]
+
+
+def test_render_light_curve(tmp_path, obs_mdf):
+    mdf = obs_mdf(JDS[:6], **OBS_COLUMNS)
+    fullpath = render.render_light_curve('ST Tri', mdf, str(tmp_path / 'ST_Tri.pdf'),
+                                         PLOT_OPTIONS, image_format='pdf')
+    with open(fullpath, 'rb') as f:
+        assert f.read(4) == b'%PDF'
+    image = render.render_light_curve('ST Tri', mdf, None, PLOT_OPTIONS,
+                                      figure_size=(2.0, 1.5), dpi=50)  # thumbnail, as bytes.
+    assert image.startswith(PNG_SIGNATURE)
+
+
+def test_class_renderengine(tmp_path, obs_mdf):
+    # In this process: results in submission order, failures reported per job.
+    with render.RenderEngine(workers=0) as engine:
+        engine.submit('ST Tri', obs_mdf(JDS[:6], **OBS_COLUMNS), PLOT_OPTIONS, str(tmp_path / 'ST_Tri.png'))
+        engine.submit('Bad', obs_mdf(JDS[:6], **OBS_COLUMNS), {'no_such_option': True})
+        engine.submit('AA Aur', obs_mdf(JDS[:4], **OBS_COLUMNS), PLOT_OPTIONS)
+        engine.submit('Empty', obs_mdf([], **OBS_COLUMNS), PLOT_OPTIONS)  # no popup, no blank image.
+        results = list(engine.results())
+    assert [result[0] for result in results] == ['ST Tri', 'Bad', 'AA Aur', 'Empty']
+    assert results[0] == ('ST Tri', str(tmp_path / 'ST_Tri.png'), None)
+    assert results[1][1] is None and results[1][2].startswith('render failed')
+    assert results[2][1].startswith(PNG_SIGNATURE)
+    assert results[3][1] is None and 'no observations' in results[3][2]
+    assert list(engine.results()) == []  # each result returned once.
+
+    # On worker processes, via map(): still in submission order.
+    jobs = [(star_id, obs_mdf(JDS[:n], **OBS_COLUMNS), PLOT_OPTIONS, str(tmp_path / (star_id + '.png')))
+            for (star_id, n) in [('A', 8), ('B', 2), ('C', 5)]]
+    with render.RenderEngine(workers=2) as engine:
+        results = list(engine.map(jobs))
+    assert [(result[0], result[2]) for result in results] == [('A', None), ('B', None), ('C', None)]
+    assert all(os.path.isfile(result[1]) for result in results)
@@ -0,0 +1,66 @@
+from pylcg import table_window
+
+__author__ = "Eric Dose :: New Mexico Mira Project, Albuquerque"
+
+FUNCTION_TESTS_______________ = 0
+
+
+def test_class_rowwindow():
+    row_window = table_window.RowWindow(n_rows=10000, n_items=120, buffer_rows=30)
+    assert row_window.n_items == 120 and row_window.start == 0
+    assert row_window.placement(0.0, 20.0) == 0  # top of table: no buffer needed above.
+    assert row_window.placement(60.0, 20.0) == 0  # well inside window.
+    assert row_window.placement(75.0, 20.0) == 25  # too near window's end: re-centered on view.
+    row_window.start = 25
+    assert row_window.placement(40.0, 20.0) == 0  # too near window's start (and clipped at table top).
+    assert row_window.placement(5000.5, 20.0) == 4950  # far jump, e.g., by scrollbar.
+    row_window.start = 9880
+    assert row_window.placement(9980.0, 20.0) == 9880  # bottom of table: no buffer needed below.
+    assert row_window.placement(9900.0, 20.0) == 9850  # too near start: re-centered.
+    row_window.start = 9000
+    assert row_window.placement(9990.0, 10.0) == 9880  # far jump, clipped at table bottom.
+
+    row_window.start = 9880
+    assert row_window.resize(200) == 200
+    assert row_window.start == 9800  # window moved back to fit within table.
+    assert row_window.resize(100) == 200  # never shrinks.
+
+    small = table_window.RowWindow(n_rows=50, n_items=120, buffer_rows=30)
+    assert small.n_items == 50
+    assert small.placement(30.0, 20.0) == 0  # whole table bound: never moves.
+    assert small.resize(500) == 50
+
+
+def test_widest_values():
+    values = ['a', 'bbbb', 'cc', 12345, 'ddd']
+    assert table_window.widest_values(values, 2) == ['12345', 'bbbb']
+    assert table_window.widest_values(values, 10) == ['12345', 'bbbb', 'ddd', 'cc', 'a']
+    assert table_window.widest_values([], 5) == []
+
+
+def test_class_tablemodel():
+    rows = [('b', 10, 2.5), ('A', 9, None), ('c', 100, 1.0), ('a', 9, float('nan')), ('B', 10, 0.25)]
+    model = table_window.TableModel(['name', 'count', 'mag'], rows)
+    assert len(model) == 5
+    assert [model.is_numeric(ix) for ix in range(3)] == [False, True, True]
+    assert model.display_row(0) == ('b', '10', '2.5')
+    assert model.display_row(1) == ('A', '9', '')
+
+    model.sort([(1, False)])
+    assert model.rows_at(0, 5) == [1, 3, 0, 4, 2]  # numeric (not text) order; ties keep original order.
+    model.sort([(1, True)])
+    assert model.rows_at(0, 5) == [2, 0, 4, 1, 3]
+    model.sort([(0, False)])
+    assert [model.display_row(i)[0] for i in range(5)] == ['A', 'a', 'b', 'B', 'c']  # case ignored.
+    model.sort([(1, True), (0, True)])  # count descending, ties by name descending.
+    assert model.rows_at(0, 5) == [2, 0, 4, 1, 3]
+    model.sort([(1, False), (2, False)])  # missing mags last within their count.
+    assert model.rows_at(0, 5) == [1, 3, 4, 0, 2]
+    model.sort([(2, True)])
+    assert model.rows_at(0, 5) == [0, 2, 4, 1, 3]  # missing last even when descending.
+    model.sort([])
+    assert model.rows_at(0, 5) == [0, 1, 2, 3, 4]
+
+    assert table_window.format_cell(None) == '' and table_window.format_cell(float('nan')) == ''
+    assert table_window.format_cell(1 / 3) == '0.333333' and table_window.format_cell(12) == '12'
+    assert not table_window.TableModel(['x'], [(True,), (None,)]).is_numeric(0)
@@ -2,6 +2,7 @@ import os
 from datetime import datetime, timezone, timedelta
 from math import nan, isnan
 
+import numpy as np
 import pytest
 
 from pylcg import util
@@ -41,6 +42,17 @@ def test_jd_from_datetime_utc():
     assert util.jd_from_datetime_utc(datetime_3) == pytest.approx(2446714.63341273, abs=one_second)
 
 
+def test_date_numbers_from_jds():
+    one_second = 1.0 / (24.0 * 3600.0)
+    jds = np.array([2440587.5, 2451544.5, 2459039.76658403])
+    date_numbers = util.date_numbers_from_jds(jds)
+    assert date_numbers[0] == 0.0  # 1970-01-01, matplotlib's default epoch.
+    days_1970_to_2000 = (datetime(2000, 1, 1) - datetime(1970, 1, 1)).days
+    assert date_numbers[1] == pytest.approx(days_1970_to_2000, abs=one_second)
+    assert util.date_numbers_from_jds([2451544.5], epoch_jd=2451544.5).tolist() == [0.0]
+    assert util.jds_from_date_numbers(date_numbers) == pytest.approx(jds, abs=one_second)
+
+
 def test_jd_from_mmddyyyy():
     # Normal cases:
     assert util.jd_from_mmddyyyy('02/04/2018') == \
@@ -178,6 +190,278 @@ def test_class_minidataframe():
     assert mdf.column('b') == ['x', 'y', 'z', 'zz', 'zzz']
 
 
+def test_minidataframe_from_stream():
+    text_lines = ['JD@@@mag@@@uncert@@@band@@@by\n',
+                  '2458344.95057@@@15.319@@@0.023@@@V@@@DERA\n',
+                  '2458344.95479@@@<12.4@@@@@@R @@@DERA\n',
+                  '2458345.1@@@12.6@@@0.01@@@Vis.\n',  # short line: missing values become ''.
+                  '\n']  # blank line: skipped.
+    byte_lines = [line.encode('utf-8') for line in text_lines]
+    mdf = util.MiniDataFrame.from_stream(byte_lines, '@@@', float_columns=['JD', 'mag', 'uncert'])
+    assert mdf.column_names() == ['JD', 'mag', 'uncert', 'band', 'by']
+    assert mdf.len() == 3
+    assert mdf.column('JD') == [2458344.95057, 2458344.95479, 2458345.1]
+    assert mdf.column('mag')[0] == 15.319
+    assert isnan(mdf.column('mag')[1])  # unparseable float.
+    assert isnan(mdf.column('uncert')[1])  # empty float.
+    assert mdf.column('band') == ['V', 'R', 'Vis.']  # stripped.
+    assert mdf.column('by') == ['DERA', 'DERA', '']
+
+    # Without float_columns, all values stay strings:
+    mdf = util.MiniDataFrame.from_stream(byte_lines, '@@@')
+    assert mdf.column('JD')[0] == '2458344.95057'
+
+    # No header line at all:
+    assert util.MiniDataFrame.from_stream([], '@@@') is None
+
+    # ArrayDataFrame parses directly to arrays and Categoricals, even across chunks:
+    adf = util.ArrayDataFrame.from_stream(byte_lines, '@@@')
+    assert adf.array('JD').tolist() == [2458344.95057, 2458344.95479, 2458345.1]
+    assert isinstance(adf.dict['band'], util.Categorical)
+    assert adf.column('by') == ['DERA', 'DERA', '']
+    assert adf.categorical('by').categories == ['DERA', '']
+    many_lines = [text_lines[0].encode('utf-8')] + \
+        [text_lines[1 + (i % 2)].encode('utf-8') for i in range(util.STREAM_CHUNK_LINES + 10)]
+    adf = util.ArrayDataFrame.from_stream(many_lines, '@@@')
+    assert adf.len() == util.STREAM_CHUNK_LINES + 10
+    assert adf.categorical('band').categories == ['V', 'R']
+    assert adf.categorical('band').counts().tolist() == [util.STREAM_CHUNK_LINES // 2 + 5] * 2
+    assert util.ArrayDataFrame.from_stream([], '@@@') is None
+
+
+def test_class_arraydataframeparser():
+    parser = util.ArrayDataFrameParser('@@@', float_columns=['JD'], categorical_columns=['band'])
+    assert parser.result() is None  # no header yet.
+    parser.feed([b'JD@@@band@@@comments\n', b'2458001.5@@@V@@@a\n'])  # lines fed in batches, as they arrive.
+    parser.feed([])
+    parser.feed([b'2458002.5@@@B@@@ b \n', b'\n', b'x@@@V\n'])
+    adf = parser.result()
+    assert adf.column_names() == ['JD', 'band', 'comments']
+    assert adf.array('JD')[:2].tolist() == [2458001.5, 2458002.5]
+    assert isnan(adf.array('JD')[2])
+    assert adf.categorical('band').categories == ['V', 'B']
+    assert adf.column('band') == ['V', 'B', 'V']
+    assert adf.column('comments') == ['a', 'b', '']  # stripped; short line padded.
+
+
+def test_class_categorical():
+    values = ['V', 'Vis.', 'V', 'B', 'vis.', 'V']
+    cat = util.Categorical.from_values(values)
+    assert cat.categories == ['V', 'Vis.', 'B', 'vis.']  # each value once, in order of first appearance.
+    assert cat.codes.tolist() == [0, 1, 0, 2, 3, 0]
+    assert len(cat) == 6
+    assert cat.tolist() == values
+    assert list(cat) == values
+    assert cat[3] == 'B'
+    assert cat.equals('V').tolist() == [True, False, True, False, False, True]
+    assert cat.equals('VIS.', ignore_case=True).tolist() == [False, True, False, False, True, False]
+    assert cat.equals('absent').tolist() == [False] * 6
+    assert cat.isin(['B', 'Vis.']).tolist() == [False, True, False, True, False, False]
+    assert cat.counts().tolist() == [3, 1, 1, 1]
+    both = util.Categorical.concatenate(cat, util.Categorical.from_values(['R', 'V']))
+    assert both.categories == ['V', 'Vis.', 'B', 'vis.', 'R']
+    assert both.tolist() == values + ['R', 'V']
+    encoder = util.CategoricalEncoder()
+    encoder.extend(['V', 'B'])
+    encoder.extend(['B', 'R'])
+    assert encoder.to_categorical().codes.tolist() == [0, 1, 1, 2]
+    assert util.CategoricalEncoder().to_categorical().tolist() == []
+    sub = cat.subset(np.array([False, True, False, True, True, False]))
+    assert sub.tolist() == ['Vis.', 'B', 'vis.']
+    assert sub.categories is cat.categories
+
+
+def test_class_groupindex():
+    cat = util.Categorical.from_values(['V', 'Vis.', 'V', 'B', 'vis.', 'V'])
+    index = util.GroupIndex(cat)
+    assert index.rows('V').tolist() == [0, 2, 5]
+    assert index.rows(['B', 'Vis.']).tolist() == [1, 3]  # ascending, whatever order of values.
+    assert index.rows('VIS.', ignore_case=True).tolist() == [1, 4]
+    assert index.rows('absent').tolist() == []
+    assert index.mask('B').tolist() == cat.equals('B').tolist()
+    assert index.mask(['V', 'B']).tolist() == cat.isin(['V', 'B']).tolist()
+    assert index.values() == ['V', 'Vis.', 'B', 'vis.']
+    sub = util.GroupIndex(cat.subset(np.array([0, 2, 3])))  # categories 'Vis.' and 'vis.' now unused.
+    assert sub.values() == ['V', 'B']
+
+
+def test_class_jdindex():
+    jds = np.array([5.0, 1.0, 3.0, nan, 2.0, 4.0])
+    band_index = util.GroupIndex(util.Categorical.from_values(['V', 'B', 'V', 'V', 'B', 'B']))
+    index = util.JDIndex(jds, band_index)
+    assert index.rows().tolist() == [1, 4, 2, 5, 0]  # sorted by JD; nan JD excluded.
+    assert index.rows(2.0, 4.0).tolist() == [4, 2, 5]  # inclusive.
+    assert index.rows(jd_low=3.5).tolist() == [5, 0]
+    assert index.rows(jd_high=1.5).tolist() == [1]
+    assert index.rows(band='V').tolist() == [2, 0]
+    assert index.rows(1.5, 4.5, band='B').tolist() == [4, 5]
+    assert index.rows(band='R').tolist() == []
+    assert index.count(2.0, 4.0) == 3
+    assert index.count(6.0, 9.0) == 0
+    assert index.count(4.0, 2.0) == 0  # reversed range.
+    assert util.jd_range_slice(np.array([1.0, 2.0, 2.0, 3.0]), 2.0, 2.0) == (1, 3)
+
+
+def test_class_observersummary():
+    mdf = util.MiniDataFrame({'JD': [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, nan],
+                              'band': ['V', 'V', 'B', 'V', 'I', 'B', 'V'],
+                              'by': ['AA', 'BB', 'AA', 'AA', 'CC', 'BB', 'CC'],
+                              'obsName': ['Al', 'Bo', 'Al', 'Al', 'Cy', 'Bo', 'Cy'],
+                              'obsAffil': ['AAVSO'] * 7, 'obsCountry': ['US'] * 7})
+    adf = util.ArrayDataFrame.from_minidataframe(mdf)
+    summary = adf.observer_summary()
+    assert len(summary) == 3 and summary.n_obs() == 7
+    assert summary.obscodes == ['AA', 'BB', 'CC']  # most obs first, then first seen first.
+    assert summary.names == ['Al', 'Bo', 'Cy'] and summary.countries == ['US'] * 3
+    assert summary.counts.tolist() == [3, 2, 2]
+    assert summary.first_jds.tolist() == [1.0, 2.0, 5.0]
+    assert summary.latest_jds.tolist() == [4.0, 6.0, 5.0]  # nan JD ignored.
+    assert summary.counts_by_band(0) == [('V', 2), ('B', 1)]
+    assert summary.counts_by_band(2) == [('V', 1), ('I', 1)]
+    assert adf.observer_summary() is summary  # made once per dataset.
+
+    in_view = adf.observer_summary(2.5, 5.5)
+    assert in_view.obscodes == ['AA', 'CC'] and in_view.counts.tolist() == [2, 1]
+    assert adf.observer_summary(2.5, 5.5) is in_view
+    empty = adf.observer_summary(100.0, 200.0)
+    assert len(empty) == 0 and empty.n_obs() == 0
+    assert adf.observer_summary(2.5, 5.5) is not in_view  # only latest range held, however many zooms...
+    assert [key for key in adf.derived if 'observer_summary' in key] == [('observer_summary',),
+                                                                         'observer_summary_in_range']
+    assert adf.observer_summary() is summary
+
+    # Same as counting each observer separately, on larger random data:
+    rng = np.random.default_rng(2019)
+    n = 5000
+    big = util.ArrayDataFrame.from_minidataframe(util.MiniDataFrame({
+        'JD': rng.uniform(2458000.0, 2458500.0, n).tolist(),
+        'band': rng.choice(['V', 'B', 'Vis.'], n).tolist(),
+        'by': rng.choice(['O' + str(i) for i in range(40)], n).tolist(),
+        'obsName': ['x'] * n, 'obsAffil': ['y'] * n, 'obsCountry': ['z'] * n}))
+    summary = big.observer_summary()
+    for i_observer, obscode in enumerate(summary.obscodes):
+        rows = big.group_index('by').rows(obscode)
+        assert summary.counts[i_observer] == len(rows)
+        assert summary.latest_jds[i_observer] == big.array('JD')[rows].max()
+        bands, band_counts = np.unique(np.array(big.column('band'))[rows], return_counts=True)
+        assert dict(summary.counts_by_band(i_observer)) == dict(zip(bands.tolist(), band_counts.tolist()))
+    assert summary.counts.tolist() == sorted(summary.counts.tolist(), reverse=True)
+
+
+def test_class_obsfilter():
+    mdf = util.MiniDataFrame({'JD': [3.0, 1.0, 5.0, 2.0, 4.0, nan],
+                              'band': ['V', 'Vis.', 'V', 'I', 'V', 'V'],
+                              'by': ['DERA', 'xyz', 'DERB', 'DERA', 'XYZ', 'DERA'],
+                              'obsName': ['Al', 'Cy', 'Bo', 'Al', 'Cy', 'Al'],
+                              'comments': ['cloudy', '', 'Clouds near MOON', '', 'moon', 'moon']})
+    adf = util.ArrayDataFrame.from_minidataframe(mdf)
+    obs_filter = adf.obs_filter()
+    assert adf.obs_filter() is obs_filter  # made once per dataset.
+    assert obs_filter.rows().tolist() == [1, 3, 0, 4, 2]  # JD order; nan JD excluded.
+    assert obs_filter.rows(bands=['v']).tolist() == [0, 4, 2]  # band ignoring case.
+    assert obs_filter.rows(observer='x').tolist() == [1, 4]  # start of obscode, ignoring case.
+    assert obs_filter.rows(text='cLoud').tolist() == [0, 2]  # in comments.
+    assert obs_filter.rows(text='cy').tolist() == [1, 4]  # in obsName too.
+    assert obs_filter.rows(text='y', bands=['V']).tolist() == [0, 4]  # in 'cloudy', or obsName 'Cy'.
+    assert obs_filter.rows(text='y', bands=['V'], jd_low=3.5).tolist() == [4]  # narrows latest result.
+    assert obs_filter.rows(jd_low=1.5, jd_high=4.0).tolist() == [3, 0, 4]  # widened: searched afresh.
+    assert obs_filter.rows(text='moon', observer='der').tolist() == [2]
+    assert obs_filter.rows(text='zzz').tolist() == []
+
+    # Narrowed searches give the same rows as fresh ones, on larger random data:
+    rng = np.random.default_rng(2019)
+    n = 5000
+    big = util.ArrayDataFrame.from_minidataframe(util.MiniDataFrame({
+        'JD': rng.uniform(2458000.0, 2458500.0, n).tolist(),
+        'band': rng.choice(['V', 'B', 'Vis.'], n).tolist(),
+        'by': rng.choice(['O' + str(i) for i in range(40)], n).tolist(),
+        'comments': rng.choice(['', 'moon', 'clouds', 'haze', 'moon haze'], n).tolist()}))
+    for filters in [dict(text='h'), dict(text='ha', bands=['V', 'B']), dict(text='haz', bands=['V']),
+                    dict(text='haze', bands=['V'], observer='O1', jd_low=2458100.0),
+                    dict(text='haze', bands=['V'], observer='O12', jd_low=2458100.0, jd_high=2458400.0)]:
+        narrowed = big.obs_filter().rows(**filters)
+        assert narrowed.tolist() == util.ObsFilter(big).rows(**filters).tolist()
+        expected = [row for row in big.jd_index().rows(filters.get('jd_low'), filters.get('jd_high')).tolist()
+                    if filters['text'] in big.column('comments')[row] and
+                    big.column('band')[row] in filters.get('bands', ['V', 'B', 'Vis.']) and
+                    big.column('by')[row].startswith(filters.get('observer', ''))]
+        assert narrowed.tolist() == expected
+    assert util.filters_narrow(('haze', None, 'O1', None, None), ('ha', None, '', None, None))
+    assert not util.filters_narrow(('haze', None, '', 2.0, None), ('haze', None, '', 3.0, None))
+    assert not util.filters_narrow(('', frozenset(['V']), '', None, None),
+                                   ('', frozenset(['B']), '', None, None))
+
+
+def test_class_arraydataframe():
+    mdf = util.MiniDataFrame({'JD': ['2458001.5', '2458002.5', 'x'], 'band': ['V', 'B', 'V'],
+                              'comments': ['a', 'b', 'c']})
+    adf = util.ArrayDataFrame.from_minidataframe(mdf)
+    assert isinstance(adf, util.MiniDataFrame)
+    assert util.ArrayDataFrame.from_minidataframe(adf) is adf  # no re-conversion.
+    assert adf.ncol() == 3
+    assert adf.len() == 3
+    assert adf.column_names() == ['JD', 'band', 'comments']
+    assert isinstance(adf.array('JD'), np.ndarray)
+    assert adf.array('JD').dtype == np.float64
+    assert isnan(adf.column('JD')[2])
+    assert isinstance(adf.dict['band'], util.Categorical)
+    assert adf.column('band') == ['V', 'B', 'V']  # list API still works.
+    assert adf.column('comments') == ['a', 'b', 'c']
+
+    # Subsetting by numpy mask or by list of booleans:
+    sub = adf.row_subset(adf.categorical('band').equals('V'))
+    assert sub.column('band') == ['V', 'V']
+    assert sub.column('comments') == ['a', 'c']
+    assert sub.array('JD')[0] == 2458001.5
+    sub = adf.row_subset([False, True, False])
+    assert sub.column('comments') == ['b']
+    assert adf.row_subset([True]) is None  # wrong length.
+
+    # .take() and .concatenate(), re-coding Categoricals:
+    taken = adf.take(np.array([2, 0]))
+    assert taken.column('comments') == ['c', 'a']
+    other = util.ArrayDataFrame.from_minidataframe(util.MiniDataFrame({'JD': [5.0], 'band': ['R']}))
+    both = util.ArrayDataFrame.concatenate(adf, other)
+    assert both.len() == 4
+    assert both.column('band') == ['V', 'B', 'V', 'R']
+    assert both.categorical('band').categories == ['V', 'B', 'R']
+    assert both.column('comments') == ['a', 'b', 'c', '']  # missing from other.
+
+    # Derived structures are made once, then dropped when data change:
+    index = adf.group_index('band')
+    assert adf.group_index('band') is index
+    assert index.rows('V').tolist() == [0, 2]
+    assert adf.jd_index().rows(band='V').tolist() == [0]  # row 2's JD is nan.
+    assert adf.jd_index() is adf.jd_index()
+    assert adf.derive(('count',), lambda: 3) == 3
+    assert adf.derive(('count',), lambda: 4) == 3
+
+    # .set_column():
+    adf.set_column('JD', [1.0, 2.0, 3.0])
+    assert adf.group_index('band') is not index
+    assert adf.array('JD').tolist() == [1.0, 2.0, 3.0]
+    adf.set_column('new', ['x', 'y', 'z'])
+    assert adf.column('new') == ['x', 'y', 'z']
+    with pytest.raises(util.UnequalLengthError):
+        adf.set_column('new', ['x'])
+
+    # .to_buffer() and .from_buffer(): compact bytes, columns kept as arrays, Categoricals and lists:
+    buffer = adf.to_buffer()
+    assert isinstance(buffer, bytes)
+    assert buffer.count(b'"x"') == 1  # each string value held once, not once per row.
+    unpacked = util.ArrayDataFrame.from_buffer(buffer)
+    assert unpacked.column_names() == adf.column_names()
+    assert unpacked.array('JD').tolist() == [1.0, 2.0, 3.0]
+    assert isinstance(unpacked.dict['band'], util.Categorical)
+    assert unpacked.column('band') == ['V', 'B', 'V']
+    assert isinstance(unpacked.dict['comments'], list)
+    assert unpacked.column('comments') == ['a', 'b', 'c']
+    assert util.ArrayDataFrame.from_buffer(util.ArrayDataFrame().to_buffer()).dict is None
+
+    # No data:
+    assert util.ArrayDataFrame.from_minidataframe(util.MiniDataFrame(None)).dict is None
+
+
 def test_class_targetlist():
     tl = util.TargetList()
     assert tl.is_empty() is True
@@ -239,6 +523,16 @@ def test_class_targetlist():
     assert tl.next_exists() is False
     assert tl.go_next() is None
 
+    # Neighbors (for prefetching):
+    tl = util.TargetList(several_targets)
+    assert tl.neighbors(3, 1) == ['a', 'b', 'c']
+    tl.go_next()
+    tl.go_next()
+    assert tl.neighbors(2, 1) == ['c', 'd e4', 'a']
+    assert tl.neighbors(10, 10) == ['c', 'd e4', 'last', 'a', 'first']
+    assert tl.current() == 'b'
+    assert util.TargetList().neighbors(3, 1) == []
+
     # Pathological cases:
     # Add an empty list:
     tl = util.TargetList()
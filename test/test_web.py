@@ -0,0 +1,360 @@
+import asyncio
+
+import pytest
+
+from pylcg import cache
+from pylcg import fetch
+from pylcg import util
+from pylcg import web
+
+__author__ = "Eric Dose :: New Mexico Mira Project, Albuquerque"
+
+HELPER_FUNCTIONS______________________ = 0
+
+
+@pytest.fixture(autouse=True)
+def fresh_fetch_state(monkeypatch):
+    """  Give each test its own circuit breaker and metrics, and retry without backoff delays. """
+    monkeypatch.setattr(web, '_circuit_breaker', fetch.CircuitBreaker())
+    monkeypatch.setattr(web, '_fetch_metrics', fetch.FetchMetrics())
+    monkeypatch.setattr(fetch, 'retry_delay', lambda *args: 0.0)
+
+
+def vsx_text(mdf):
+    # Observations as VSX sends them: delimited text, one line per observation after the header line.
+    column_names = mdf.column_names()
+    lines = [web.VSX_DELIMITER.join(column_names)]
+    for i in range(mdf.len()):
+        lines.append(web.VSX_DELIMITER.join(str(mdf.column(column_name)[i]) for column_name in column_names))
+    return ('\n'.join(lines) + '\n').encode()
+
+
+class FakeDownloader:
+    """  Stands in for web.download_vsx_obs(); serves from a fixed list of JDs and records each request. """
+    def __init__(self, all_jds, obs_mdf):
+        self.all_jds = all_jds
+        self.obs_mdf = obs_mdf  # the fixture, making downloaded-style observations.
+        self.requests = []
+
+    def __call__(self, star_id, jd_start, jd_end, validators=None):
+        self.requests.append((jd_start, jd_end))
+        jds = [jd for jd in self.all_jds if jd_start <= jd <= jd_end]
+        return self.obs_mdf(jds, mags=12.0, vsx_columns=True)
+
+
+FUNCTION_TESTS_______________ = 0
+
+
+def test_get_vsx_obs_downloads_only_missing_ranges(tmp_path, monkeypatch, obs_mdf):
+    monkeypatch.setattr(web, '_obs_cache', cache.ObsCache(str(tmp_path)))
+    downloader = FakeDownloader([2458001.0, 2458005.0, 2458009.0, 2458012.0, 2458015.0], obs_mdf)
+    monkeypatch.setattr(web, 'download_vsx_obs', downloader)
+
+    mdf = web.get_vsx_obs('ST Tri', jd_start=2458000.0, jd_end=2458010.0)
+    assert mdf.column('JD') == [2458001.0, 2458005.0, 2458009.0]
+    assert downloader.requests == [(2458000.0, 2458010.0)]
+
+    # Same range again: no download at all.
+    mdf = web.get_vsx_obs('ST Tri', jd_start=2458000.0, jd_end=2458010.0)
+    assert mdf.len() == 3
+    assert len(downloader.requests) == 1
+
+    # Later end JD: only the new slice is downloaded, and merged rows are returned.
+    mdf = web.get_vsx_obs('ST Tri', jd_start=2458004.0, jd_end=2458013.0)
+    assert mdf.column('JD') == [2458005.0, 2458009.0, 2458012.0]
+    assert downloader.requests[1:] == [(2458010.0, 2458013.0)]
+
+    # Wider range: both ends are downloaded (newest first), the cached middle is not.
+    mdf = web.get_vsx_obs('ST Tri', jd_start=2457990.0, jd_end=2458016.0)
+    assert mdf.len() == 5
+    assert downloader.requests[2:] == [(2458013.0, 2458016.0), (2457990.0, 2458000.0)]
+
+
+def test_page_ranges():
+    assert web.page_ranges([]) == []
+    assert web.page_ranges([(2458000.0, 2458010.0)]) == [(2458000.0, 2458010.0)]
+    assert web.page_ranges([(2458000.0, 2458120.0)]) == [(2458000.0, 2458120.0)]  # small remainder merged.
+    pages = web.page_ranges([(2450000.0, 2457305.0)])  # 20 years.
+    assert [round(page_end - page_start) for (page_start, page_end) in pages] == \
+        [100, 200, 400, 800, 1600, 1600, 1600, 1005]
+    assert pages[0][1] == 2457305.0 and pages[-1][0] == 2450000.0
+    assert all(pages[i][0] == pages[i + 1][1] for i in range(len(pages) - 1))  # contiguous, newest first.
+    assert web.page_ranges([(100.0, 110.0), (200.0, 215.0)], first_page_days=10) == \
+        [(205.0, 215.0), (200.0, 205.0), (100.0, 110.0)]
+
+
+def test_get_vsx_obs_pages(tmp_path, monkeypatch, obs_mdf):
+    monkeypatch.setattr(web, '_obs_cache', cache.ObsCache(str(tmp_path)))
+    all_jds = [2455000.0 + 5 * i for i in range(400)]  # 2000 days.
+    downloader = FakeDownloader(all_jds, obs_mdf)
+    monkeypatch.setattr(web, 'download_vsx_obs', downloader)
+    pages_seen = []
+
+    def on_page(mdf):
+        pages_seen.append(mdf.column('JD'))
+    mdf = web.get_vsx_obs('SS Cyg', jd_start=2455000.0, jd_end=2457000.0, on_page=on_page)
+    assert mdf.column('JD') == all_jds
+    assert downloader.requests == [(2456900.0, 2457000.0), (2456700.0, 2456900.0),
+                                   (2456300.0, 2456700.0), (2455500.0, 2456300.0), (2455000.0, 2455500.0)]
+    assert len(pages_seen) == 4  # each page but the last, which is the result.
+    assert pages_seen[0] == [jd for jd in all_jds if jd >= 2456900.0]
+    assert all(len(pages_seen[i]) < len(pages_seen[i + 1]) for i in range(3))
+
+    # Row limit: most recent rows only, and older pages are not downloaded.
+    monkeypatch.setattr(web, '_obs_cache', cache.ObsCache(str(tmp_path / 'limited')))
+    downloader.requests.clear()
+    mdf = web.get_vsx_obs('SS Cyg', max_num_obs=50, jd_start=2455000.0, jd_end=2457000.0)
+    assert mdf.column('JD') == all_jds[-50:]
+    assert len(downloader.requests) == 2  # 2 pages cover 300 days, 60 rows.
+    mdf = web.get_vsx_obs('SS Cyg', max_num_obs=50, jd_start=2456500.0, jd_end=2457000.0)
+    assert mdf.len() == 50 and len(downloader.requests) == 2  # enough recent rows cached: no download.
+
+    # on_page returning False (e.g., user moved on) stops the download, keeping pages already cached.
+    monkeypatch.setattr(web, '_obs_cache', cache.ObsCache(str(tmp_path / 'abandoned')))
+    downloader.requests.clear()
+    mdf = web.get_vsx_obs('SS Cyg', jd_start=2455000.0, jd_end=2457000.0, on_page=lambda mdf: False)
+    assert mdf.column('JD') == [jd for jd in all_jds if jd >= 2456900.0]
+    assert len(downloader.requests) == 1
+
+    async def adownload_vsx_obs(star_id, jd_start, jd_end, validators=None):
+        return downloader(star_id, jd_start, jd_end)
+    monkeypatch.setattr(web, 'adownload_vsx_obs', adownload_vsx_obs)
+    downloader.requests.clear()
+    mdf = asyncio.run(web.aget_vsx_obs('SS Cyg', max_num_obs=100, jd_start=2455000.0, jd_end=2457000.0))
+    assert mdf.column('JD') == all_jds[-100:]
+    assert downloader.requests == [(2456800.0, 2456900.0), (2456600.0, 2456800.0),  # newest page cached.
+                                   (2456200.0, 2456600.0)]
+
+    # No obs in newest page(s): on_page is not called until there are some (no empty partial plot).
+    monkeypatch.setattr(web, '_obs_cache', cache.ObsCache(str(tmp_path / 'gap')))
+    downloader = FakeDownloader([jd for jd in all_jds if jd < 2456500.0], obs_mdf)
+    monkeypatch.setattr(web, 'download_vsx_obs', downloader)
+    pages_seen.clear()
+    mdf = web.get_vsx_obs('SS Cyg', jd_start=2455000.0, jd_end=2457000.0, on_page=on_page)
+    assert mdf.column('JD') == [jd for jd in all_jds if jd < 2456500.0]
+    assert len(downloader.requests) == 5
+    assert [len(page) for page in pages_seen] == [40, 200]  # none while 1st and 2nd pages were empty.
+
+
+def test_download_ranges():
+    assert web.download_ranges([], [(2458000.0, 2458010.0)]) == []
+    assert web.download_ranges([(2458000.0, 2458010.0)], []) == [(2458000.0, 2458010.0)]
+    # Validated ranges overlapping what is missing are downloaded exactly as before, the rest in pages:
+    validated_ranges = [(2457980.0, 2457995.0), (2458000.0, 2458010.0)]
+    assert web.download_ranges([(2457990.0, 2458017.0)], validated_ranges) == \
+        [(2458010.0, 2458017.0), (2458000.0, 2458010.0), (2457995.0, 2458000.0), (2457980.0, 2457995.0)]
+    assert web.download_ranges([(2458012.0, 2458017.0)], [(2458000.0, 2458010.0)]) == \
+        [(2458012.0, 2458017.0)]  # no overlap, so fresh: not re-validated.
+    # Unpaged (no caller wants the newest first): one request per range, unless very long:
+    assert web.download_ranges([(2458000.0, 2458500.0)], [], is_paged=False) == [(2458000.0, 2458500.0)]
+    assert len(web.download_ranges([(2450000.0, 2457305.0)], [], is_paged=False)) == 5  # 20 years.
+
+
+def test_get_vsx_obs_revalidates_after_end_jd_moves(tmp_path, monkeypatch, obs_mdf):
+    # Stale pages are re-validated as first downloaded, though end JD (e.g., now) has since moved on:
+    monkeypatch.setattr(web, '_obs_cache', cache.ObsCache(str(tmp_path)))
+    jd_now = 2457000.0
+    monkeypatch.setattr(util, 'jd_now', lambda: jd_now)
+    all_jds = [2456500.0 + 5 * i for i in range(110)]  # to 2457045.
+    requests = []
+
+    def download_vsx_obs(star_id, jd_start, jd_end, validators=None):
+        requests.append((jd_start, jd_end, None if validators is None else dict(validators)))
+        if validators:
+            return None  # unchanged since validators' download (as HTTP 304).
+        if validators is not None:
+            validators.update(etag='"' + str(jd_start) + '"')
+        return obs_mdf([jd for jd in all_jds if jd_start <= jd <= jd_end], mags=12.0, vsx_columns=True)
+    monkeypatch.setattr(web, 'download_vsx_obs', download_vsx_obs)
+    mdf = web.get_vsx_obs('SS Cyg', jd_start=2456500.0, jd_end=jd_now, on_page=lambda mdf: True)  # paged.
+    assert mdf.len() == 101
+    assert [request[:2] for request in requests] == [(2456900.0, 2457000.0), (2456700.0, 2456900.0),
+                                                     (2456500.0, 2456700.0)]
+
+    jd_now += cache.OBS_CACHE_TTL_DAYS + 1.0  # all 3 pages stale, and end JD has moved.
+    requests.clear()
+    mdf = web.get_vsx_obs('SS Cyg', jd_start=jd_now - 500.0, jd_end=jd_now)
+    assert mdf.column('JD') == [jd for jd in all_jds if jd_now - 500.0 <= jd <= jd_now]
+    assert requests == [(2457000.0, jd_now, {}),  # new JDs.
+                        (2456900.0, 2457000.0, {'etag': '"2456900.0"'}),  # 3 re-validations (304).
+                        (2456700.0, 2456900.0, {'etag': '"2456700.0"'}),
+                        (2456500.0, 2456700.0, {'etag': '"2456500.0"'})]
+    assert web.get_obs_cache().missing_ranges('SS Cyg', 2456500.0, jd_now) == []  # all fresh again.
+
+
+def test_get_vsx_obs_unknown_star(tmp_path, monkeypatch):
+    monkeypatch.setattr(web, '_obs_cache', cache.ObsCache(str(tmp_path)))
+    monkeypatch.setattr(web, 'download_vsx_obs',
+                        lambda star_id, jd_start, jd_end, validators=None: util.MiniDataFrame())
+    mdf = web.get_vsx_obs('No Such Star', jd_start=2458000.0, jd_end=2458010.0)
+    assert mdf.dict is None
+    assert web.get_obs_cache().total_bytes() == 0  # nothing cached.
+
+
+def test_class_prefetcher(tmp_path, monkeypatch, obs_mdf):
+    monkeypatch.setattr(web, '_obs_cache', cache.ObsCache(str(tmp_path)))
+    downloader = FakeDownloader([2458001.0, 2458005.0], obs_mdf)
+    monkeypatch.setattr(web, 'download_vsx_obs', downloader)
+    prefetcher = web.Prefetcher(max_workers=2)
+    prefetcher.prefetch(['AA Aur', 'BB Aur', 'CC Aur'], 2458000.0, 2458010.0)
+    prefetcher.wait(timeout=10)
+    assert len(downloader.requests) == 3
+    # Prefetched stars are then served from cache, with no further download:
+    for star_id in ['AA Aur', 'BB Aur', 'CC Aur']:
+        assert web.get_vsx_obs(star_id, jd_start=2458000.0, jd_end=2458010.0).len() == 2
+    assert len(downloader.requests) == 3
+    prefetcher.shutdown()
+
+
+def test_get_vsx_obs_many(tmp_path, monkeypatch, obs_mdf):
+    monkeypatch.setattr(web, '_obs_cache', cache.ObsCache(str(tmp_path)))
+    downloader = FakeDownloader([2458001.0, 2458005.0], obs_mdf)
+
+    def download_vsx_obs(star_id, jd_start, jd_end, validators=None):
+        if star_id == 'Bad':
+            raise OSError('connection refused')
+        return downloader(star_id, jd_start, jd_end)
+    monkeypatch.setattr(web, 'download_vsx_obs', download_vsx_obs)
+    results = list(web.get_vsx_obs_many(['AA Aur', 'Bad', 'CC Aur'], 2458000.0, 2458010.0, max_workers=2))
+    assert sorted(star_id for (star_id, _, _) in results) == ['AA Aur', 'Bad', 'CC Aur']
+    for star_id, mdf, error in results:
+        if star_id == 'Bad':
+            assert mdf is None and isinstance(error, OSError)
+        else:
+            assert error is None and mdf.column('JD') == [2458001.0, 2458005.0]
+            assert web.get_cached_vsx_obs(star_id, 2458000.0, 2458010.0).len() == 2  # now in cache.
+
+    # Cold cache, default 500 days: one request per star (no pages, as no caller plots them as they come).
+    downloader.requests.clear()
+    star_ids = ['Star ' + str(i) for i in range(5)]
+    results = list(web.get_vsx_obs_many(star_ids, jd_end=2458010.0, max_workers=2))
+    assert all(error is None for (_, _, error) in results)
+    assert downloader.requests == [(2457510.0, 2458010.0)] * len(star_ids)
+
+
+def test_aget_vsx_obs(tmp_path, monkeypatch, obs_mdf):
+    monkeypatch.setattr(web, '_obs_cache', cache.ObsCache(str(tmp_path)))
+    downloader = FakeDownloader([2458001.0, 2458005.0, 2458012.0], obs_mdf)
+
+    async def adownload_vsx_obs(star_id, jd_start, jd_end, validators=None):
+        await asyncio.sleep(0.01 if star_id != 'Slow' else 10.0)
+        return downloader(star_id, jd_start, jd_end)
+    monkeypatch.setattr(web, 'adownload_vsx_obs', adownload_vsx_obs)
+
+    mdf = asyncio.run(web.aget_vsx_obs('ST Tri', jd_start=2458000.0, jd_end=2458010.0))
+    assert mdf.column('JD') == [2458001.0, 2458005.0]
+    assert web.get_cached_vsx_obs('ST Tri', 2458000.0, 2458010.0).len() == 2  # shares the cache.
+    mdf = asyncio.run(web.aget_vsx_obs('ST Tri', jd_start=2458004.0, jd_end=2458013.0))
+    assert mdf.column('JD') == [2458005.0, 2458012.0]
+    assert downloader.requests == [(2458000.0, 2458010.0), (2458010.0, 2458013.0)]  # only what's missing.
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(web.aget_vsx_obs('Slow', jd_start=2458000.0, jd_end=2458010.0, timeout=0.05))
+    assert web.get_cached_vsx_obs('Slow', 2458000.0, 2458010.0) is None
+
+    async def cancel_soon():
+        task = asyncio.create_task(web.aget_vsx_obs('Slow', jd_start=2458000.0, jd_end=2458010.0))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+    asyncio.run(cancel_soon())
+
+
+def test_agather_vsx_obs(tmp_path, monkeypatch, obs_mdf):
+    monkeypatch.setattr(web, '_obs_cache', cache.ObsCache(str(tmp_path)))
+    downloader = FakeDownloader([2458001.0, 2458005.0], obs_mdf)
+    n_active, max_active = [0], [0]
+
+    async def adownload_vsx_obs(star_id, jd_start, jd_end, validators=None):
+        n_active[0] += 1
+        max_active[0] = max(max_active[0], n_active[0])
+        try:
+            await asyncio.sleep(10.0 if star_id == 'Slow' else 0.02)
+            if star_id == 'Bad':
+                raise OSError('connection refused')
+            return downloader(star_id, jd_start, jd_end)
+        finally:
+            n_active[0] -= 1
+    monkeypatch.setattr(web, 'adownload_vsx_obs', adownload_vsx_obs)
+
+    star_ids = ['Star ' + str(i) for i in range(8)] + ['Bad', 'Slow']
+    results = asyncio.run(web.agather_vsx_obs(star_ids, 2458000.0, 2458010.0, max_concurrent=3, timeout=0.5))
+    assert [result.column('JD') for result in results[:8]] == [[2458001.0, 2458005.0]] * 8  # in order.
+    assert isinstance(results[8], OSError)
+    assert isinstance(results[9], asyncio.TimeoutError)
+    assert max_active[0] == 3
+
+
+def test_get_vsx_obs_revalidates(tmp_path, monkeypatch, fake_server, obs_mdf):
+    # Real downloads, from a local server sending gzip-compressed text and an ETag:
+    body = vsx_text(obs_mdf([2458001.5, 2458002.5, 2458003.5], mags=12.5, vsx_columns=True))
+    server = fake_server(body=body, use_gzip=True, etag='"v1"')
+    monkeypatch.setattr(web, 'VSX_OBSERVATIONS_HEADER', server.url + '/vsx/index.php?view=api.delim')
+    monkeypatch.setattr(web, '_connection_pool', fetch.ConnectionPool(rate_limiter=None))
+    monkeypatch.setattr(web, '_obs_cache', cache.ObsCache(str(tmp_path)))
+    jd_now = 2458010.0
+    monkeypatch.setattr(util, 'jd_now', lambda: jd_now)
+
+    mdf = web.get_vsx_obs('ST Tri', jd_start=2458000.0, jd_end=2458010.0)
+    assert mdf.column('JD') == [2458001.5, 2458002.5, 2458003.5]
+    assert web.get_obs_cache().validators('ST Tri', 2458000.0, 2458010.0)['etag'] == '"v1"'
+
+    # Once stale, the range is re-validated: server answers 304, cached rows are served again.
+    jd_now = 2458010.0 + cache.OBS_CACHE_TTL_DAYS + 1.0
+    mdf = web.get_vsx_obs('ST Tri', jd_start=2458000.0, jd_end=2458010.0)
+    assert mdf.len() == 3
+    assert server.request_headers[-1]['If-None-Match'] == '"v1"'
+    assert web.get_obs_cache().missing_ranges('ST Tri', 2458000.0, 2458010.0) == []  # fresh again.
+
+    # Server without ETag: unchanged content (same hash) also just refreshes the cached rows.
+    server.etag = None
+    jd_now += cache.OBS_CACHE_TTL_DAYS + 1.0
+    mdf = asyncio.run(web.aget_vsx_obs('ST Tri', jd_start=2458000.0, jd_end=2458010.0))
+    assert mdf.len() == 3
+    assert len(server.paths) == 3
+    assert web.get_obs_cache().missing_ranges('ST Tri', 2458000.0, 2458010.0) == []
+
+
+def test_get_vsx_obs_falls_back_to_cache(tmp_path, monkeypatch, fake_server, obs_mdf):
+    server = fake_server(body=vsx_text(obs_mdf([2458001.5, 2458002.5], mags=12.5, vsx_columns=True)))
+    monkeypatch.setattr(web, 'VSX_OBSERVATIONS_HEADER', server.url + '/vsx/index.php?view=api.delim')
+    monkeypatch.setattr(web, '_circuit_breaker', fetch.CircuitBreaker(failure_threshold=2, reset_seconds=60))
+    monkeypatch.setattr(web, '_connection_pool', fetch.ConnectionPool(metrics=web._fetch_metrics))
+    monkeypatch.setattr(web, '_obs_cache', cache.ObsCache(str(tmp_path)))
+    jd_now = 2458010.0
+    monkeypatch.setattr(util, 'jd_now', lambda: jd_now)
+    assert web.get_vsx_obs('ST Tri', jd_start=2458000.0, jd_end=2458010.0).len() == 2
+
+    # Server failing: retried, then stale cached rows are served rather than an error.
+    server.fail_statuses = [503] * 10
+    jd_now = 2458010.0 + cache.OBS_CACHE_TTL_DAYS + 1.0
+    fallback_errors = []
+    mdf = web.get_vsx_obs('ST Tri', jd_start=2458000.0, jd_end=2458012.0, on_fallback=fallback_errors.append)
+    assert mdf.column('JD') == [2458001.5, 2458002.5]
+    assert len(server.paths) == 3  # first download, then 2 failures opened the circuit.
+    assert [error.status for error in fallback_errors] == [503]  # reported to caller, not printed.
+    assert web.get_obs_cache().missing_ranges('ST Tri', 2458000.0, 2458012.0) != []  # still stale.
+
+    # Circuit open: cached rows served at once, without a request.
+    mdf = asyncio.run(web.aget_vsx_obs('ST Tri', jd_start=2458000.0, jd_end=2458012.0,
+                                       on_fallback=fallback_errors.append))
+    assert mdf.len() == 2
+    assert len(server.paths) == 3
+    assert isinstance(fallback_errors[-1], fetch.CircuitOpenError)
+    with pytest.warns(RuntimeWarning, match='using cached observations for ST Tri'):  # no callback given.
+        assert web.get_vsx_obs('ST Tri', jd_start=2458000.0, jd_end=2458012.0).len() == 2
+    with pytest.raises(fetch.CircuitOpenError):  # nothing cached to fall back on.
+        web.get_vsx_obs('RR Lyr', jd_start=2458000.0, jd_end=2458012.0)
+    metrics = web.get_fetch_metrics()
+    assert metrics['events'] == {'retries': 1, 'circuit_rejections': 3, 'cache_fallbacks': 3}
+    assert metrics['hosts']['127.0.0.1']['failures'] == 2
+
+    # Cache failing too: download's error is raised, not the cache's.
+    def failing_get(*args, **kwargs):
+        raise RuntimeError('database is locked')
+    monkeypatch.setattr(web.get_obs_cache(), 'get', failing_get)
+    with pytest.raises(fetch.CircuitOpenError):
+        web.get_vsx_obs('ST Tri', jd_start=2458000.0, jd_end=2458012.0)
+    with pytest.raises(fetch.CircuitOpenError):
+        asyncio.run(web.aget_vsx_obs('ST Tri', jd_start=2458000.0, jd_end=2458012.0))